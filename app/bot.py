@@ -1,95 +1,687 @@
 import asyncio
 import logging
-from logging.handlers import RotatingFileHandler
+import signal
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import aiohttp
 
-import yaml
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties # <-- IMPORT THIS
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Update
 from dotenv import load_dotenv
 import os
 
 from app.handlers import admin, user, callback
+from app.keyboards.inline import get_approval_keyboard
 from app.middlewares.acl import ACLMiddleware
+from app.middlewares.config import ConfigMiddleware
+from app.middlewares.log_context import LogContextMiddleware
+from app.middlewares.tenant import TenantMiddleware
+from app.middlewares.metrics import HandlerMetricsMiddleware, TimedMiddleware, UpdateMetricsMiddleware
+from app.middlewares.scheduler import SchedulerMiddleware
 from app.middlewares.throttling import ThrottlingMiddleware
+from app.services.dedup import DedupIndex
+from app.services.fsm_storage import SharedStateStorage, SQLiteStorage
+from app.services.localization import Localization
+from app.services.log_pipeline import create_file_handler, create_formatter, start_queue_logging
+from app.services.media_groups import MediaGroupAggregator, SharedMediaGroups
+from app.services.broadcaster import PUBLISH, REPORT, Broadcaster, publish_payload
+from app.services.config import Config, ConfigError, ConfigManager, tenant_config
+from app.services.membership import MembershipCache
+from app.services.metrics import ApiMetricsMiddleware, Metrics, start_metrics_server
+from app.services.moderation import ModerationService
+from app.services.outbox import STATUS_FAILED as DELIVERY_FAILED, Delivery, Outbox, OwnerAlerts
+from app.services.publish_queue import PublishQueue, QueuedPost, parse_quiet_hours
+from app.services.rate_limiter import SharedRateLimiter, create_rate_limiter
+from app.services.send_scheduler import SendScheduler
+from app.services.shared_state import SharedState, create_shared_state
 from app.services.storage import StorageService
+from app.services.submission_store import STATUS_FAILED, BaseSubmissionStore, SharedSubmissionStore, SubmissionStore
+from app.services.tenants import TenantRegistry
+from app.services.update_scheduler import UpdateScheduler
+from app.services.webhook import create_ingest_app, run_webhook, serve_webhook
+from app.services.worker_pool import UpdateRouter, WorkerPool, consume_updates, poll_raw_updates
+from app.utils.submission import Submission
 
-def setup_logging(config):
-    """Sets up logging configuration."""
-    log_level = config.get("logging", {}).get("level", "INFO")
-    log_file = config.get("logging", {}).get("file", "bot.log")
-    rotation = config.get("logging", {}).get("rotation", "10 MB")
+BASE_DIR = Path(__file__).parent.parent
 
-    # Convert rotation string to bytes
-    size_in_bytes = 10 * 1024 * 1024 # default 10 MB
-    if "MB" in rotation.upper():
-        size_in_bytes = int(rotation.upper().replace("MB", "").strip()) * 1024 * 1024
-    elif "KB" in rotation.upper():
-        size_in_bytes = int(rotation.upper().replace("KB", "").strip()) * 1024
+def setup_logging(config, worker: Optional[int] = None):
+    """
+    Sets up logging configuration. Records go through a bounded queue to a background thread,
+    so file writes and rotation never run on the event loop. Returns the listener to stop on shutdown.
+    Each worker process writes its own file, e.g. bot.worker1.log, since rotation isn't multi-process safe.
+    """
+    log_config = config.get("logging", {})
+    log_level = log_config.get("level", "INFO")
+    formatter = create_formatter(log_config.get("format", "text"))
+    log_file = Path(log_config.get("file", "bot.log"))
+    if worker is not None:
+        log_file = log_file.with_name(f"{log_file.stem}.worker{worker}{log_file.suffix}")
+    handlers = [
+        create_file_handler(
+            str(log_file), log_config.get("rotation", "10 MB"), log_config.get("backup_count", 5)
+        ),
+        logging.StreamHandler(),
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    queue_handler, listener = start_queue_logging(handlers, log_config.get("queue_size", 10000))
 
     logging.basicConfig(
         level=getattr(logging, log_level.upper(), logging.INFO),
-        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
-        handlers=[
-            RotatingFileHandler(log_file, maxBytes=size_in_bytes, backupCount=5),
-            logging.StreamHandler(),
-        ],
+        handlers=[queue_handler],
     )
     logging.info("Logging configured.")
+    return listener
 
-async def main():
-    """Main function to start the bot."""
-    # Load environment variables
-    load_dotenv()
-    bot_token = os.getenv("BOT_TOKEN")
-    if not bot_token:
-        raise ValueError("BOT_TOKEN environment variable not set!")
+def create_storage(config, shared_state: Optional[SharedState] = None):
+    """Creates the FSM storage selected in config.yaml; shared by all replicas when there is shared state."""
+    fsm_config = config.get("fsm", {})
+    if shared_state is not None:
+        return SharedStateStorage(shared_state, ttl=fsm_config.get("ttl", 86400))
+    # SQLite keeps half-finished submissions across restarts
+    if fsm_config.get("backend", "memory") == "sqlite":
+        return SQLiteStorage(
+            config.get("database", {}).get("path", "data/bot.db"),
+            ttl=fsm_config.get("ttl", 86400),
+            flush_interval=fsm_config.get("flush_interval", 1.0),
+            cache_size=fsm_config.get("cache_size", 10000),
+        )
+    return MemoryStorage()
 
-    # Load configuration
-    config_path = Path(__file__).parent.parent / "config.yaml"
-    with open(config_path, "r") as f:
-        config = yaml.safe_load(f)
+def create_send_scheduler(config, workers: int = 1) -> SendScheduler:
+    """
+    Creates the outgoing-message scheduler with the limits from config.yaml. The limits are the bot's,
+    so each of `workers` processes sending at once gets an equal share of the global and group budgets.
+    Private chats keep their full rate: each is served by one worker.
+    """
+    send_config = config.get("send_limits", {})
+    return SendScheduler(
+        global_rate=send_config.get("global_per_second", 30) / workers,
+        private_rate=send_config.get("private_per_second", 1),
+        group_rate=send_config.get("group_per_minute", 20) / 60 / workers,
+        chat_burst=max(1, send_config.get("chat_burst", 3) / workers),
+        max_retries=send_config.get("max_retries", 5),
+        high_priority_chats=(
+            config["output_channel_id"], *(tenant["output_channel_id"] for tenant in config.get("tenants") or [])
+        ),
+    )
+
+def create_update_scheduler(config, metrics: Optional[Metrics] = None) -> UpdateScheduler:
+    """Creates the scheduler that bounds how many updates are handled and queued at once."""
+    scheduler_config = config.get("scheduler", {})
+    return UpdateScheduler(
+        max_concurrent=scheduler_config.get("max_concurrent_updates", 100),
+        max_pending=scheduler_config.get("max_pending", 10000),
+        max_pending_per_key=scheduler_config.get("max_pending_per_user", 20),
+        metrics=metrics,
+    )
+
+def create_dedup_index(config):
+    """Creates the duplicate-submission index if config.yaml enables it."""
+    dedup_config = config.get("dedup", {})
+    if not dedup_config.get("enabled"):
+        return None
+    return DedupIndex(
+        config.get("database", {}).get("path", "data/bot.db"),
+        retention=dedup_config.get("retention_days", 30) * 86400,
+        max_entries=dedup_config.get("max_entries", 500000),
+        max_distance=dedup_config.get("max_distance", 3),
+        min_words=dedup_config.get("min_words", 8),
+    )
+
+def create_outbox(dp: Dispatcher, config, bot: Bot, loc: Localization, worker: Optional[int] = None) -> Outbox:
+    """
+    Creates the outbox every channel post and report-group forward goes through, with its senders.
+    Posts use the config current when they are sent, so a reload applies to retries too.
+    """
+    outbox_config = config.get("outbox", {})
+    alerts = OwnerAlerts(
+        lambda text: bot.send_message(dp["config"]["owner_id"], text, parse_mode=None),
+        interval=outbox_config.get("alert_interval", 300),
+    )
+    outbox = Outbox(
+        config.get("database", {}).get("path", "data/bot.db"),
+        alerts=alerts,
+        max_attempts=outbox_config.get("max_attempts", 10),
+        base_delay=outbox_config.get("base_delay", 2),
+        max_delay=outbox_config.get("max_delay", 600),
+        breaker_threshold=outbox_config.get("breaker_threshold", 5),
+        breaker_cooldown=outbox_config.get("breaker_cooldown", 60),
+        worker=worker or 0,
+    )
+
+    async def publish(payload: Dict) -> List[int]:
+        current = tenant_config(dp["config"], payload["channel_id"])
+        return await Broadcaster.send_to_output_channel(
+            bot, Submission.from_dict(payload["submission"]), payload["subject"], current, loc,
+            is_regular_user_post=payload["is_regular_user_post"],
+        )
+
+    async def report(payload: Dict) -> List[int]:
+        return await Broadcaster.send_to_report_group(
+            bot, Submission.from_dict(payload["submission"]), payload["header"],
+            get_approval_keyboard(payload["submission_id"]), payload["report_group_id"],
+        )
+
+    async def reported(delivery: Delivery):
+        await dp["submission_store"].set_report_messages(delivery.payload["submission_id"], delivery.result)
+
+    async def report_failed(delivery: Delivery):
+        store: BaseSubmissionStore = dp["submission_store"]
+        pending = await store.fetch(delivery.payload["submission_id"])
+        if pending is not None:
+            await store.resolve(pending, STATUS_FAILED)
+        await bot.send_message(delivery.payload["submission"]["chat_id"], loc["submission_failed"])
+
+    outbox.register(PUBLISH, publish)
+    # A report sent twice only shows twice; its buttons still act on one submission
+    outbox.register(REPORT, report, on_sent=reported, on_failed=report_failed, resend_interrupted=True)
+    return outbox
+
+def create_publish_queue(config, outbox: Outbox, get_config: Optional[Callable[[], Config]] = None):
+    """
+    Creates the publish queue if config.yaml enables it; otherwise approved posts go out right away.
+    Posts are published with the config returned by `get_config` at the time, so a reload applies to them.
+    They are handed to the outbox, which retries them until they go out.
+    """
+    queue_config = config.get("publish_queue", {})
+    if not queue_config.get("enabled"):
+        return None
+
+    async def publish(post: QueuedPost) -> bool:
+        current = get_config() if get_config is not None else config
+        channel_id = post.channel_id if post.channel_id is not None else current["output_channel_id"]
+        delivery = await outbox.submit(
+            PUBLISH, f"queue:{post.id}", channel_id,
+            publish_payload(post.submission, post.subject, channel_id, post.is_regular_user_post),
+        )
+        return delivery.status != DELIVERY_FAILED
+
+    return PublishQueue(
+        config.get("database", {}).get("path", "data/bot.db"),
+        publish,
+        slot_spacing=queue_config.get("slot_spacing", 300),
+        per_hour=queue_config.get("per_hour", 0),
+        quiet_hours=parse_quiet_hours(queue_config.get("quiet_hours")),
+        utc_offset=queue_config.get("utc_offset", 0),
+    )
+
+def create_dispatcher(
+    config, storage_service: StorageService, loc: Localization, storage, metrics: Optional[Metrics] = None,
+    shared_state: Optional[SharedState] = None,
+) -> Dispatcher:
+    """
+    Builds the Dispatcher with its middlewares, routers and shared services. With `shared_state`,
+    rate limits and albums are shared with the other replicas.
+    """
+    dp = Dispatcher(storage=storage)
+
+    def timed(middleware, name: str):
+        # Records the middleware's own time when metrics are enabled
+        return TimedMiddleware(middleware, name, metrics) if metrics is not None else middleware
+
+    def is_staff(user_id: int) -> bool:
+        tenants = dp.get("tenants")
+        if user_id == dp["config"]["owner_id"]:
+            return True
+        return tenants.is_admin(user_id) if tenants is not None else storage_service.get_admin(user_id) is not None
+
+    # First, so everything else runs in the update's turn
+    update_scheduler = create_update_scheduler(config, metrics)
+    dp.update.outer_middleware(SchedulerMiddleware(update_scheduler, is_staff))
+    if metrics is not None:
+        dp.update.outer_middleware(UpdateMetricsMiddleware(metrics))
+    # Tags log records with the update, user, role and handler
+    log_context = LogContextMiddleware()
+    dp.update.outer_middleware(log_context)
+
+    # Cache required-channel membership checks
+    membership_config = config.get("membership_cache", {})
+    membership_cache = MembershipCache(
+        ttl=membership_config.get("ttl", 300),
+        max_size=membership_config.get("max_size", 10000),
+    )
+
+    # Register global middlewares (like ACL)
+    dp.update.middleware(timed(ACLMiddleware(storage_service, config, membership_cache), "acl"))
+    
+    # Register router-level middlewares (like Throttling)
+    rate_limit_config = config.get("rate_limit", {"limit": 5, "period": 3600})
+    if shared_state is not None:
+        limiter = SharedRateLimiter(shared_state)
+    else:
+        limiter = create_rate_limiter(
+            rate_limit_config.get("algorithm", "gcra"),
+            max_keys=rate_limit_config.get("max_tracked_users", 100_000),
+        )
+    role_limits = {
+        role: (limits.get("limit", rate_limit_config["limit"]), limits.get("period", rate_limit_config["period"]))
+        for role, limits in (rate_limit_config.get("roles") or {}).items()
+    }
+    throttling = ThrottlingMiddleware(
+        limiter=limiter,
+        limit=rate_limit_config["limit"],
+        period=rate_limit_config["period"],
+        loc=loc,
+        role_limits=role_limits,
+    )
+    user.router.message.middleware(timed(throttling, "throttling"))
+
+    # Register routers
+    dp.include_router(admin.router)
+    dp.include_router(user.router)
+    dp.include_router(callback.router)
+
+    handler_metrics = HandlerMetricsMiddleware(metrics) if metrics is not None else None
+    for router in dp.chain_tail:
+        for name, observer in router.observers.items():
+            if name not in ("update", "error"):
+                observer.middleware(log_context)
+                if handler_metrics is not None:
+                    observer.middleware(handler_metrics)
+
+    # Services available to every handler, in polling and webhook mode alike
+    dp["config"] = config
+    dp["storage_service"] = storage_service
+    dp["loc"] = loc
+    dp["membership_cache"] = membership_cache
+    dp["throttling"] = throttling
+    dp["update_scheduler"] = update_scheduler
+
+    media_group_config = config.get("media_groups", {})
+    media_groups = MediaGroupAggregator(
+        min_gap=media_group_config.get("min_gap", 0.3),
+        max_gap=media_group_config.get("max_gap", 1.5),
+        max_age=media_group_config.get("max_age", 10),
+        max_albums=media_group_config.get("max_albums", 1000),
+        max_items=media_group_config.get("max_items", 5000),
+        max_albums_per_user=media_group_config.get("max_albums_per_user", 2),
+    )
+    if shared_state is not None:
+        # An album's items may reach different replicas
+        media_groups = SharedMediaGroups(
+            media_groups, shared_state, settle=config.get("shared_state", {}).get("album_settle", 1.5)
+        )
+    dp["media_groups"] = media_groups
+    return dp
+
+def setup_workflow(
+    dp: Dispatcher, config, bot: Bot, loc: Localization, worker: Optional[int] = None,
+    shared_state: Optional[SharedState] = None,
+):
+    """
+    Adds the moderation services (pending submissions, outbox, publish queue, duplicate index) to the dispatcher.
+    In worker mode only worker 0 moderates and publishes; the others just record and report submissions.
+    With `shared_state`, pending submissions and their claims live there, so any replica can moderate them.
+    """
+    # Submissions waiting in the report group survive restarts
+    if shared_state is not None:
+        submission_store = SharedSubmissionStore(shared_state, index=not worker)
+    else:
+        submission_store = SubmissionStore(
+            config.get("database", {}).get("path", "data/bot.db"), shared=worker is not None, index=not worker,
+            retention=config.get("moderation", {}).get("retention_days", 30) * 86400,
+        )
+    dp["submission_store"] = submission_store
+    outbox = create_outbox(dp, config, bot, loc, worker)
+    dp["outbox"] = outbox
+    publish_queue = create_publish_queue(config, outbox, get_config=lambda: dp["config"]) if not worker else None
+    dp["publish_queue"] = publish_queue
+    dp["dedup_index"] = create_dedup_index(config)
+    dp["moderation"] = ModerationService(
+        submission_store, config, loc,
+        bulk_concurrency=config.get("moderation", {}).get("bulk_concurrency", 4),
+        publish_queue=publish_queue,
+        outbox=outbox,
+    )
+    outbox.start()
+    if publish_queue is not None:
+        publish_queue.start()
+
+def setup_config_reload(dp: Dispatcher, config_manager: ConfigManager):
+    """
+    Lets the owner reload config.yaml (/reload_config or SIGHUP) without a restart. Each update
+    gets the config current when it arrived; the long-lived services are updated in place.
+    """
+    dp.update.outer_middleware(ConfigMiddleware(config_manager))
+    dp["config_manager"] = config_manager
+
+    def apply(config: Config):
+        dp["config"] = config
+        rate_limit = config.rate_limit
+        dp["throttling"].update_limits(rate_limit.limit, rate_limit.period, rate_limit.roles)
+        if dp.get("moderation") is not None:
+            dp["moderation"].config = config
+        if dp.get("send_scheduler") is not None:
+            dp["send_scheduler"].high_priority_chats = {
+                tenant.output_channel_id for tenant in (config, *config.tenants.values())
+            }
+        if dp.get("tenants") is not None:
+            dp["tenants"].open(config)
+
+    config_manager.subscribe(apply)
+
+def setup_tenants(dp: Dispatcher, tenants: TenantRegistry):
+    """
+    Serves every tenant in config.yaml from this process. Call after setup_config_reload():
+    TenantMiddleware narrows the config snapshot that ConfigMiddleware puts on each update.
+    """
+    dp.update.outer_middleware(TenantMiddleware(tenants))
+    dp["tenants"] = tenants
+
+def reload_config(config_manager: ConfigManager):
+    """SIGHUP handler: reloads config.yaml, keeping the running config if the new one is invalid."""
+    try:
+        config_manager.reload()
+    except (ConfigError, OSError) as e:
+        logging.error(f"Config reload failed, keeping the current config: {e}")
+
+async def close_workflow(dp: Dispatcher):
+    # Let the updates already queued finish while the services are still open
+    if dp.get("update_scheduler") is not None:
+        await dp["update_scheduler"].close()
+    if dp["publish_queue"] is not None:
+        await dp["publish_queue"].close()
+    await dp["outbox"].close()
+    await dp["submission_store"].close()
+    if dp["dedup_index"] is not None:
+        await dp["dedup_index"].close()
+
+def register_service_metrics(metrics: Metrics, dp: Dispatcher):
+    """Exposes the counters the services already keep; they are read at scrape time."""
+    membership_cache: MembershipCache = dp["membership_cache"]
+    metrics.gauge_callback("membership_cache_hits_total", "Membership checks answered from the cache.",
+                           lambda: membership_cache.hits, kind="counter")
+    metrics.gauge_callback("membership_cache_misses_total", "Membership checks sent to Telegram.",
+                           lambda: membership_cache.misses, kind="counter")
+    metrics.gauge_callback("membership_cache_hit_ratio", "Share of membership checks answered from the cache.",
+                           lambda: membership_cache.stats()["hit_ratio"])
+    metrics.gauge_callback("membership_cache_size", "Cached membership entries.", lambda: membership_cache.stats()["size"])
+
+    send_scheduler: SendScheduler = dp["send_scheduler"]
+    metrics.gauge_callback("send_queue_depth", "Outgoing messages waiting for a send slot.",
+                           lambda: send_scheduler.stats()["queue_depth"])
+    metrics.gauge_callback("send_queue_wait_seconds_max", "Longest wait for a send slot so far.",
+                           lambda: send_scheduler.max_wait)
+    metrics.gauge_callback("send_queue_wait_seconds_total", "Total time messages waited for a send slot.",
+                           lambda: send_scheduler.total_wait, kind="counter")
+    metrics.gauge_callback("send_queue_sent_total", "Messages that got a send slot.",
+                           lambda: send_scheduler.sent, kind="counter")
+
+    media_groups: MediaGroupAggregator = dp["media_groups"]
+    metrics.gauge_callback("media_group_albums_pending", "Albums still being collected.", lambda: len(media_groups))
+    metrics.gauge_callback("media_group_albums_total", "Albums collected and processed.",
+                           lambda: media_groups.completed, kind="counter")
+    metrics.gauge_callback("media_group_rejected_total", "Albums rejected because the aggregator was full.",
+                           lambda: media_groups.rejected, kind="counter")
+    metrics.gauge_callback("media_group_late_total", "Album items dropped because their album was already processed.",
+                           lambda: media_groups.late, kind="counter")
+    metrics.gauge_callback("media_group_wait_seconds_total", "Time albums were held before processing.",
+                           lambda: media_groups.wait_total, kind="counter")
+
+    update_scheduler: UpdateScheduler = dp["update_scheduler"]
+    metrics.gauge_callback("update_scheduler_running", "Updates being handled.", lambda: update_scheduler.running)
+    metrics.gauge_callback("update_scheduler_pending", "Updates waiting for their turn.",
+                           lambda: update_scheduler.pending)
+    metrics.gauge_callback("update_scheduler_shed_total", "Updates of regular users dropped because the queue was full.",
+                           lambda: update_scheduler.shed, kind="counter")
+
+    metrics.gauge_callback("submissions_pending", "Submissions waiting for a moderator.",
+                           lambda: len(dp["submission_store"]))
+    outbox: Outbox = dp["outbox"]
+    metrics.gauge_callback("outbox_pending", "Channel posts and report forwards waiting for a retry.",
+                           lambda: len(outbox))
+    metrics.gauge_callback("outbox_sent_total", "Channel posts and report forwards sent.",
+                           lambda: outbox.sent, kind="counter")
+    metrics.gauge_callback("outbox_retries_total", "Failed sends scheduled for a retry.",
+                           lambda: outbox.retries, kind="counter")
+    metrics.gauge_callback("outbox_failed_total", "Sends given up on.", lambda: outbox.failed, kind="counter")
+    metrics.gauge_callback("outbox_open_circuits", "Chats whose sends are paused after repeated failures.",
+                           outbox.open_circuits)
+    if dp["publish_queue"] is not None:
+        metrics.gauge_callback("publish_queue_length", "Approved posts waiting for a publishing slot.",
+                               lambda: len(dp["publish_queue"]))
+    if dp["dedup_index"] is not None:
+        metrics.gauge_callback("dedup_index_entries", "Submissions remembered for duplicate detection.",
+                               lambda: len(dp["dedup_index"]))
+
+@asynccontextmanager
+async def running_bot(config_manager: ConfigManager, bot_token: str, worker: Optional[int] = None):
+    """
+    Sets up the bot, its services and the Dispatcher, and shuts them down on exit.
+    Yields (bot, dp). `worker` is the index of this process in worker mode, None otherwise.
+    """
+    config = config_manager.current
 
     # Setup logging
-    setup_logging(config)
+    log_listener = setup_logging(config, worker)
     
     # Initialize storage service
-    admins_file_path = Path(__file__).parent.parent / "admins.json"
-    storage_service = StorageService(admins_file_path)
+    admins_file_path = BASE_DIR / "admins.json"
+    # State every replica must agree on; None when this is the only replica
+    shared_state = create_shared_state(config)
+    storage_service = StorageService(admins_file_path, shared=shared_state)
+    storage = create_storage(config, shared_state)
+    # Admins of the other tenants, each in its own file next to admins.json; users' choices live with their FSM data
+    tenants = TenantRegistry(admins_file_path.parent, storage_service, shared=shared_state, selections=storage)
+    tenants.open(config)
     
-    # Initialize localization
-    loc_path = Path(__file__).parent.parent / "fa.json"
+    # Initialize localization (fails fast on missing keys or bad placeholders)
+    loc = Localization(BASE_DIR / "fa.json")
     
     # Initialize Bot and Dispatcher
     # --- THIS LINE IS CORRECTED ---
     bot = Bot(token=bot_token, default=DefaultBotProperties(parse_mode="HTML"))
     # ------------------------------
-    
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
 
-    # Register global middlewares (like ACL)
-    dp.update.middleware(ACLMiddleware(storage_service, config))
+    # Queue outgoing messages behind Telegram's flood limits; channel posts go first
+    # In worker mode every worker sends, to the report groups and channels alike
+    workers = max(1, config.get("workers", {}).get("count", 0)) if worker is not None else 1
+    send_scheduler = create_send_scheduler(config, workers)
+    bot.session.middleware(send_scheduler)
+
+    metrics_config = config.get("metrics", {})
+    metrics = Metrics() if metrics_config.get("enabled") else None
+    if metrics is not None:
+        # Inside the scheduler, so it times the request itself and sees every 429
+        bot.session.middleware(ApiMetricsMiddleware(metrics))
     
-    # Register router-level middlewares (like Throttling)
-    rate_limit_config = config.get("rate_limit", {"limit": 5, "period": 3600})
-    user.router.message.middleware(
-        ThrottlingMiddleware(
-            limit=rate_limit_config["limit"],
-            period=rate_limit_config["period"],
-            loc_path=loc_path
+    dp = create_dispatcher(config, storage_service, loc, storage, metrics, shared_state)
+    dp["send_scheduler"] = send_scheduler
+    setup_workflow(dp, config, bot, loc, worker, shared_state)
+    # A shared store starts empty; index what is pending on the other replicas
+    await dp["submission_store"].refresh()
+    setup_config_reload(dp, config_manager)
+    setup_tenants(dp, tenants)
+    if hasattr(signal, "SIGHUP"):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_config, config_manager)
+        except NotImplementedError:
+            pass
+
+    metrics_runner = None
+    if metrics is not None:
+        register_service_metrics(metrics, dp)
+        # Each worker serves its own metrics, on the ports after the supervisor's
+        metrics_runner = await start_metrics_server(
+            metrics, metrics_config.get("host", "127.0.0.1"),
+            metrics_config.get("port", 9090) + (worker + 1 if worker is not None else 0),
         )
+
+    # Pick up edits made to admins.json outside the bot
+    admins_watcher = asyncio.create_task(storage_service.watch())
+
+    try:
+        yield bot, dp
+    finally:
+        admins_watcher.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await close_workflow(dp)
+        await send_scheduler.close()
+        await storage.close()
+        await storage_service.close()
+        await tenants.close()
+        if shared_state is not None:
+            await shared_state.close()
+        await bot.session.close()
+        log_listener.stop()
+
+def used_update_types(dp: Dispatcher) -> List[str]:
+    """The update types the routers handle; chat_member updates keep the membership cache fresh."""
+    return dp.resolve_used_update_types() + ["chat_member"]
+
+def run_worker(index: int, updates, taken, done, max_concurrent_updates: int):
+    """Entry point of a worker process: handles the updates the supervisor routes to it."""
+    # Ctrl+C reaches the whole process group; the supervisor stops the workers in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(worker_main(index, updates, taken, done, max_concurrent_updates))
+
+async def worker_main(index: int, updates, taken, done, max_concurrent_updates: int):
+    load_dotenv()
+    config_manager = ConfigManager(BASE_DIR / "config.yaml")
+    async with running_bot(config_manager, os.getenv("BOT_TOKEN"), worker=index) as (bot, dp):
+        # /reload_config reaches one worker; the supervisor passes it on to all of them
+        dp["reload_all"] = lambda: os.kill(os.getppid(), signal.SIGHUP)
+
+        async def handle(update: dict):
+            await dp.feed_update(bot, Update.model_validate(update, context={"bot": bot}))
+
+        logging.info(f"Worker {index} ready.")
+        await consume_updates(handle, updates, taken, done, max_concurrent_updates)
+        logging.info(f"Worker {index} stopping.")
+
+async def run_supervisor(config_manager: ConfigManager, bot_token: str):
+    """
+    Worker mode: this process only receives updates, by polling or webhook, and routes them
+    as plain JSON to `workers.count` processes that run the Dispatcher, so parsing and handling
+    use as many cores. Dead workers are restarted.
+    """
+    config = config_manager.current
+    workers_config = config.get("workers", {})
+    log_listener = setup_logging(config)
+
+    # Only read here, to route the owner's and admins' updates; worker 0 writes admins.json
+    storage_service = StorageService(BASE_DIR / "admins.json")
+    tenants = TenantRegistry(BASE_DIR, storage_service)
+    tenants.open(config)
+    config_manager.subscribe(tenants.open)
+    admins_watcher = asyncio.create_task(storage_service.watch())
+
+    def is_staff(user_id: int) -> bool:
+        return user_id == config_manager.current.owner_id or tenants.is_admin(user_id)
+
+    router = UpdateRouter(workers_config["count"], is_staff)
+    pool = WorkerPool(
+        workers_config["count"], run_worker, args=(workers_config.get("max_concurrent_updates", 100),),
+        queue_size=workers_config.get("queue_size", 1000),
     )
+    pool.start()
 
-    # Register routers
-    dp.include_router(admin.router)
-    dp.include_router(user.router)
-    dp.include_router(callback.router)
+    async def submit(update: dict):
+        await pool.submit(router.route(update), update)
+
+    def reload_all():
+        reload_config(config_manager)
+        pool.signal(signal.SIGHUP)
+
+    loop = asyncio.get_running_loop()
+    # Stop like on Ctrl+C, so the workers finish their queued updates first
+    supervisor = asyncio.current_task()
+    for signum, handler in (("SIGHUP", reload_all), ("SIGTERM", supervisor.cancel), ("SIGINT", supervisor.cancel)):
+        if hasattr(signal, signum):
+            try:
+                loop.add_signal_handler(getattr(signal, signum), handler)
+            except NotImplementedError:
+                pass
+
+    metrics_runner = None
+    metrics_config = config.get("metrics", {})
+    if metrics_config.get("enabled"):
+        metrics = Metrics()
+        register_worker_metrics(metrics, pool)
+        metrics_runner = await start_metrics_server(
+            metrics, metrics_config.get("host", "127.0.0.1"), metrics_config.get("port", 9090)
+        )
+
+    bot = Bot(token=bot_token)
+    # The routers are only attached here to list their update types
+    routers = Dispatcher()
+    routers.include_routers(admin.router, user.router, callback.router)
+    allowed_updates = used_update_types(routers)
+    webhook_config = config.get("webhook", {})
+
+    logging.info(f"Bot starting with {len(pool)} workers...")
+    try:
+        if webhook_config.get("enabled"):
+            await serve_webhook(create_ingest_app(submit, webhook_config, pool.stats), bot, webhook_config, allowed_updates)
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            async with aiohttp.ClientSession() as session:
+                await poll_raw_updates(session, bot.session.api.api_url(bot_token, "getUpdates"), submit, allowed_updates)
+    except asyncio.CancelledError:
+        # SIGTERM or Ctrl+C; stop the workers below
+        logging.info("Stopping workers...")
+    finally:
+        await pool.close()
+        admins_watcher.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await storage_service.close()
+        await tenants.close()
+        await bot.session.close()
+        log_listener.stop()
+
+def register_worker_metrics(metrics: Metrics, pool: WorkerPool):
+    """Per-worker queue depth, updates in progress and restarts, read from the pool at scrape time."""
+
+    def read(key: str):
+        return lambda: {(str(stats["worker"]),): stats[key] for stats in pool.stats()}
+
+    metrics.gauge_callback("worker_queue_depth", "Updates waiting in a worker's queue.",
+                           read("queue_depth"), labelnames=["worker"])
+    metrics.gauge_callback("worker_updates_in_flight", "Updates a worker has taken but not finished.",
+                           read("in_flight"), labelnames=["worker"])
+    metrics.gauge_callback("worker_restarts_total", "Times a worker was restarted after it died.",
+                           read("restarts"), kind="counter", labelnames=["worker"])
+
+async def main():
+    """Main function to start the bot."""
+    # Load environment variables
+    load_dotenv()
+    bot_token = os.getenv("BOT_TOKEN")
+    if not bot_token:
+        raise ValueError("BOT_TOKEN environment variable not set!")
+
+    # Load configuration
+    # Validated once here; an invalid config.yaml stops the bot before it connects
+    config_manager = ConfigManager(BASE_DIR / "config.yaml")
+    if config_manager.current.get("workers", {}).get("count", 0) > 1:
+        await run_supervisor(config_manager, bot_token)
+        return
+
+    async with running_bot(config_manager, bot_token) as (bot, dp):
+        allowed_updates = used_update_types(dp)
+        webhook_config = config_manager.current.get("webhook", {})
 
-    logging.info("Bot starting...")
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot, config=config, storage_service=storage_service, loc_path=loc_path)
+        logging.info("Bot starting...")
+        if webhook_config.get("enabled"):
+            await run_webhook(dp, bot, webhook_config, allowed_updates)
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            # Each update is handled in its own task, which waits for its turn in the scheduler;
+            # once as many are in flight as the scheduler holds, polling slows down
+            scheduler_config = config_manager.current.get("scheduler", {})
+            await dp.start_polling(
+                bot, allowed_updates=allowed_updates,
+                tasks_concurrency_limit=(
+                    scheduler_config.get("max_concurrent_updates", 100) + scheduler_config.get("max_pending", 10000)
+                ),
+            )
 
 if __name__ == "__main__":
     try:
@@ -1,22 +1,53 @@
-import json
-from pathlib import Path
-from typing import Dict
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
 
 from aiogram import Router, F, Bot
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
+from app.services.config import ConfigError, ConfigManager
+from app.services.localization import Localization
+from app.services.membership import MembershipCache
+from app.services.moderation import ModerationService
+from app.services.publish_queue import PublishQueue
+from app.services.send_scheduler import SendScheduler
 from app.states.admin_states import AdminManagement
 from app.services.storage import StorageService
+from app.services.submission_store import BaseSubmissionStore, PendingSubmission
 
 router = Router()
 
+DURATION_UNITS = {"m": 60, "h": 3600, "d": 86400}
+# Posts listed by /queue
+QUEUE_LIST_LIMIT = 20
+BULK_USAGE = "مثال:\n`/{command} 123456789` (همه‌ی پست‌های این کاربر)\n`/{command} 6h` (پست‌های قدیمی‌تر از ۶ ساعت؛ واحدها: m, h, d)"
+
+
+def select_for_bulk(
+    submission_store: BaseSubmissionStore, argument: Optional[str], report_chat_id: Optional[int] = None
+) -> Optional[List[PendingSubmission]]:
+    """
+    Resolves a bulk command argument (a submitter ID or an age such as 6h) to pending submissions,
+    limited to one report group when `report_chat_id` is given.
+    """
+    argument = (argument or "").strip()
+    if argument.isdigit():
+        return submission_store.select(submitter_id=int(argument), report_chat_id=report_chat_id)
+    match = re.fullmatch(r"(\d+)([mhd])", argument)
+    if match:
+        age = int(match.group(1)) * DURATION_UNITS[match.group(2)]
+        return submission_store.select(created_before=time.time() - age, report_chat_id=report_chat_id)
+    return None
+
 # This handler now manages the state after the "add admin" button is pressed
 @router.message(AdminManagement.awaiting_add_admin_details)
 async def process_add_admin_details(
     message: Message,
     state: FSMContext, # <-- Add state here
     storage_service: StorageService,
-    loc_path: Path
+    loc: Localization
 ):
     args = message.text.split()
     if len(args) != 2 or not args[0].isdigit():
@@ -27,9 +58,7 @@ async def process_add_admin_details(
     alias = args[1]
     await storage_service.add_admin(user_id, alias)
 
-    with open(loc_path, 'r', encoding='utf-8') as f:
-        loc = json.load(f)
-    await message.answer(loc["admin_added"].format(alias=alias, user_id=user_id))
+    await message.answer(loc.format("admin_added", alias=alias, user_id=user_id))
     
     # --- CORRECTED LINE ---
     await state.clear()
@@ -41,7 +70,7 @@ async def process_remove_admin_id(
     message: Message,
     state: FSMContext, # <-- Add state here
     storage_service: StorageService,
-    loc_path: Path
+    loc: Localization
 ):
     if not message.text.isdigit():
         await message.answer("فرمت اشتباه است. لطفاً فقط ID عددی ادمین را ارسال کنید.")
@@ -49,13 +78,163 @@ async def process_remove_admin_id(
 
     user_id = int(message.text)
     if await storage_service.remove_admin(user_id):
-        with open(loc_path, 'r', encoding='utf-8') as f:
-            loc = json.load(f)
-        await message.answer(loc["admin_removed"].format(user_id=user_id))
+        await message.answer(loc.format("admin_removed", user_id=user_id))
     else:
-        with open(loc_path, 'r', encoding='utf-8') as f:
-            loc = json.load(f)
-        await message.answer(loc["admin_not_found"].format(user_id=user_id))
+        await message.answer(loc.format("admin_not_found", user_id=user_id))
         
     # --- CORRECTED LINE ---
-    await state.clear()
\ No newline at end of file
+    await state.clear()
+
+
+@router.message(Command("cache_stats"))
+async def cmd_cache_stats(message: Message, user_role: str, membership_cache: MembershipCache):
+    """Owner-only: shows membership cache counters for tuning its TTL."""
+    if user_role != "owner":
+        return
+    stats = membership_cache.stats()
+    await message.answer(
+        f"Membership cache\n"
+        f"- hits: {stats['hits']}\n"
+        f"- misses: {stats['misses']}\n"
+        f"- hit ratio: {stats['hit_ratio']:.1%}\n"
+        f"- cached users: {stats['size']}"
+    )
+
+
+@router.message(Command("send_stats"))
+async def cmd_send_stats(message: Message, user_role: str, send_scheduler: SendScheduler):
+    """Owner-only: shows the outgoing message queue and wait times."""
+    if user_role != "owner":
+        return
+    stats = send_scheduler.stats()
+    await message.answer(
+        f"Send queue\n"
+        f"- queued: {stats['queue_depth']}\n"
+        f"- sent: {stats['sent']}\n"
+        f"- flood retries: {stats['retries']}\n"
+        f"- avg wait: {stats['avg_wait']:.2f}s\n"
+        f"- max wait: {stats['max_wait']:.2f}s"
+    )
+
+
+@router.message(Command("reload_config"))
+async def cmd_reload_config(
+    message: Message, user_role: str, config_manager: Optional[ConfigManager] = None,
+    reload_all: Optional[Callable[[], None]] = None,
+):
+    """Owner-only: reloads config.yaml; chat IDs and rate limits apply without a restart."""
+    if user_role != "owner" or config_manager is None:
+        return
+    try:
+        restart_needed = config_manager.reload()
+    except (ConfigError, OSError) as e:
+        await message.answer(f"بارگذاری تنظیمات ناموفق بود؛ تنظیمات قبلی همچنان فعال است.\n{e}", parse_mode=None)
+        return
+    if reload_all is not None:
+        # Worker mode: the other workers reload too
+        reload_all()
+    text = "تنظیمات دوباره بارگذاری شد."
+    if restart_needed:
+        text += f"\nاین تغییرات پس از راه‌اندازی مجدد اعمال می‌شوند: {', '.join(restart_needed)}"
+    await message.answer(text, parse_mode=None)
+
+
+@router.message(Command("approve_all"))
+async def cmd_approve_all(
+    message: Message, command: CommandObject, bot: Bot, user_role: str, user_alias: str,
+    submission_store: BaseSubmissionStore, moderation: ModerationService, config: Dict, tenant: Optional[str] = None
+):
+    """Publishes every pending submission of a user, or older than a given age."""
+    if user_role not in ["admin", "owner"]:
+        return
+    # With several tenants, only the current tenant's submissions
+    report_chat_id = config["report_group_id"] if tenant is not None else None
+    await submission_store.refresh()
+    selected = select_for_bulk(submission_store, command.args, report_chat_id)
+    if selected is None:
+        await message.answer(BULK_USAGE.format(command="approve_all"))
+        return
+    if not selected:
+        await message.answer("پست در انتظاری با این مشخصات یافت نشد.")
+        return
+    result = await moderation.approve_many(
+        bot, [pending.id for pending in selected], user_alias, message.from_user.id, report_chat_id=report_chat_id
+    )
+    await message.answer(f"{result['approved']} پست تایید شد، {result['failed']} مورد ناموفق.")
+
+
+@router.message(Command("reject_all"))
+async def cmd_reject_all(
+    message: Message, command: CommandObject, bot: Bot, user_role: str, user_alias: str,
+    submission_store: BaseSubmissionStore, moderation: ModerationService, config: Dict, tenant: Optional[str] = None
+):
+    """Deletes every pending submission of a user, or older than a given age."""
+    if user_role not in ["admin", "owner"]:
+        return
+    # With several tenants, only the current tenant's submissions
+    report_chat_id = config["report_group_id"] if tenant is not None else None
+    await submission_store.refresh()
+    selected = select_for_bulk(submission_store, command.args, report_chat_id)
+    if selected is None:
+        await message.answer(BULK_USAGE.format(command="reject_all"))
+        return
+    if not selected:
+        await message.answer("پست در انتظاری با این مشخصات یافت نشد.")
+        return
+    result = await moderation.delete_many(
+        bot, [pending.id for pending in selected], user_alias, message.from_user.id, report_chat_id=report_chat_id
+    )
+    await message.answer(f"{result['deleted']} پست حذف شد.")
+
+
+@router.message(Command("queue"))
+async def cmd_queue(message: Message, user_role: str, publish_queue: Optional[PublishQueue]):
+    """Lists the next queued posts with their estimated publish times."""
+    if user_role not in ["admin", "owner"]:
+        return
+    if publish_queue is None:
+        await message.answer("صف انتشار فعال نیست؛ پست‌ها بلافاصله پس از تایید منتشر می‌شوند.")
+        return
+    planned = publish_queue.schedule()
+    if not planned:
+        await message.answer("صف انتشار خالی است.")
+        return
+    local = timezone(timedelta(hours=publish_queue.utc_offset))
+    lines = [f"صف انتشار ({len(planned)} پست)"]
+    for place, (post, at) in enumerate(planned[:QUEUE_LIST_LIMIT], start=1):
+        when = datetime.fromtimestamp(at, local).strftime("%m-%d %H:%M")
+        lines.append(f"{place}. #{post.id} - {post.subject} - {when}")
+    if len(planned) > QUEUE_LIST_LIMIT:
+        lines.append("...")
+    lines.append("\n/queue_move <id> <position> - /queue_cancel <id>")
+    await message.answer("\n".join(lines))
+
+
+@router.message(Command("queue_cancel"))
+async def cmd_queue_cancel(message: Message, command: CommandObject, user_role: str, publish_queue: Optional[PublishQueue]):
+    """Removes a post from the publish queue."""
+    if user_role not in ["admin", "owner"] or publish_queue is None:
+        return
+    args = (command.args or "").split()
+    if len(args) != 1 or not args[0].isdigit():
+        await message.answer("مثال: `/queue_cancel 12`")
+        return
+    if await publish_queue.cancel(int(args[0])):
+        await message.answer(f"پست #{args[0]} از صف انتشار حذف شد.")
+    else:
+        await message.answer(f"پست #{args[0]} در صف انتشار یافت نشد.")
+
+
+@router.message(Command("queue_move"))
+async def cmd_queue_move(message: Message, command: CommandObject, user_role: str, publish_queue: Optional[PublishQueue]):
+    """Moves a queued post to another place in the publishing order (1 = next)."""
+    if user_role not in ["admin", "owner"] or publish_queue is None:
+        return
+    args = (command.args or "").split()
+    if len(args) != 2 or not args[0].isdigit() or not args[1].isdigit() or int(args[1]) < 1:
+        await message.answer("مثال: `/queue_move 12 1`")
+        return
+    if await publish_queue.move(int(args[0]), int(args[1]) - 1):
+        await message.answer(f"پست #{args[0]} به جایگاه {args[1]} منتقل شد.")
+    else:
+        await message.answer(f"پست #{args[0]} در صف انتشار یافت نشد.")
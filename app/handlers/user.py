@@ -1,10 +1,8 @@
 # app/handlers/user.py
 
-import asyncio
-import json
 import logging
-from pathlib import Path
-from typing import Dict, List
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
 
 from aiogram import Router, F, Bot
 from aiogram.filters import CommandStart, Command
@@ -13,89 +11,142 @@ from aiogram.types import Message
 
 from app.keyboards.inline import get_approval_keyboard
 from app.keyboards.menu import get_start_menu
-from app.services.broadcaster import Broadcaster
+from app.services.broadcaster import PUBLISH, REPORT, Broadcaster, publish_payload, report_payload
+from app.services.dedup import MATCH_MEDIA, MATCH_TEXT, DedupIndex
+from app.services.localization import Localization
+from app.services.media_groups import AddResult, MediaGroupAggregator
+from app.services.outbox import STATUS_FAILED as DELIVERY_FAILED, STATUS_SENT as DELIVERY_SENT, Outbox
+from app.services.send_scheduler import low_priority
+from app.services.submission_store import STATUS_FAILED, BaseSubmissionStore
 from app.states.user_states import UserSubmission
-from app.utils.message_helpers import get_message_type, get_report_header, get_log_message
+from app.utils.message_helpers import get_report_header, get_log_message
+from app.utils.submission import Submission
 
 router = Router()
 
-# Caches for media group handling - used by BOTH workflows now
-media_group_cache = {}
-media_group_tasks = {}
-
 # --- Universal Helper Functions ---
 
 @router.message(CommandStart())
-async def cmd_start(message: Message, user_role: str, loc_path: Path):
-    with open(loc_path, 'r', encoding='utf-8') as f:
-        loc = json.load(f)
+async def cmd_start(message: Message, user_role: str, loc: Localization):
     keyboard = get_start_menu(user_role)
     await message.answer(loc["welcome"], reply_markup=keyboard)
 
+DUPLICATE_REASONS = {MATCH_MEDIA: "رسانه‌ی یکسان", MATCH_TEXT: "متن یکسان"}
+
 def is_admin_or_owner(user_role: str) -> bool:
     return user_role in ["admin", "owner"]
 
 async def handle_submission(
-    bot: Bot, messages: List[Message], subject: str, user_role: str,
-    user_alias: str, config: Dict, loc_path: Path
+    bot: Bot, submission: Optional[Submission], subject: str, user_role: str,
+    user_alias: str, config: Dict, loc: Localization, submission_store: BaseSubmissionStore,
+    dedup_index: Optional[DedupIndex] = None, outbox: Optional[Outbox] = None
 ):
-    """Unified submission handler. Now robust for all workflows."""
-    if not messages:
-        logging.error("handle_submission called with no messages.")
+    """
+    Unified submission handler. Now robust for all workflows.
+    With an outbox, a post or report that fails to go out is retried instead of lost.
+    """
+    if not submission:
+        logging.error("handle_submission called with no submission.")
         return
 
-    is_group = len(messages) > 1
-    message_to_log = messages[0]
-
     if is_admin_or_owner(user_role):
-        success = await Broadcaster.post_to_output_channel(
-            bot=bot, messages=messages, subject=subject, config=config,
-            loc_path=loc_path, is_regular_user_post=False
-        )
-        if success:
+        if outbox is not None:
+            # Keyed by the admin's message, so a redelivered update doesn't post it twice
+            delivery = await outbox.submit(
+                PUBLISH, f"direct:{submission.chat_id}:{submission.message_ids[0]}", config["output_channel_id"],
+                publish_payload(submission, subject, config["output_channel_id"], False),
+            )
+            status = delivery.status
+        else:
+            success = await Broadcaster.post_to_output_channel(
+                bot=bot, submission=submission, subject=subject, config=config,
+                loc=loc, is_regular_user_post=False
+            )
+            status = DELIVERY_SENT if success else DELIVERY_FAILED
+        if status == DELIVERY_FAILED:
+            await bot.send_message(submission.chat_id, "ارسال پست به کانال ناموفق بود.")
+        else:
             log_text = get_log_message(
-                "admin_direct_post_log", loc_path,
-                admin_alias=user_alias, admin_id=message_to_log.from_user.id
+                "admin_direct_post_log", loc,
+                admin_alias=user_alias, admin_id=submission.user_id
             )
-            await bot.send_message(config["report_group_id"], log_text)
-            await bot.send_message(message_to_log.chat.id, "پست شما با موفقیت مستقیماً در کانال منتشر شد.")
+            with low_priority():
+                await bot.send_message(config["report_group_id"], log_text)
+            if status == DELIVERY_SENT:
+                await bot.send_message(submission.chat_id, "پست شما با موفقیت مستقیماً در کانال منتشر شد.")
+            else:
+                await bot.send_message(
+                    submission.chat_id, "ارسال پست به کانال فعلاً ناموفق بود؛ به‌طور خودکار دوباره تلاش می‌شود."
+                )
     else:
         report_header = get_report_header(
-            loc_path, user_id=message_to_log.from_user.id, role='کاربر',
-            subject=subject, message_type="album" if is_group else get_message_type(message_to_log)
+            loc, user_id=submission.user_id, role='کاربر',
+            subject=subject, message_type=submission.message_type
         )
-        keyboard = get_approval_keyboard(message_to_log.from_user.id, subject)
-        await Broadcaster.forward_to_report_group(bot, messages, report_header, keyboard, config)
-        with open(loc_path, 'r', encoding='utf-8') as f:
-            loc = json.load(f)
-        await bot.send_message(message_to_log.chat.id, loc["submission_received"])
+        if dedup_index is not None:
+            match = dedup_index.check(submission)
+            if match is not None:
+                if config.get("dedup", {}).get("action", "flag") == "reject":
+                    await bot.send_message(submission.chat_id, loc["duplicate_rejected"])
+                    return
+                report_header += loc.format(
+                    "duplicate_flag",
+                    reason=DUPLICATE_REASONS.get(match.reason, "متن مشابه"),
+                    submitter_id=match.entry.user_id,
+                    date=datetime.fromtimestamp(match.entry.created_at, timezone.utc).strftime("%Y-%m-%d %H:%M"),
+                )
+        pending = await submission_store.create(submission, subject, config["report_group_id"], report_header)
+        if outbox is not None:
+            # The outbox records the report messages once sent, or fails the submission and tells the user
+            delivery = await outbox.submit(
+                REPORT, f"report:{pending.id}", config["report_group_id"],
+                report_payload(pending.id, submission, report_header, config["report_group_id"]),
+            )
+            if delivery.status == DELIVERY_FAILED:
+                return
+        else:
+            keyboard = get_approval_keyboard(pending.id)
+            report_message_ids = await Broadcaster.forward_to_report_group(bot, submission, report_header, keyboard, config)
+            if report_message_ids is None:
+                await submission_store.resolve(pending, STATUS_FAILED)
+                await bot.send_message(submission.chat_id, loc["submission_failed"])
+                return
+            await submission_store.set_report_messages(pending.id, report_message_ids)
+        if dedup_index is not None:
+            await dedup_index.add(submission)
+        await bot.send_message(submission.chat_id, loc["submission_received"])
 
 
 # =============================================================================
 # WORKFLOW 1: Using the /submit command
 # =============================================================================
 
+async def collect_media_group(
+    message: Message, media_groups: MediaGroupAggregator, loc: Localization, on_complete
+):
+    """Hands an album item to the aggregator, telling the user once if it can't take the album."""
+    if media_groups.add(message, on_complete) is AddResult.REJECTED:
+        await message.answer(loc["media_group_busy"])
+
+
 async def process_submitted_media_group(
-    media_group_id: str, bot: Bot, state: FSMContext, user_role: str,
-    user_alias: str, loc_path: Path, config: Dict
+    messages: List[Message], bot: Bot, state: FSMContext, user_role: str,
+    user_alias: str, loc: Localization, config: Dict, submission_store: BaseSubmissionStore,
+    dedup_index: Optional[DedupIndex], outbox: Optional[Outbox]
 ):
-    """Delayed function to process a media group from the /submit workflow."""
-    messages = media_group_cache.pop(media_group_id, [])
-    media_group_tasks.pop(media_group_id, None)
-    if not messages:
-        return
-        
+    """Processes a complete media group from the /submit workflow."""
     data = await state.get_data()
     subject = data.get("subject", "نامشخص")
     await state.clear()
-    await handle_submission(bot, messages, subject, user_role, user_alias, config, loc_path)
+    await handle_submission(
+        bot, Submission.from_messages(messages), subject, user_role, user_alias, config, loc,
+        submission_store, dedup_index, outbox
+    )
 
 
 @router.message(Command("submit"))
-async def cmd_submit(message: Message, state: FSMContext, loc_path: Path):
+async def cmd_submit(message: Message, state: FSMContext, loc: Localization):
     """Step 1: User starts the submission with /submit."""
-    with open(loc_path, 'r', encoding='utf-8') as f:
-        loc = json.load(f)
     await message.answer(loc["ask_for_subject"])
     await state.set_state(UserSubmission.awaiting_subject)
 
@@ -111,49 +162,36 @@ async def process_subject_from_command(message: Message, state: FSMContext):
 @router.message(UserSubmission.awaiting_content)
 async def process_content_from_command(
     message: Message, bot: Bot, state: FSMContext, user_role: str,
-    user_alias: str, loc_path: Path, config: Dict
+    user_alias: str, loc: Localization, config: Dict, media_groups: MediaGroupAggregator,
+    submission_store: BaseSubmissionStore, dedup_index: Optional[DedupIndex], outbox: Optional[Outbox]
 ):
     """Step 3: User sends content. This now handles both single and group media."""
     if message.media_group_id:
-        # If the message is part of a media group, use the debouncing logic
-        media_group_id = message.media_group_id
-        if media_group_id not in media_group_cache:
-            media_group_cache[media_group_id] = []
-        media_group_cache[media_group_id].append(message)
-
-        if media_group_id in media_group_tasks:
-            media_group_tasks[media_group_id].cancel()
-
-        loop = asyncio.get_event_loop()
-        task = loop.call_later(
-            1.5, # Increased delay slightly for stability
-            lambda: asyncio.create_task(
-                process_submitted_media_group(
-                    media_group_id, bot, state, user_role, user_alias, loc_path, config
-                )
+        # If the message is part of a media group, wait for the rest of the album
+        await collect_media_group(
+            message, media_groups, loc,
+            lambda messages: process_submitted_media_group(
+                messages, bot, state, user_role, user_alias, loc, config, submission_store, dedup_index, outbox
             )
         )
-        media_group_tasks[media_group_id] = task
     else:
         # If it's a single message, process it immediately
         data = await state.get_data()
         subject = data.get("subject", "نامشخص")
         await state.clear()
-        await handle_submission(bot, [message], subject, user_role, user_alias, config, loc_path)
+        await handle_submission(
+            bot, Submission.from_messages([message]), subject, user_role, user_alias, config, loc,
+            submission_store, dedup_index, outbox
+        )
 
 
 # =============================================================================
 # WORKFLOW 2: Sending a direct message
 # =============================================================================
 
-async def process_direct_media_group(media_group_id: str, bot: Bot, state: FSMContext):
-    """Delayed function to ask for subject for a direct media group."""
-    messages = media_group_cache.pop(media_group_id, [])
-    media_group_tasks.pop(media_group_id, None)
-    if not messages:
-        return
-    messages_json = [msg.model_dump_json() for msg in messages]
-    await state.update_data(original_messages=messages_json)
+async def process_direct_media_group(messages: List[Message], bot: Bot, state: FSMContext):
+    """Asks for the subject once a direct media group is complete."""
+    await state.update_data(submission=Submission.from_messages(messages).to_dict())
     await bot.send_message(messages[0].chat.id, "لطفاً نام سوژه را برای این آلبوم وارد کنید:")
     await state.set_state(UserSubmission.awaiting_subject_for_direct_message)
 
@@ -161,45 +199,36 @@ async def process_direct_media_group(media_group_id: str, bot: Bot, state: FSMCo
 @router.message(UserSubmission.awaiting_subject_for_direct_message)
 async def process_subject_for_direct_message(
     message: Message, bot: Bot, state: FSMContext, user_role: str,
-    user_alias: str, loc_path: Path, config: Dict
+    user_alias: str, loc: Localization, config: Dict, submission_store: BaseSubmissionStore,
+    dedup_index: Optional[DedupIndex], outbox: Optional[Outbox]
 ):
     """Handles receiving the subject after a direct message/album was sent."""
     data = await state.get_data()
     subject = message.text
     
-    if 'original_messages' in data: # Media Group
-        original_messages_json = data.get("original_messages", [])
-        original_messages = [Message.model_validate_json(msg_json) for msg_json in original_messages_json]
-    else: # Single Message
-        original_message_json = data.get("original_message")
-        original_messages = [Message.model_validate_json(original_message_json)] if original_message_json else []
+    submission_data = data.get("submission")
+    submission = Submission.from_dict(submission_data) if submission_data else None
 
     await state.clear()
-    await handle_submission(bot, original_messages, subject, user_role, user_alias, config, loc_path)
+    await handle_submission(
+        bot, submission, subject, user_role, user_alias, config, loc, submission_store, dedup_index, outbox
+    )
 
 
-@router.message(F.chat_type == "private", F.media_group_id)
-async def handle_direct_media_group(message: Message, bot: Bot, state: FSMContext):
+@router.message(F.chat.type == "private", F.media_group_id)
+async def handle_direct_media_group(
+    message: Message, bot: Bot, state: FSMContext, loc: Localization, media_groups: MediaGroupAggregator
+):
     """Collects all messages from a direct media group submission."""
-    media_group_id = message.media_group_id
-    if media_group_id not in media_group_cache:
-        media_group_cache[media_group_id] = []
-    media_group_cache[media_group_id].append(message)
-
-    if media_group_id in media_group_tasks:
-        media_group_tasks[media_group_id].cancel()
-
-    loop = asyncio.get_event_loop()
-    task = loop.call_later(1.5, lambda: asyncio.create_task(process_direct_media_group(media_group_id, bot, state)))
-    media_group_tasks[media_group_id] = task
+    await collect_media_group(
+        message, media_groups, loc,
+        lambda messages: process_direct_media_group(messages, bot, state)
+    )
 
 
 @router.message(F.chat.type == "private")
-async def direct_submission(message: Message, state: FSMContext, loc_path: Path):
+async def direct_submission(message: Message, state: FSMContext, loc: Localization):
     """Handles a single direct message as the start of a submission."""
-    message_json = message.model_dump_json()
-    await state.update_data(original_message=message_json)
-    with open(loc_path, 'r', encoding='utf-8') as f:
-        loc = json.load(f)
+    await state.update_data(submission=Submission.from_messages([message]).to_dict())
     await message.answer(loc["ask_for_subject"])
     await state.set_state(UserSubmission.awaiting_subject_for_direct_message)
\ No newline at end of file
@@ -1,16 +1,23 @@
+from typing import List
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-def get_approval_keyboard(submitter_id: int, subject: str) -> InlineKeyboardMarkup:
+TENANT_CALLBACK_PREFIX = "tenant:"
+
+def get_approval_keyboard(submission_id: str) -> InlineKeyboardMarkup:
     """Generates the inline keyboard for report messages."""
     
-    # NOTE: Callback data has a 64-byte limit. Be mindful of subject length.
-    # We truncate the subject to ensure it fits.
-    truncated_subject = (subject[:30] + '..') if len(subject) > 30 else subject
-
+    # NOTE: Callback data has a 64-byte limit, so it only carries the short
+    # submission ID. Subject and submitter are looked up in the SubmissionStore.
     buttons = [
         [
-            InlineKeyboardButton(text="تایید ✅", callback_data=f"approve:{submitter_id}:{truncated_subject}"),
-            InlineKeyboardButton(text="حذف ❌", callback_data=f"delete:{submitter_id}")
+            InlineKeyboardButton(text="تایید ✅", callback_data=f"approve:{submission_id}"),
+            InlineKeyboardButton(text="حذف ❌", callback_data=f"delete:{submission_id}")
         ]
     ]
-    return InlineKeyboardMarkup(inline_keyboard=buttons)
\ No newline at end of file
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+def get_tenant_keyboard(names: List[str]) -> InlineKeyboardMarkup:
+    """One button per tenant, for users who have to choose where their post goes."""
+    buttons = [[InlineKeyboardButton(text=name, callback_data=f"{TENANT_CALLBACK_PREFIX}{name}")] for name in names]
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -1,16 +1,17 @@
-import json
-from pathlib import Path
 from typing import Callable, Dict, Any, Awaitable
 
 from aiogram import BaseMiddleware, Bot
-from aiogram.types import TelegramObject, User
+from aiogram.types import TelegramObject, Update, User
 
+from app.services.localization import Localization
+from app.services.membership import MembershipCache
 from app.services.storage import StorageService
 
 class ACLMiddleware(BaseMiddleware):
-    def __init__(self, storage_service: StorageService, config: Dict):
+    def __init__(self, storage_service: StorageService, config: Dict, membership: MembershipCache):
         self.storage = storage_service
         self.config = config
+        self.membership = membership
 
     async def __call__(
         self,
@@ -18,6 +19,18 @@ class ACLMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any],
     ) -> Any:
+        # The snapshot set by ConfigMiddleware, so a reload mid-update can't mix two configs.
+        # With tenants, TenantMiddleware replaces both with the tenant's config and admins
+        config = data.get("config", self.config)
+        storage = data.get("storage_service", self.storage)
+
+        # Membership changes in the required channel invalidate the cached check
+        if isinstance(event, Update) and event.chat_member:
+            chat_member = event.chat_member
+            if chat_member.chat.id == config["required_channel_id"]:
+                self.membership.invalidate(chat_member.chat.id, chat_member.new_chat_member.user.id)
+            return await handler(event, data)
+
         user: User = data.get("event_from_user")
         if not user:
             return await handler(event, data)
@@ -26,43 +39,38 @@ class ACLMiddleware(BaseMiddleware):
         alias = None
         
         # 1. Check for Owner
-        if user.id == self.config["owner_id"]:
+        if user.id == config["owner_id"]:
             role = "owner"
             alias = "Owner"
         else:
-            # 2. Check for Admin
-            admins = await self.storage.get_admins()
-            for admin in admins:
-                if admin["id"] == user.id:
-                    role = "admin"
-                    alias = admin["alias"]
-                    break
+            # 2. Check for Admin (in-memory lookup, no disk access)
+            admin = storage.get_admin(user.id)
+            if admin:
+                role = "admin"
+                alias = admin["alias"]
         
         # Mandatory Membership Check for Admins and Owner
         if role in ["admin", "owner"]:
             bot: Bot = data.get("bot")
             try:
-                member = await bot.get_chat_member(
-                    chat_id=self.config["required_channel_id"],
-                    user_id=user.id
+                is_member = await self.membership.is_member(
+                    bot, config["required_channel_id"], user.id
                 )
-                if member.status not in ["creator", "administrator", "member"]:
-                    loc_path: Path = data.get("loc_path")
-                    with open(loc_path, 'r', encoding='utf-8') as f:
-                        loc = json.load(f)
-                    
+                if not is_member:
+                    loc: Localization = data.get("loc")
+
                     # You might want to get the channel invite link or username
-                    channel_link = f"@{self.config['required_channel_id']}"
+                    channel_link = f"@{config['required_channel_id']}"
                     await bot.send_message(
                         user.id,
-                        loc["must_be_member"].format(channel_link=channel_link)
+                        loc.format("must_be_member", channel_link=channel_link)
                     )
                     return # Stop processing
             except Exception:
                 # Bot might not be admin in the channel, or channel is invalid
                 await bot.send_message(
-                    self.config["owner_id"],
-                    f"Error: Could not check membership for user {user.id} in required channel {self.config['required_channel_id']}."
+                    config["owner_id"],
+                    f"Error: Could not check membership for user {user.id} in required channel {config['required_channel_id']}."
                 )
                 return # Stop processing
 
@@ -0,0 +1,26 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.services.config import ConfigManager
+
+
+class ConfigMiddleware(BaseMiddleware):
+    """
+    Hands each update the config that was current when it arrived. Registered as an outer
+    update middleware, so the ACL, throttling and handlers of one update all see the same
+    snapshot even if the config is reloaded while it is being handled.
+    """
+
+    def __init__(self, manager: ConfigManager):
+        self.manager = manager
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        data["config"] = self.manager.current
+        return await handler(event, data)
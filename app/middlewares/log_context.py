@@ -0,0 +1,38 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.services.log_pipeline import bind_log_context, reset_log_context
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """
+    Tags every log record made while handling an update. As an outer update middleware it
+    binds the update and user ids; as an inner observer middleware, after the ACL, the role
+    and handler name too.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        fields = {}
+        if isinstance(event, Update):
+            fields["update_id"] = event.update_id
+        user = data.get("event_from_user")
+        if user is not None:
+            fields["user_id"] = user.id
+        if data.get("user_role"):
+            fields["role"] = data["user_role"]
+        handler_object = data.get("handler")
+        if handler_object is not None:
+            fields["handler"] = getattr(handler_object.callback, "__name__", "handler")
+
+        token = bind_log_context(**fields)
+        try:
+            return await handler(event, data)
+        finally:
+            reset_log_context(token)
@@ -0,0 +1,107 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.services.metrics import Metrics
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer update middleware: counts updates per type, their latency, errors and how many are in flight."""
+
+    def __init__(self, metrics: Metrics):
+        self.updates = metrics.counter("bot_updates_total", "Updates received.", ["type"])
+        self.errors = metrics.counter("bot_update_errors_total", "Updates whose handling raised.", ["type"])
+        self.duration = metrics.histogram(
+            "bot_update_duration_seconds", "Time to handle an update, middlewares included.", ["type"]
+        )
+        self.in_flight = metrics.gauge("bot_updates_in_flight", "Updates being handled right now.")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        update_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        self.updates.inc(update_type)
+        self.in_flight.inc()
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors.inc(update_type)
+            raise
+        finally:
+            self.duration.observe(time.perf_counter() - start, update_type)
+            self.in_flight.dec()
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware for every router observer: latency and errors per handler function."""
+
+    def __init__(self, metrics: Metrics):
+        self.duration = metrics.histogram("bot_handler_duration_seconds", "Handler latency.", ["handler"])
+        self.errors = metrics.counter("bot_handler_errors_total", "Handlers that raised.", ["handler"])
+        self._names: Dict[Callable, str] = {}
+
+    def _name(self, callback: Callable) -> str:
+        name = self._names.get(callback)
+        if name is None:
+            module = getattr(callback, "__module__", "") or ""
+            name = self._names[callback] = f"{module.rsplit('.', 1)[-1]}.{getattr(callback, '__name__', 'handler')}"
+        return name
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = self._name(handler_object.callback) if handler_object is not None else "unknown"
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors.inc(name)
+            raise
+        finally:
+            self.duration.observe(time.perf_counter() - start, name)
+
+
+class TimedMiddleware(BaseMiddleware):
+    """
+    Wraps another middleware and records the time spent in it alone,
+    excluding whatever it calls downstream (the next middlewares and the handler).
+    """
+
+    def __init__(self, middleware: BaseMiddleware, name: str, metrics: Metrics):
+        self.middleware = middleware
+        self.name = name
+        self.duration = metrics.histogram(
+            "bot_middleware_duration_seconds", "Time spent in a middleware itself.", ["middleware"]
+        )
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        downstream = 0.0
+
+        async def timed_handler(event: TelegramObject, data: Dict[str, Any]) -> Any:
+            nonlocal downstream
+            start = time.perf_counter()
+            try:
+                return await handler(event, data)
+            finally:
+                downstream += time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            return await self.middleware(timed_handler, event, data)
+        finally:
+            self.duration.observe(time.perf_counter() - start - downstream, self.name)
@@ -0,0 +1,38 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.services.update_scheduler import UpdateScheduler
+
+
+class SchedulerMiddleware(BaseMiddleware):
+    """
+    Hands each update to the UpdateScheduler instead of handling it right away. Registered as
+    the first outer update middleware, so the other middlewares and the handlers run in the
+    update's turn. It returns once the update has been handled, so callers that bound or time
+    the updates in flight see the real handling, and so do the errors raised by handlers.
+    Updates of a user in a private chat share a key, so they run in order;
+    `is_priority(user_id)` marks updates of the owner and admins, which are never shed.
+    """
+
+    def __init__(self, scheduler: UpdateScheduler, is_priority: Callable[[int], bool]):
+        self.scheduler = scheduler
+        self.is_priority = is_priority
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        if (chat is None and user is None) or (chat is not None and chat.type != "private"):
+            # Report groups and channels keep no FSM state, and claims stop a submission from
+            # being handled twice, so a moderator's clicks needn't wait for each other
+            key = ("update", getattr(event, "update_id", None))
+        else:
+            key = (chat.id if chat else None, user.id if user else None)
+        priority = user is not None and self.is_priority(user.id)
+        return await self.scheduler.run(lambda: handler(event, data), key, priority)
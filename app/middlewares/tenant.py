@@ -0,0 +1,69 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.keyboards.inline import TENANT_CALLBACK_PREFIX, get_tenant_keyboard
+from app.services.config import Config
+from app.services.tenants import TenantRegistry
+
+
+class TenantMiddleware(BaseMiddleware):
+    """
+    Scopes an update to its tenant: `config` becomes the tenant's config and `storage_service`
+    its admin registry, so the ACL, throttling and handlers need no tenant logic of their own.
+    Registered as an outer update middleware after ConfigMiddleware.
+    A private chat whose tenant is unknown is asked to choose one instead of being handled;
+    only /start and the choice itself go through, under the default tenant.
+    """
+
+    def __init__(self, registry: TenantRegistry):
+        self.registry = registry
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        config = data.get("config")
+        if not isinstance(config, Config) or not config.tenants:
+            return await handler(event, data)
+
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        bot_id = data["bot"].id
+        is_start = is_choice = False
+        if user is not None and isinstance(event, Update) and event.message and event.message.text:
+            # t.me/<bot>?start=<tenant> arrives as "/start <tenant>"
+            command, _, payload = event.message.text.partition(" ")
+            is_start = command.split("@")[0] == "/start"
+            if is_start and config.tenant(payload.strip()) is not None:
+                await self.registry.select(bot_id, user.id, payload.strip())
+        if isinstance(event, Update) and event.callback_query and event.callback_query.data:
+            is_choice = event.callback_query.data.startswith(TENANT_CALLBACK_PREFIX)
+
+        tenant = None if is_choice else await self.registry.resolve(
+            config, bot_id, chat.id if chat else None, user.id if user else None
+        )
+        if tenant is None:
+            if not (is_start or is_choice):
+                await self._ask_for_tenant(event, config, data["loc"])
+                return None
+            tenant = config
+        data["tenant"] = tenant.name
+        data["config"] = tenant
+        data["storage_service"] = self.registry.storage(tenant)
+        return await handler(event, data)
+
+    @staticmethod
+    async def _ask_for_tenant(event: TelegramObject, config: Config, loc) -> None:
+        if not isinstance(event, Update):
+            return
+        keyboard = get_tenant_keyboard([config.name, *config.tenants])
+        if event.message:
+            await event.message.answer(loc["choose_tenant"], reply_markup=keyboard)
+        elif event.callback_query:
+            await event.callback_query.answer()
+            if event.callback_query.message:
+                await event.callback_query.message.answer(loc["choose_tenant"], reply_markup=keyboard)
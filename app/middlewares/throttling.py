@@ -1,28 +1,40 @@
-import time
-import json
-from pathlib import Path
-from typing import Callable, Dict, Any, Awaitable, MutableMapping
+import inspect
+from typing import Callable, Dict, Any, Awaitable, Optional, Tuple
 
 from aiogram import BaseMiddleware
 from aiogram.types import Message
 
-# Use a simple in-memory cache. For distributed systems, use Redis or similar.
-caches: Dict[str, MutableMapping[int, list[float]]] = {
-    "default": {}
-}
+from app.services.localization import Localization
+from app.services.rate_limiter import RateLimiter
 
 class ThrottlingMiddleware(BaseMiddleware):
-    def __init__(self, limit: int, period: int, loc_path: Path):
+    def __init__(
+        self,
+        limiter: RateLimiter,
+        limit: int,
+        period: int,
+        loc: Localization,
+        role_limits: Optional[Dict[str, Tuple[int, int]]] = None,
+    ):
         """
         Initializes the middleware.
-        :param limit: The maximum number of requests allowed.
-        :param period: The time period in seconds.
-        :param loc_path: Path to the localization file.
+        :param limiter: The rate limiter engine that tracks per-user state (local, or SharedRateLimiter).
+        :param limit: The default maximum number of requests allowed.
+        :param period: The default time period in seconds.
+        :param loc: The loaded localization catalog.
+        :param role_limits: Optional (limit, period) overrides per user role. A limit of 0 disables throttling.
         """
+        self.limiter = limiter
         self.limit = limit
         self.period = period
-        self.loc_path = loc_path
-        self.cache = caches["default"]
+        self.loc = loc
+        self.role_limits = role_limits or {}
+
+    def update_limits(self, limit: int, period: int, role_limits: Optional[Dict[str, Tuple[int, int]]] = None):
+        """Applies new limits from a reloaded config; tracked users keep their current state."""
+        self.limit = limit
+        self.period = period
+        self.role_limits = role_limits or {}
 
     async def __call__(
         self,
@@ -30,24 +42,24 @@ class ThrottlingMiddleware(BaseMiddleware):
         event: Message,
         data: Dict[str, Any],
     ) -> Any:
-        user_id = event.from_user.id
-        now = time.time()
-
-        # Check and clean up old timestamps
-        if user_id in self.cache:
-            # Keep only timestamps within the current period
-            self.cache[user_id] = [t for t in self.cache[user_id] if now - t < self.period]
+        tenant = data.get("tenant")
+        if tenant is None:
+            limit, period = self.role_limits.get(data.get("user_role"), (self.limit, self.period))
+            key = event.from_user.id
         else:
-            self.cache[user_id] = []
+            # Each tenant has its own limits, and a user's submissions count per tenant
+            rate_limit = data["config"].rate_limit
+            limit, period = rate_limit.roles.get(data.get("user_role"), (rate_limit.limit, rate_limit.period))
+            key = (tenant, event.from_user.id)
+        if limit <= 0:
+            return await handler(event, data)
 
-        # Check if the limit is exceeded
-        if len(self.cache[user_id]) >= self.limit:
-            with open(self.loc_path, 'r', encoding='utf-8') as f:
-                loc = json.load(f)
-            # You can add a new string for this message in fa.json
-            await event.answer(loc.get("rate_limit_exceeded", "Rate limit exceeded. Try again later."))
+        # Check if the limit is exceeded; a shared limiter answers asynchronously
+        allowed = self.limiter.hit(key, limit, period)
+        if inspect.isawaitable(allowed):
+            allowed = await allowed
+        if not allowed:
+            await event.answer(self.loc.get("rate_limit_exceeded", "Rate limit exceeded. Try again later."))
             return  # Stop processing the event
 
-        # Add current timestamp and proceed
-        self.cache[user_id].append(now)
-        return await handler(event, data)
\ No newline at end of file
+        return await handler(event, data)
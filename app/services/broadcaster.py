@@ -1,99 +1,165 @@
 # app/services/broadcaster.py
 
-import asyncio
-import json
 import logging
-from pathlib import Path
-from typing import Dict, List, Union
+from typing import Dict, List, Optional
 
 from aiogram import Bot
-from aiogram.exceptions import TelegramRetryAfter
-from aiogram.types import InlineKeyboardMarkup, Message
+from aiogram.types import InlineKeyboardMarkup
 
+from app.services.localization import Localization
 from app.utils.message_helpers import convert_messages_to_input_media
+from app.utils.submission import Submission
+
+# Kinds of outbox deliveries
+PUBLISH = "publish"
+REPORT = "report"
+
+
+def publish_payload(submission: Submission, subject: str, channel_id: int, is_regular_user_post: bool) -> Dict:
+    """What the outbox stores to post `submission` to an output channel."""
+    return {
+        "submission": submission.to_dict(), "subject": subject,
+        "channel_id": channel_id, "is_regular_user_post": is_regular_user_post,
+    }
+
+
+def report_payload(submission_id: str, submission: Submission, header: str, report_group_id: int) -> Dict:
+    """What the outbox stores to forward a pending submission to a report group."""
+    return {
+        "submission_id": submission_id, "submission": submission.to_dict(),
+        "header": header, "report_group_id": report_group_id,
+    }
+
 
 class Broadcaster:
     @staticmethod
-    async def forward_to_report_group(
+    async def send_to_report_group(
         bot: Bot,
-        messages: List[Message], # Now always a list
+        submission: Submission,
         header: str,
-        keyboard: InlineKeyboardMarkup,
-        config: Dict,
-    ):
-        """Forwards a user's submission (single or media group) to the report group."""
+        keyboard: Optional[InlineKeyboardMarkup],
+        report_group_id: int,
+    ) -> List[int]:
+        """
+        Forwards a user's submission (single or media group) to the report group and returns the
+        ids of every message it sent. Raises on failure, after deleting every message it already
+        sent, so a retry doesn't leave a stray header or a duplicate album behind.
+        """
+        sent: List[int] = []
         try:
-            sent_header = await bot.send_message(
-                config["report_group_id"], header, disable_web_page_preview=True
-            )
-
-            if len(messages) > 1:
+            sent_header = await bot.send_message(report_group_id, header, disable_web_page_preview=True)
+            sent.append(sent_header.message_id)
+            if submission.is_album:
                 # Handle media group (album)
-                media = convert_messages_to_input_media(messages)
+                media = convert_messages_to_input_media(submission)
                 # Note: Inline keyboards can't be attached to media groups directly.
                 # We send the keyboard in a subsequent message.
-                await bot.send_media_group(chat_id=config["report_group_id"], media=media)
-                await bot.send_message(config["report_group_id"], "👇 گزینه‌های مدیریت برای آلبوم بالا 👇", reply_markup=keyboard)
+                sent_media = await bot.send_media_group(chat_id=report_group_id, media=media)
+                sent.extend(msg.message_id for msg in sent_media)
+                sent_keyboard = await bot.send_message(report_group_id, "👇 گزینه‌های مدیریت برای آلبوم بالا 👇", reply_markup=keyboard)
+                sent.append(sent_keyboard.message_id)
             else:
                 # Handle single message
-                single_message = messages[0]
-                await bot.copy_message(
-                    chat_id=config["report_group_id"],
-                    from_chat_id=single_message.chat.id,
-                    message_id=single_message.message_id,
+                sent_copy = await bot.copy_message(
+                    chat_id=report_group_id,
+                    from_chat_id=submission.chat_id,
+                    message_id=submission.message_ids[0],
                     reply_to_message_id=sent_header.message_id,
                     reply_markup=keyboard,
                 )
+                sent.append(sent_copy.message_id)
+            return sent
+        except Exception:
+            if sent:
+                try:
+                    await bot.delete_messages(chat_id=report_group_id, message_ids=sent)
+                except Exception as e:
+                    logging.warning(f"Could not remove a partly sent report: {e}")
+            raise
+
+    @staticmethod
+    async def forward_to_report_group(
+        bot: Bot,
+        submission: Submission,
+        header: str,
+        keyboard: Optional[InlineKeyboardMarkup],
+        config: Dict,
+    ) -> Optional[List[int]]:
+        """Like send_to_report_group(), but returns None on failure."""
+        try:
+            return await Broadcaster.send_to_report_group(bot, submission, header, keyboard, config["report_group_id"])
         except Exception as e:
             logging.error(f"Failed to forward message to report group: {e}")
+            return None
 
     @staticmethod
-    async def post_to_output_channel(
+    async def send_to_output_channel(
         bot: Bot,
-        messages: List[Message], # Now always a list
+        submission: Submission,
         subject: str,
         config: Dict,
-        loc_path: Path,
+        loc: Localization,
         is_regular_user_post: bool = False,
-    ):
-        """Posts a message or media group to the output channel."""
-        if not messages:
-            logging.error("post_to_output_channel called with an empty list of messages.")
-            return False
+    ) -> List[int]:
+        """Posts a message or media group to the output channel and returns the posted ids. Raises on failure."""
+        if not submission.message_ids:
+            raise ValueError("empty submission")
 
-        with open(loc_path, "r", encoding="utf-8") as f:
-            loc = json.load(f)
-
-        footer = loc["output_channel_footer"].format(
-            subject=subject, channel_id=config["output_channel_id"]
-        )
+        # A tenant may sign its channel's posts with its own footer
+        footer_template = config.get("footer")
+        if footer_template is not None:
+            footer = footer_template.format(subject=subject, channel_id=config["output_channel_id"])
+        else:
+            footer = loc.format(
+                "output_channel_footer", subject=subject, channel_id=config["output_channel_id"]
+            )
         tag = "\n#ارسالی" if is_regular_user_post else ""
+        # The user's own formatting is kept through entities, so nothing is parsed as HTML
+        entities = submission.entity_objects()
 
+        if submission.is_album:
+            # Handle Media Group (album)
+            base_caption = submission.caption or ""
+            final_caption = f"{base_caption}{footer}{tag}"
+            media = convert_messages_to_input_media(submission, final_caption, entities)
+            sent = await bot.send_media_group(chat_id=config["output_channel_id"], media=media)
+            return [message.message_id for message in sent]
+        elif submission.text:
+            # Handle Single Text Message
+            final_text = f"{submission.text}{footer}{tag}"
+            sent = await bot.send_message(
+                chat_id=config["output_channel_id"], text=final_text, entities=entities, parse_mode=None
+            )
+        else: # Single Media
+            base_caption = submission.caption or ""
+            final_caption = f"{base_caption}{footer}{tag}"
+            sent = await bot.copy_message(
+                chat_id=config["output_channel_id"],
+                from_chat_id=submission.chat_id,
+                message_id=submission.message_ids[0],
+                caption=final_caption,
+                caption_entities=entities,
+                parse_mode=None,
+            )
+        return [sent.message_id]
+
+    @staticmethod
+    async def post_to_output_channel(
+        bot: Bot,
+        submission: Submission,
+        subject: str,
+        config: Dict,
+        loc: Localization,
+        is_regular_user_post: bool = False,
+    ):
+        """Posts a message or media group to the output channel; without an outbox, the owner hears of failures directly."""
+        if not submission.message_ids:
+            logging.error("post_to_output_channel called with an empty submission.")
+            return False
         try:
-            if len(messages) > 1:
-                # Handle Media Group (album)
-                first_message = messages[0]
-                base_caption = first_message.caption if first_message.caption else ""
-                final_caption = f"{base_caption}{footer}{tag}"
-                media = convert_messages_to_input_media(messages, final_caption)
-                await bot.send_media_group(chat_id=config["output_channel_id"], media=media)
-            else:
-                # Handle Single Message
-                single_message = messages[0]
-                if single_message.text:
-                    final_text = f"{single_message.text}{footer}{tag}"
-                    await bot.send_message(chat_id=config["output_channel_id"], text=final_text)
-                else: # Single Media
-                    base_caption = single_message.caption if single_message.caption else ""
-                    final_caption = f"{base_caption}{footer}{tag}"
-                    await bot.copy_message(
-                        chat_id=config["output_channel_id"],
-                        from_chat_id=single_message.chat.id,
-                        message_id=single_message.message_id,
-                        caption=final_caption,
-                    )
+            await Broadcaster.send_to_output_channel(bot, submission, subject, config, loc, is_regular_user_post)
             return True
         except Exception as e:
             logging.error(f"Failed to post to output channel: {e}")
             await bot.send_message(config["owner_id"], f"Failed to post to channel. Error: {e}")
-            return False
\ No newline at end of file
+            return False
@@ -0,0 +1,383 @@
+# app/services/config.py
+
+import logging
+import re
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import yaml
+
+from app.services.log_pipeline import parse_rotation
+from app.services.publish_queue import parse_quiet_hours
+from app.services.rate_limiter import ALGORITHMS
+
+CHAT_ID_KEYS = ("owner_id", "report_group_id", "output_channel_id", "required_channel_id")
+# Chats each tenant has its own of; owner_id is shared by all tenants
+TENANT_CHAT_KEYS = ("report_group_id", "output_channel_id", "required_channel_id")
+
+# The tenant formed by the top-level chat IDs
+DEFAULT_TENANT = "default"
+# Tenant names double as /start deep-link payloads
+TENANT_NAME = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# Read once at startup; changing them in a reload takes effect after a restart
+RESTART_ONLY_KEYS = (
+    "database", "fsm", "webhook", "metrics", "logging", "media_groups", "membership_cache",
+    "dedup", "publish_queue", "send_limits", "moderation", "shared_state", "workers", "scheduler", "outbox",
+)
+
+
+class ConfigError(ValueError):
+    """config.yaml is missing keys or has invalid values; the message lists every problem."""
+
+
+@dataclass(frozen=True, slots=True)
+class RateLimitConfig:
+    limit: int
+    period: int
+    algorithm: str
+    max_tracked_users: int
+    # role -> (limit, period); a limit of 0 disables throttling for that role
+    roles: Dict[str, Tuple[int, int]]
+
+
+@dataclass(frozen=True)
+class Config(Mapping):
+    """
+    The validated contents of config.yaml. The chat IDs and rate limits are typed attributes;
+    it is also a read-only mapping of the raw sections, so config["x"] and config.get("x", {})
+    keep working. A reload builds a new Config rather than changing this one.
+
+    Each entry under `tenants` becomes a Config of its own (the top-level one with that
+    tenant's chats, limits and footer), looked up by name or by chat ID in O(1).
+    """
+    owner_id: int
+    report_group_id: int
+    output_channel_id: int
+    required_channel_id: int
+    rate_limit: RateLimitConfig
+    data: Dict[str, Any]
+    name: str = DEFAULT_TENANT
+    # The other tenants by name, and every tenant's report group and channels -> tenant name
+    tenants: Dict[str, "Config"] = field(default_factory=dict)
+    tenant_chats: Dict[int, str] = field(default_factory=dict)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def tenant(self, name: str) -> Optional["Config"]:
+        return self if name == self.name else self.tenants.get(name)
+
+    def tenant_for_chat(self, chat_id: int) -> Optional["Config"]:
+        """The tenant whose report group or channel `chat_id` is."""
+        name = self.tenant_chats.get(chat_id)
+        return self.tenant(name) if name is not None else None
+
+
+def tenant_config(config: Mapping, chat_id: int) -> Mapping:
+    """The config of the tenant owning `chat_id`, or `config` itself for single-tenant setups."""
+    if isinstance(config, Config):
+        return config.tenant_for_chat(chat_id) or config
+    return config
+
+
+class _Validator:
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self.errors: List[str] = []
+
+    def section(self, name: str) -> Dict[str, Any]:
+        value = self.data.get(name)
+        if value is None:
+            return {}
+        if not isinstance(value, dict):
+            self.errors.append(f"{name}: must be a mapping")
+            return {}
+        return value
+
+    def number(
+        self, section: Dict[str, Any], path: str, key: str, default: Any,
+        minimum: float = 0, integer: bool = False,
+    ) -> Any:
+        value = section.get(key, default)
+        kinds = (int,) if integer else (int, float)
+        if isinstance(value, bool) or not isinstance(value, kinds):
+            self.errors.append(f"{path}.{key}: must be {'an integer' if integer else 'a number'}, got {value!r}")
+            return default
+        if value < minimum:
+            self.errors.append(f"{path}.{key}: must be at least {minimum}, got {value!r}")
+            return default
+        return value
+
+    def choice(self, section: Dict[str, Any], path: str, key: str, default: str, choices) -> str:
+        value = section.get(key, default)
+        if value not in choices:
+            self.errors.append(f"{path}.{key}: must be one of {', '.join(map(str, choices))}, got {value!r}")
+            return default
+        return value
+
+    def check(self, path: str, check: Callable[[], Any]):
+        try:
+            check()
+        except (ValueError, TypeError, AttributeError) as e:
+            self.errors.append(f"{path}: {e}")
+
+
+def parse_config(data: Any) -> Config:
+    """Validates a loaded config.yaml; raises ConfigError listing every problem found."""
+    if not isinstance(data, dict):
+        raise ConfigError("config.yaml must contain a mapping of settings")
+    v = _Validator(data)
+
+    chat_ids = _parse_chat_ids(v, data, "", CHAT_ID_KEYS)
+    rate_limit_config = _parse_rate_limit(v, v.section("rate_limit"), "rate_limit")
+    _check_footer(v, data, "")
+
+    send_limits = v.section("send_limits")
+    for key in ("global_per_second", "private_per_second", "group_per_minute", "chat_burst"):
+        v.number(send_limits, "send_limits", key, 1, minimum=1e-9)
+    v.number(send_limits, "send_limits", "max_retries", 5, integer=True)
+
+    media_groups = v.section("media_groups")
+    for key in ("min_gap", "max_gap", "max_age"):
+        v.number(media_groups, "media_groups", key, 1, minimum=1e-9)
+    for key in ("max_albums", "max_items", "max_albums_per_user"):
+        v.number(media_groups, "media_groups", key, 1, minimum=1, integer=True)
+
+    moderation = v.section("moderation")
+    v.number(moderation, "moderation", "bulk_concurrency", 4, minimum=1, integer=True)
+    v.number(moderation, "moderation", "retention_days", 30, minimum=1e-9)
+
+    dedup = v.section("dedup")
+    v.choice(dedup, "dedup", "action", "flag", ("flag", "reject"))
+    v.number(dedup, "dedup", "retention_days", 30, minimum=1e-9)
+    v.number(dedup, "dedup", "max_entries", 500000, minimum=1, integer=True)
+    v.choice(dedup, "dedup", "max_distance", 3, (0, 1, 2, 3))
+    v.number(dedup, "dedup", "min_words", 8, integer=True)
+
+    publish_queue = v.section("publish_queue")
+    v.number(publish_queue, "publish_queue", "slot_spacing", 300)
+    v.number(publish_queue, "publish_queue", "per_hour", 0, integer=True)
+    v.number(publish_queue, "publish_queue", "utc_offset", 0, minimum=-12)
+    v.check("publish_queue.quiet_hours", lambda: parse_quiet_hours(publish_queue.get("quiet_hours")))
+
+    outbox = v.section("outbox")
+    for key, default in (("max_attempts", 10), ("breaker_threshold", 5)):
+        v.number(outbox, "outbox", key, default, minimum=1, integer=True)
+    for key, default in (("base_delay", 2), ("max_delay", 600), ("breaker_cooldown", 60), ("alert_interval", 300)):
+        v.number(outbox, "outbox", key, default, minimum=1e-9)
+
+    membership_cache = v.section("membership_cache")
+    v.number(membership_cache, "membership_cache", "ttl", 300)
+    v.number(membership_cache, "membership_cache", "max_size", 10000, minimum=1, integer=True)
+
+    webhook = v.section("webhook")
+    if webhook.get("enabled"):
+        v.number(webhook, "webhook", "port", 8080, minimum=1, integer=True)
+        v.number(webhook, "webhook", "max_concurrent_updates", 100, minimum=1, integer=True)
+        if not str(webhook.get("path", "/webhook")).startswith("/"):
+            v.errors.append("webhook.path: must start with '/'")
+
+    metrics = v.section("metrics")
+    if metrics.get("enabled"):
+        v.number(metrics, "metrics", "port", 9090, minimum=1, integer=True)
+
+    shared_state = v.section("shared_state")
+    if shared_state.get("enabled"):
+        v.choice(shared_state, "shared_state", "backend", "redis", ("redis", "memory"))
+        if not str(shared_state.get("url", "redis://localhost:6379/0")).startswith("redis://"):
+            v.errors.append("shared_state.url: must look like redis://[:password@]host[:port][/db]")
+        v.number(shared_state, "shared_state", "pool_size", 4, minimum=1, integer=True)
+        v.number(shared_state, "shared_state", "timeout", 5.0, minimum=1e-9)
+        v.number(shared_state, "shared_state", "album_settle", 1.5)
+
+    scheduler = v.section("scheduler")
+    for key, default in (("max_concurrent_updates", 100), ("max_pending", 10000), ("max_pending_per_user", 20)):
+        v.number(scheduler, "scheduler", key, default, minimum=1, integer=True)
+
+    workers = v.section("workers")
+    if v.number(workers, "workers", "count", 0, integer=True) > 1:
+        v.number(workers, "workers", "queue_size", 1000, minimum=1, integer=True)
+        v.number(workers, "workers", "max_concurrent_updates", 100, minimum=1, integer=True)
+
+    fsm = v.section("fsm")
+    v.choice(fsm, "fsm", "backend", "memory", ("memory", "sqlite"))
+    v.number(fsm, "fsm", "ttl", 86400)
+    v.number(fsm, "fsm", "flush_interval", 1.0, minimum=1e-9)
+    v.number(fsm, "fsm", "cache_size", 10000, integer=True)
+
+    log_config = v.section("logging")
+    v.choice(
+        log_config, "logging", "level", "INFO",
+        ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL", "debug", "info", "warning", "error", "critical"),
+    )
+    v.choice(log_config, "logging", "format", "text", ("text", "json"))
+    v.check("logging.rotation", lambda: parse_rotation(log_config.get("rotation", "10 MB")))
+    v.number(log_config, "logging", "backup_count", 5, integer=True)
+    v.number(log_config, "logging", "queue_size", 10000, minimum=1, integer=True)
+
+    tenants = _parse_tenants(v, data, chat_ids, rate_limit_config)
+
+    if v.errors:
+        raise ConfigError("Invalid configuration:\n" + "\n".join(f"- {error}" for error in v.errors))
+    tenant_chats: Dict[int, str] = {}
+    # Report groups and output channels are unique per tenant; a required channel may be shared
+    for keys in (("report_group_id", "output_channel_id"), ("required_channel_id",)):
+        for name, ids in [(DEFAULT_TENANT, chat_ids), *tenants.items()]:
+            for key in keys:
+                tenant_chats.setdefault(ids[key], name)
+    return Config(
+        **chat_ids, rate_limit=rate_limit_config, data=data, tenants=tenants, tenant_chats=tenant_chats
+    )
+
+
+def _parse_chat_ids(v: _Validator, section: Dict[str, Any], path: str, keys) -> Dict[str, Any]:
+    chat_ids = {}
+    for key in keys:
+        value = section.get(key)
+        if isinstance(value, bool) or not isinstance(value, int):
+            v.errors.append(f"{path}{key}: required numeric ID, got {value!r}")
+        chat_ids[key] = value
+    return chat_ids
+
+
+def _parse_rate_limit(v: _Validator, rate_limit: Dict[str, Any], path: str) -> RateLimitConfig:
+    limit = v.number(rate_limit, path, "limit", 5, integer=True)
+    period = v.number(rate_limit, path, "period", 3600, minimum=1, integer=True)
+    roles = {}
+    role_section = rate_limit.get("roles") or {}
+    if not isinstance(role_section, dict):
+        v.errors.append(f"{path}.roles: must be a mapping")
+        role_section = {}
+    for role, limits in role_section.items():
+        if not isinstance(limits, dict):
+            v.errors.append(f"{path}.roles.{role}: must be a mapping")
+            continue
+        roles[role] = (
+            v.number(limits, f"{path}.roles.{role}", "limit", limit, integer=True),
+            v.number(limits, f"{path}.roles.{role}", "period", period, minimum=1, integer=True),
+        )
+    return RateLimitConfig(
+        limit=limit,
+        period=period,
+        algorithm=v.choice(rate_limit, path, "algorithm", "gcra", tuple(ALGORITHMS)),
+        max_tracked_users=v.number(rate_limit, path, "max_tracked_users", 100_000, minimum=1, integer=True),
+        roles=roles,
+    )
+
+
+def _check_footer(v: _Validator, section: Dict[str, Any], path: str):
+    footer = section.get("footer")
+    if footer is None:
+        return
+    if not isinstance(footer, str):
+        v.errors.append(f"{path}footer: must be a string")
+        return
+    v.check(f"{path}footer", lambda: footer.format(subject="", channel_id=0))
+
+
+def _parse_tenants(
+    v: _Validator, data: Dict[str, Any], chat_ids: Dict[str, Any], rate_limit: RateLimitConfig
+) -> Dict[str, Config]:
+    entries = data.get("tenants") or []
+    if not isinstance(entries, list):
+        v.errors.append("tenants: must be a list")
+        return {}
+    shared = {key: value for key, value in data.items() if key != "tenants"}
+    # Report groups and output channels identify the tenant, so no two tenants may share one
+    owners = {chat_ids[key]: DEFAULT_TENANT for key in ("report_group_id", "output_channel_id")}
+    tenants: Dict[str, Config] = {}
+    for index, entry in enumerate(entries):
+        path = f"tenants[{index}]."
+        if not isinstance(entry, dict):
+            v.errors.append(f"tenants[{index}]: must be a mapping")
+            continue
+        name = entry.get("name")
+        if not isinstance(name, str) or not TENANT_NAME.fullmatch(name):
+            v.errors.append(f"{path}name: required, letters, digits, '_' and '-' only, got {name!r}")
+            continue
+        if name == DEFAULT_TENANT or name in tenants:
+            v.errors.append(f"{path}name: {name!r} is already used")
+            continue
+        ids = _parse_chat_ids(v, entry, path, TENANT_CHAT_KEYS)
+        for key in ("report_group_id", "output_channel_id"):
+            owner = owners.setdefault(ids[key], name)
+            if owner != name:
+                v.errors.append(f"{path}{key}: {ids[key]} already belongs to tenant {owner!r}")
+        _check_footer(v, entry, path)
+
+        tenant_rate_limit = rate_limit
+        if entry.get("rate_limit") is not None:
+            if isinstance(entry["rate_limit"], dict):
+                # Unset keys fall back to the top-level rate_limit section
+                merged = {**(data.get("rate_limit") or {}), **entry["rate_limit"]}
+                tenant_rate_limit = _parse_rate_limit(v, merged, f"{path}rate_limit")
+            else:
+                v.errors.append(f"{path}rate_limit: must be a mapping")
+
+        tenant_data = {
+            **shared, **ids,
+            "rate_limit": {**(data.get("rate_limit") or {}), **(entry.get("rate_limit") or {})},
+            "admins_file": entry.get("admins_file", f"admins-{name}.json"),
+        }
+        if "footer" in entry:
+            tenant_data["footer"] = entry["footer"]
+        tenants[name] = Config(
+            owner_id=chat_ids["owner_id"], **ids, rate_limit=tenant_rate_limit, data=tenant_data, name=name
+        )
+    return tenants
+
+
+def load_config(path: Path) -> Config:
+    with open(path, "r") as f:
+        try:
+            data = yaml.safe_load(f)
+        except yaml.YAMLError as e:
+            raise ConfigError(f"{path} is not valid YAML: {e}") from e
+    return parse_config(data)
+
+
+class ConfigManager:
+    """
+    Holds the current Config and swaps in a new one on reload(). Readers take the `current`
+    reference once (per update, see ConfigMiddleware), so a reload never mixes two versions.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.current = load_config(path)
+        self._listeners: List[Callable[[Config], None]] = []
+
+    def subscribe(self, listener: Callable[[Config], None]):
+        """Calls listener(new_config) after every successful reload."""
+        self._listeners.append(listener)
+
+    def reload(self) -> List[str]:
+        """
+        Loads and validates the file again and makes it current. Raises ConfigError and keeps
+        the running config if the file is invalid. Returns the changed keys that need a restart.
+        """
+        new = load_config(self.path)
+        old, self.current = self.current, new
+        for listener in self._listeners:
+            try:
+                listener(new)
+            except Exception as e:
+                logging.error(f"Failed to apply reloaded config: {e}")
+        restart_needed = [key for key in RESTART_ONLY_KEYS if old.get(key) != new.get(key)]
+        if old.rate_limit.algorithm != new.rate_limit.algorithm:
+            restart_needed.append("rate_limit.algorithm")
+        if old.rate_limit.max_tracked_users != new.rate_limit.max_tracked_users:
+            restart_needed.append("rate_limit.max_tracked_users")
+        logging.info(f"Configuration reloaded from {self.path}.")
+        if restart_needed:
+            logging.warning(f"Changed settings that take effect after a restart: {', '.join(restart_needed)}")
+        return restart_needed
@@ -0,0 +1,259 @@
+# app/services/dedup.py
+
+import hashlib
+import json
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from app.utils.sqlite import SQLiteDatabase
+from app.utils.submission import Submission
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dedup_index (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    text_hash INTEGER,
+    simhash INTEGER,
+    file_ids TEXT NOT NULL
+);
+"""
+
+MATCH_MEDIA = "media"      # Same photo/video/file, whatever the caption says
+MATCH_TEXT = "text"        # Same text after normalization
+MATCH_SIMILAR = "similar"  # Text within `max_distance` bits of SimHash
+
+SIMHASH_BITS = 64
+# The 64 bits are split into bands; two signatures within 3 bits share at least one band exactly
+BANDS = 4
+BAND_BITS = SIMHASH_BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+# With more differing bits than bands, every band could hold one of them and a near-duplicate be missed
+MAX_DISTANCE = BANDS - 1
+
+# Arabic letter forms that are typed interchangeably with the Persian ones
+_CHAR_MAP = str.maketrans({"ي": "ی", "ى": "ی", "ك": "ک", "ة": "ه", "ۀ": "ه", "أ": "ا", "إ": "ا", "آ": "ا"})
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+@dataclass(slots=True)
+class DedupEntry:
+    id: int
+    user_id: int
+    created_at: float
+    text_hash: Optional[int]
+    simhash: Optional[int]
+    file_ids: Tuple[str, ...]
+
+
+@dataclass(slots=True)
+class DuplicateMatch:
+    reason: str
+    entry: DedupEntry
+    distance: int = 0
+
+
+def normalize_text(text: str) -> str:
+    """Lowercases, unifies Arabic/Persian letters and drops diacritics, punctuation and extra spaces."""
+    text = unicodedata.normalize("NFKC", text).translate(_CHAR_MAP).lower()
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def simhash(normalized: str) -> int:
+    """64-bit SimHash over the words and word pairs of a normalized text."""
+    words = normalized.split()
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not features:
+        return 0
+    # Column-wise bit counts: zip(*bit strings) yields one column per bit position
+    bits = [format(_hash64(feature), "064b") for feature in features]
+    half = len(bits) / 2
+    signature = 0
+    for column in zip(*bits):
+        signature = (signature << 1) | (column.count("1") > half)
+    return signature
+
+
+def _to_signed(value: Optional[int]) -> Optional[int]:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value is not None and value >= 1 << 63 else value
+
+
+def _from_signed(value: Optional[int]) -> Optional[int]:
+    return value + (1 << 64) if value is not None and value < 0 else value
+
+
+def _insert(connection: sqlite3.Connection, user_id: int, created_at: float, text_hash, signature, file_ids: str) -> int:
+    with connection:
+        cursor = connection.execute(
+            "INSERT INTO dedup_index (user_id, created_at, text_hash, simhash, file_ids) VALUES (?, ?, ?, ?, ?)",
+            (user_id, created_at, _to_signed(text_hash), _to_signed(signature), file_ids),
+        )
+    return cursor.lastrowid
+
+
+def _delete_up_to(connection: sqlite3.Connection, last_id: int):
+    with connection:
+        connection.execute("DELETE FROM dedup_index WHERE id <= ?", (last_id,))
+
+
+class DedupIndex:
+    """
+    Remembers recent submissions to spot resubmissions: by media file_unique_id, by a hash of
+    the normalized text, and by SimHash for near-identical text. SimHash candidates come from
+    LSH bands, so every lookup is a handful of dictionary hits regardless of the index size.
+    Entries older than `retention` seconds, or beyond `max_entries`, are dropped oldest first.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        retention: float = 30 * 86400,
+        max_entries: int = 500_000,
+        max_distance: int = 3,
+        min_words: int = 8,
+        clock: Callable[[], float] = time.time,
+    ):
+        if not 0 <= max_distance <= MAX_DISTANCE:
+            raise ValueError(f"max_distance must be between 0 and {MAX_DISTANCE}, got {max_distance}")
+        self.db = SQLiteDatabase(path)
+        self.db.execute_script(SCHEMA)
+        self.retention = retention
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        # Short texts ("hi", "test") are only matched exactly; their SimHash says little
+        self.min_words = min_words
+        self.clock = clock
+        # Insertion order is age order, which makes eviction a popitem() from the front
+        self._entries: "OrderedDict[int, DedupEntry]" = OrderedDict()
+        self._by_file: Dict[str, int] = {}
+        self._by_text: Dict[int, int] = {}
+        self._bands: List[Dict[int, List[int]]] = [{} for _ in range(BANDS)]
+        self._load()
+
+    def _load(self):
+        cutoff = self.clock() - self.retention
+        rows = self.db.connection.execute(
+            "SELECT id, user_id, created_at, text_hash, simhash, file_ids FROM dedup_index "
+            "WHERE created_at >= ? ORDER BY id",
+            (cutoff,),
+        ).fetchall()
+        for row in rows[-self.max_entries:]:
+            self._index(DedupEntry(
+                id=row[0],
+                user_id=row[1],
+                created_at=row[2],
+                text_hash=_from_signed(row[3]),
+                simhash=_from_signed(row[4]),
+                file_ids=tuple(json.loads(row[5])),
+            ))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _signatures(self, submission: Submission) -> Tuple[Optional[int], Optional[int]]:
+        text = submission.text or submission.caption
+        if not text:
+            return None, None
+        normalized = normalize_text(text)
+        if not normalized:
+            return None, None
+        signature = simhash(normalized) if len(normalized.split()) >= self.min_words else None
+        return _hash64(normalized), signature
+
+    def check(self, submission: Submission) -> Optional[DuplicateMatch]:
+        """Returns the earlier submission this one duplicates, if any."""
+        for item in submission.media:
+            entry_id = self._by_file.get(item.file_unique_id)
+            if entry_id is not None:
+                return DuplicateMatch(MATCH_MEDIA, self._entries[entry_id])
+
+        text_hash, signature = self._signatures(submission)
+        if text_hash is not None:
+            entry_id = self._by_text.get(text_hash)
+            if entry_id is not None:
+                return DuplicateMatch(MATCH_TEXT, self._entries[entry_id])
+        if signature is not None:
+            return self._nearest(signature)
+        return None
+
+    def _nearest(self, signature: int) -> Optional[DuplicateMatch]:
+        best: Optional[DuplicateMatch] = None
+        seen = set()
+        for band, buckets in enumerate(self._bands):
+            for entry_id in buckets.get((signature >> (band * BAND_BITS)) & BAND_MASK, ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                entry = self._entries[entry_id]
+                distance = (entry.simhash ^ signature).bit_count()
+                if distance <= self.max_distance and (best is None or distance < best.distance):
+                    best = DuplicateMatch(MATCH_SIMILAR, entry, distance)
+        return best
+
+    async def add(self, submission: Submission) -> DedupEntry:
+        text_hash, signature = self._signatures(submission)
+        file_ids = tuple(item.file_unique_id for item in submission.media)
+        created_at = self.clock()
+        entry_id = await self.db.run(
+            _insert, submission.user_id, created_at, text_hash, signature, json.dumps(file_ids)
+        )
+        entry = DedupEntry(entry_id, submission.user_id, created_at, text_hash, signature, file_ids)
+        self._index(entry)
+        last_evicted = self._evict()
+        if last_evicted is not None:
+            await self.db.run(_delete_up_to, last_evicted)
+        return entry
+
+    def _index(self, entry: DedupEntry):
+        self._entries[entry.id] = entry
+        # Newer entries win, so matches point at the most recent copy
+        for file_id in entry.file_ids:
+            self._by_file[file_id] = entry.id
+        if entry.text_hash is not None:
+            self._by_text[entry.text_hash] = entry.id
+        if entry.simhash is not None:
+            for band, buckets in enumerate(self._bands):
+                buckets.setdefault((entry.simhash >> (band * BAND_BITS)) & BAND_MASK, []).append(entry.id)
+
+    def _unindex(self, entry: DedupEntry):
+        for file_id in entry.file_ids:
+            if self._by_file.get(file_id) == entry.id:
+                del self._by_file[file_id]
+        if entry.text_hash is not None and self._by_text.get(entry.text_hash) == entry.id:
+            del self._by_text[entry.text_hash]
+        if entry.simhash is not None:
+            for band, buckets in enumerate(self._bands):
+                key = (entry.simhash >> (band * BAND_BITS)) & BAND_MASK
+                bucket = buckets[key]
+                # Oldest entries sit at the front of their buckets
+                bucket.remove(entry.id)
+                if not bucket:
+                    del buckets[key]
+
+    def _evict(self) -> Optional[int]:
+        """Drops expired entries and the overflow; returns the highest evicted id."""
+        cutoff = self.clock() - self.retention
+        last_evicted = None
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if entry.created_at >= cutoff and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+            self._unindex(entry)
+            last_evicted = entry_id
+        return last_evicted
+
+    async def close(self):
+        await self.db.close()
@@ -0,0 +1,225 @@
+# app/services/fsm_storage.py
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple, Union
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from app.services.shared_state import SharedState
+from app.utils.sqlite import SQLiteDatabase
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fsm_updated_at ON fsm (updated_at);
+"""
+
+
+class _Record:
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], updated_at: float):
+        self.state = state
+        self.data = data
+        self.updated_at = updated_at
+
+    @property
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+def _key(key: StorageKey) -> str:
+    parts = [key.bot_id, key.chat_id, key.user_id, key.thread_id or "", key.destiny]
+    business_connection_id = getattr(key, "business_connection_id", None)
+    if business_connection_id:
+        parts.append(business_connection_id)
+    return ":".join(str(part) for part in parts)
+
+
+def _flush_batch(connection: sqlite3.Connection, batch: List[Tuple[str, _Record]], expire_before: Optional[float]):
+    upserts = []
+    deletes = []
+    for key, record in batch:
+        if record.is_empty:
+            deletes.append((key,))
+        else:
+            upserts.append((key, record.state, json.dumps(record.data, ensure_ascii=False), record.updated_at))
+    with connection:
+        if upserts:
+            connection.executemany(
+                "INSERT INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state=excluded.state, data=excluded.data, updated_at=excluded.updated_at",
+                upserts,
+            )
+        if deletes:
+            connection.executemany("DELETE FROM fsm WHERE key = ?", deletes)
+        if expire_before is not None:
+            connection.execute("DELETE FROM fsm WHERE updated_at < ?", (expire_before,))
+
+
+def _load(connection: sqlite3.Connection, key: str) -> Optional[Tuple[Optional[str], str, float]]:
+    return connection.execute("SELECT state, data, updated_at FROM fsm WHERE key = ?", (key,)).fetchone()
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM storage on SQLite (WAL mode) so conversations survive restarts.
+    Writes are buffered and flushed in batches; hot keys are served from an LRU cache;
+    conversations idle for longer than `ttl` seconds are discarded.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        ttl: float = 86400,
+        flush_interval: float = 1.0,
+        max_batch: int = 500,
+        cache_size: int = 10000,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.db = SQLiteDatabase(path)
+        self.db.execute_script(SCHEMA)
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self.clock = clock
+        self._cache: "OrderedDict[str, _Record]" = OrderedDict()
+        self._dirty: Dict[str, _Record] = {}
+        self._flush_requested = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+
+    async def _get_record(self, key: StorageKey) -> _Record:
+        db_key = _key(key)
+        now = self.clock()
+        record = self._dirty.get(db_key) or self._cache.get(db_key)
+        if record is None:
+            row = await self.db.run(_load, db_key)
+            # Another coroutine may have written the key while we were reading
+            record = self._dirty.get(db_key) or self._cache.get(db_key)
+            if record is None:
+                if row is not None:
+                    record = _Record(row[0], json.loads(row[1]), row[2])
+                else:
+                    record = _Record(None, {}, now)
+        if not record.is_empty and record.updated_at + self.ttl < now:
+            record = _Record(None, {}, now)
+        self._remember(db_key, record)
+        return record
+
+    def _remember(self, db_key: str, record: _Record):
+        self._cache[db_key] = record
+        self._cache.move_to_end(db_key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _mark_dirty(self, key: StorageKey, record: _Record):
+        db_key = _key(key)
+        record.updated_at = self.clock()
+        self._remember(db_key, record)
+        self._dirty[db_key] = record
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+        if len(self._dirty) >= self.max_batch:
+            self._flush_requested.set()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get_record(key)
+        state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key, _Record(state, record.data, record.updated_at))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get_record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        record = await self._get_record(key)
+        self._mark_dirty(key, _Record(record.state, dict(data), record.updated_at))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._get_record(key)).data)
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Failed to flush FSM storage: {e}")
+
+    async def flush(self):
+        """Writes buffered changes and purges expired conversations."""
+        now = self.clock()
+        expire_before = None
+        if now - self._last_purge >= self.ttl / 10:
+            expire_before = now - self.ttl
+            self._last_purge = now
+        if not self._dirty and expire_before is None:
+            return
+        batch, self._dirty = self._dirty, {}
+        try:
+            await self.db.run(_flush_batch, list(batch.items()), expire_before)
+        except Exception:
+            # Put the batch back unless the keys were rewritten meanwhile
+            for db_key, record in batch.items():
+                self._dirty.setdefault(db_key, record)
+            raise
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        await self.db.close()
+
+
+class SharedStateStorage(BaseStorage):
+    """
+    FSM storage in the shared state backend, so a conversation can continue on any replica.
+    State and data are separate keys, each written in one step; both expire after `ttl`
+    seconds without a write, like SQLiteStorage. Nothing is cached: another replica may
+    have moved the conversation on since the last read.
+    """
+
+    def __init__(self, state: SharedState, ttl: float = 86400):
+        self.state = state
+        self.ttl = ttl
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        if state is None:
+            await self.state.delete(f"fsm:{_key(key)}:state")
+        else:
+            await self.state.set(f"fsm:{_key(key)}:state", state, self.ttl)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self.state.get(f"fsm:{_key(key)}:state")
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not data:
+            await self.state.delete(f"fsm:{_key(key)}:data")
+        else:
+            await self.state.set(f"fsm:{_key(key)}:data", json.dumps(dict(data), ensure_ascii=False), self.ttl)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        data = await self.state.get(f"fsm:{_key(key)}:data")
+        return json.loads(data) if data else {}
+
+    async def close(self) -> None:
+        # The shared state connection is closed by its owner; other components still use it
+        pass
@@ -0,0 +1,131 @@
+# app/services/localization.py
+
+import json
+import logging
+import string
+import time
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Optional
+
+# Every string the bot uses, mapped to the placeholders its template may contain.
+REQUIRED_KEYS: Dict[str, FrozenSet[str]] = {
+    "welcome": frozenset(),
+    "not_admin": frozenset(),
+    "must_be_member": frozenset({"channel_link"}),
+    "ask_for_subject": frozenset(),
+    "subject_timeout": frozenset(),
+    "submission_received": frozenset(),
+    "submission_failed": frozenset(),
+    "admin_added": frozenset({"alias", "user_id"}),
+    "admin_removed": frozenset({"user_id"}),
+    "admin_not_found": frozenset({"user_id"}),
+    "invalid_command_format": frozenset({"example"}),
+    "permission_denied_callback": frozenset(),
+    "report_message_header": frozenset({"user_id", "role", "subject", "message_type", "timestamp"}),
+    "duplicate_flag": frozenset({"reason", "submitter_id", "date"}),
+    "duplicate_rejected": frozenset(),
+    "report_approved_log": frozenset({"admin_alias", "admin_id", "submitter_id", "timestamp"}),
+    "report_deleted_log": frozenset({"admin_alias", "admin_id", "submitter_id", "timestamp"}),
+    "bulk_approved_log": frozenset({"admin_alias", "admin_id", "count", "failed", "timestamp"}),
+    "bulk_deleted_log": frozenset({"admin_alias", "admin_id", "count", "timestamp"}),
+    "admin_direct_post_log": frozenset({"admin_alias", "admin_id", "timestamp"}),
+    "output_channel_footer": frozenset({"subject", "channel_id"}),
+    "json_validation_error": frozenset(),
+    "large_file_error": frozenset(),
+    "media_group_busy": frozenset(),
+    "rate_limit_exceeded": frozenset(),
+    "choose_tenant": frozenset(),
+    "tenant_selected": frozenset({"name"}),
+}
+
+_formatter = string.Formatter()
+
+
+class Template:
+    """A localization string parsed once at load time."""
+
+    __slots__ = ("text", "fields", "_literal")
+
+    def __init__(self, key: str, text: str, allowed: FrozenSet[str]):
+        self.text = text
+        fields = set()
+        literals = []
+        try:
+            for literal, field_name, format_spec, conversion in _formatter.parse(text):
+                literals.append(literal)
+                if field_name is None:
+                    continue
+                if field_name not in allowed or format_spec or conversion:
+                    raise ValueError(f"Unexpected placeholder '{{{field_name}}}' in '{key}'")
+                fields.add(field_name)
+        except ValueError as e:
+            raise ValueError(f"Bad template for '{key}': {e}") from e
+        self.fields = frozenset(fields)
+        # Templates without placeholders are returned as-is, with braces already unescaped.
+        self._literal = "".join(literals) if not fields else None
+
+    def format(self, **kwargs: Any) -> str:
+        if self._literal is not None:
+            return self._literal
+        return self.text.format_map(kwargs)
+
+
+class Localization:
+    """Loads the language file once and reloads it when its mtime changes."""
+
+    def __init__(self, path: Path, reload_interval: float = 5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._mtime = self.path.stat().st_mtime
+        self._templates = self._load()
+        self._next_check = time.monotonic() + reload_interval
+
+    def _load(self) -> Dict[str, Template]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+
+        missing = [key for key in REQUIRED_KEYS if key not in raw]
+        if missing:
+            raise ValueError(f"Missing keys in {self.path}: {', '.join(missing)}")
+
+        return {
+            key: Template(key, text, REQUIRED_KEYS.get(key, frozenset()))
+            for key, text in raw.items()
+        }
+
+    def reload_if_changed(self) -> bool:
+        """Re-reads the file if it was modified. A broken file keeps the old catalog."""
+        try:
+            mtime = self.path.stat().st_mtime
+            if mtime == self._mtime:
+                return False
+            self._mtime = mtime
+            self._templates = self._load()
+        except (OSError, ValueError) as e:
+            logging.error(f"Failed to reload {self.path}, keeping previous strings: {e}")
+            return False
+        logging.info(f"Reloaded localization from {self.path}.")
+        return True
+
+    def _template(self, key: str) -> Optional[Template]:
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.reload_interval
+            self.reload_if_changed()
+        return self._templates.get(key)
+
+    def __getitem__(self, key: str) -> str:
+        template = self._template(key)
+        if template is None:
+            raise KeyError(key)
+        return template.text
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        template = self._template(key)
+        return template.text if template is not None else default
+
+    def format(self, key: str, **kwargs: Any) -> str:
+        template = self._template(key)
+        if template is None:
+            raise KeyError(key)
+        return template.format(**kwargs)
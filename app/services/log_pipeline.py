@@ -0,0 +1,171 @@
+# app/services/log_pipeline.py
+
+import contextvars
+import copy
+import json
+import logging
+import queue
+import re
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import Any, Dict, List, Optional, Tuple
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s%(context)s"
+
+# Fields attached to every record logged while an update is being handled
+CONTEXT_FIELDS = ("update_id", "user_id", "role", "handler")
+
+_TRACEBACK_FORMATTER = logging.Formatter()
+
+_log_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("log_context", default={})
+
+_SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+_SIZE = re.compile(r"(\d+(?:\.\d+)?)\s*(B|KB|MB|GB)")
+# Period -> (TimedRotatingFileHandler `when`, interval multiplier)
+_PERIODS = {"second": ("S", 1), "minute": ("M", 1), "hour": ("H", 1), "day": ("D", 1), "week": ("D", 7)}
+_PERIOD = re.compile(r"(\d+)\s*(second|minute|hour|day|week)s?")
+_NAMED_PERIODS = {"hourly": ("H", 1), "daily": ("MIDNIGHT", 1), "midnight": ("MIDNIGHT", 1), "weekly": ("W0", 1)}
+
+
+def bind_log_context(**fields: Any) -> contextvars.Token:
+    """Adds fields to the records logged from here on in this task; undo with reset_log_context()."""
+    return _log_context.set({**_log_context.get(), **fields})
+
+
+def reset_log_context(token: contextvars.Token):
+    _log_context.reset(token)
+
+
+def parse_rotation(rotation: str) -> Tuple[str, Any]:
+    """
+    Parses the `rotation` setting: a size ("500 KB", "10 MB", "1 GB") gives ("size", bytes);
+    a period ("hourly", "daily", "weekly", "12 hours", "7 days") gives ("time", (when, interval)).
+    """
+    value = str(rotation).strip()
+    size = _SIZE.fullmatch(value.upper())
+    if size:
+        return "size", int(float(size.group(1)) * _SIZE_UNITS[size.group(2)])
+    value = value.lower()
+    if value in _NAMED_PERIODS:
+        return "time", _NAMED_PERIODS[value]
+    period = _PERIOD.fullmatch(value)
+    if period:
+        when, multiplier = _PERIODS[period.group(2)]
+        return "time", (when, int(period.group(1)) * multiplier)
+    raise ValueError(f"Unknown log rotation {rotation!r}; use a size like '10 MB' or a period like 'daily'.")
+
+
+def create_file_handler(path: str, rotation: str, backup_count: int = 5) -> logging.Handler:
+    kind, value = parse_rotation(rotation)
+    if kind == "size":
+        return RotatingFileHandler(path, maxBytes=value, backupCount=backup_count, encoding="utf-8")
+    when, interval = value
+    return TimedRotatingFileHandler(path, when=when, interval=interval, backupCount=backup_count, encoding="utf-8")
+
+
+class ContextFilter(logging.Filter):
+    """Copies the current log context onto the record, on the thread that logs it, before it is queued."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get()
+        for name in CONTEXT_FIELDS:
+            setattr(record, name, context.get(name))
+        present = [f"{name}={context[name]}" for name in CONTEXT_FIELDS if context.get(name) is not None]
+        record.context = f" [{' '.join(present)}]" if present else ""
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the context fields as keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name in CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Puts records on a bounded queue for the listener thread. When the queue is full the record
+    is dropped instead of blocking the event loop; the count is logged once there is room again.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._unreported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments and render the traceback now: the formatters run on the listener
+        # thread, and a traceback keeps its frames (and their locals) alive until then
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _TRACEBACK_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+            return
+        if self._unreported:
+            notice = logging.LogRecord(
+                "app.logging", logging.WARNING, __file__, 0,
+                f"Dropped {self._unreported} log records: the log queue was full.", None, None,
+            )
+            ContextFilter().filter(notice)
+            try:
+                self.queue.put_nowait(notice)
+                self._unreported = 0
+            except queue.Full:
+                pass
+
+
+class BackgroundListener(QueueListener):
+    """QueueListener whose stop() waits for room in a full queue and may be called twice."""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+
+def start_queue_logging(
+    handlers: List[logging.Handler], queue_size: int = 10000
+) -> Tuple[DroppingQueueHandler, BackgroundListener]:
+    """
+    Starts a listener thread that feeds `handlers` and returns the handler to attach to loggers.
+    Only the queue put happens on the caller's thread; formatting and file I/O happen on the listener's.
+    """
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    listener = BackgroundListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return queue_handler, listener
+
+
+def create_formatter(log_format: Optional[str]) -> logging.Formatter:
+    if (log_format or "text") == "json":
+        return JsonFormatter()
+    return logging.Formatter(TEXT_FORMAT)
@@ -0,0 +1,239 @@
+# app/services/media_groups.py
+
+import asyncio
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from enum import Enum
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from aiogram.types import Message
+
+from app.services.shared_state import SharedState
+
+# Telegram never puts more than 10 items in one album
+MAX_ALBUM_SIZE = 10
+
+AlbumKey = Tuple[int, int, str]
+OnComplete = Callable[[List[Message]], Awaitable[None]]
+
+
+class AddResult(Enum):
+    ADDED = "added"
+    REJECTED = "rejected"            # First item of an album that doesn't fit
+    REJECTED_AGAIN = "rejected_again"  # Later items of an already rejected album
+    LATE = "late"                    # Item of an album that was already processed; dropped
+
+
+class _Album:
+    __slots__ = ("messages", "on_complete", "first_at", "last_at", "timer")
+
+    def __init__(self, on_complete: OnComplete, now: float):
+        self.messages: List[Message] = []
+        self.on_complete = on_complete
+        self.first_at = now
+        self.last_at = now
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MediaGroupAggregator:
+    """
+    Collects the messages of an album (media group), keyed per chat and user, and hands
+    the complete album to a callback. An album is finished as soon as it holds 10 items,
+    or when no new item arrived for an adaptive gap derived from its arrival rate.
+    The number of albums and items held at once is capped, globally and per user.
+    """
+
+    def __init__(
+        self,
+        min_gap: float = 0.3,
+        max_gap: float = 1.5,
+        max_age: float = 10.0,
+        max_albums: int = 1000,
+        max_items: int = 5000,
+        max_albums_per_user: int = 2,
+    ):
+        self.min_gap = min_gap
+        self.max_gap = max_gap
+        self.max_age = max_age
+        self.max_albums = max_albums
+        self.max_items = max_items
+        self.max_albums_per_user = max_albums_per_user
+        self.clock = time.monotonic
+        self._albums: Dict[AlbumKey, _Album] = {}
+        self._per_user: Dict[int, int] = {}
+        self._items = 0
+        # Remember recently rejected albums so their remaining items are rejected too
+        self._rejected: "OrderedDict[AlbumKey, None]" = OrderedDict()
+        # Recently finished albums -> when they are forgotten; a straggler must not start a new album
+        self._finished: "OrderedDict[AlbumKey, float]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        # Counters for monitoring
+        self.completed = 0
+        self.rejected = 0
+        self.late = 0
+        self.wait_total = 0.0
+
+    def __len__(self) -> int:
+        return len(self._albums)
+
+    @property
+    def items(self) -> int:
+        return self._items
+
+    def add(self, message: Message, on_complete: OnComplete) -> AddResult:
+        """Adds one album item. `on_complete` of the album's first item receives the full album."""
+        key = (message.chat.id, message.from_user.id, message.media_group_id)
+        if key in self._rejected:
+            return AddResult.REJECTED_AGAIN
+
+        now = self.clock()
+        if self._finished.get(key, 0.0) > now:
+            self.late += 1
+            logging.info(f"Dropped an item of media group {message.media_group_id} that arrived after it was processed.")
+            return AddResult.LATE
+        album = self._albums.get(key)
+        if album is None:
+            user_id = key[1]
+            if (
+                len(self._albums) >= self.max_albums
+                or self._items >= self.max_items
+                or self._per_user.get(user_id, 0) >= self.max_albums_per_user
+            ):
+                self._reject(key)
+                return AddResult.REJECTED
+            album = self._albums[key] = _Album(on_complete, now)
+            self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+
+        album.messages.append(message)
+        album.last_at = now
+        self._items += 1
+
+        if album.timer is not None:
+            album.timer.cancel()
+        if (
+            len(album.messages) >= MAX_ALBUM_SIZE
+            or now - album.first_at >= self.max_age
+            # Out of room: finish what we already have instead of holding more
+            or self._items >= self.max_items
+        ):
+            self._finish(key)
+        else:
+            loop = asyncio.get_running_loop()
+            album.timer = loop.call_later(self._gap(album), self._finish, key)
+        return AddResult.ADDED
+
+    def _gap(self, album: _Album) -> float:
+        """Waits a few mean inter-arrival times: fast uploads finish fast, slow ones get more slack."""
+        count = len(album.messages)
+        if count < 2:
+            gap = self.max_gap
+        else:
+            mean_interval = (album.last_at - album.first_at) / (count - 1)
+            gap = min(self.max_gap, max(self.min_gap, 3 * mean_interval))
+        # Never hold an album past its maximum age
+        return min(gap, max(0.0, album.first_at + self.max_age - self.clock()))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "albums": len(self._albums),
+            "items": self._items,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "late": self.late,
+            "avg_wait": self.wait_total / self.completed if self.completed else 0.0,
+        }
+
+    def _reject(self, key: AlbumKey):
+        self.rejected += 1
+        self._rejected[key] = None
+        while len(self._rejected) > self.max_albums:
+            self._rejected.popitem(last=False)
+
+    def _finish(self, key: AlbumKey):
+        album = self._albums.pop(key, None)
+        if album is None:
+            return
+        if album.timer is not None:
+            album.timer.cancel()
+        user_id = key[1]
+        remaining = self._per_user.get(user_id, 1) - 1
+        if remaining:
+            self._per_user[user_id] = remaining
+        else:
+            self._per_user.pop(user_id, None)
+        self._items -= len(album.messages)
+        self.completed += 1
+        self._remember_finished(key)
+        # How long the album was held, from its first item to processing
+        self.wait_total += self.clock() - album.first_at
+
+        messages = sorted(album.messages, key=lambda msg: msg.message_id)
+        task = asyncio.get_running_loop().create_task(self._run_callback(album.on_complete, messages))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _remember_finished(self, key: AlbumKey):
+        now = self.clock()
+        finished = self._finished
+        # Every entry lives max_age, so the oldest are at the front
+        while finished and (next(iter(finished.values())) <= now or len(finished) >= self.max_albums):
+            finished.popitem(last=False)
+        finished[key] = now + self.max_age
+
+    async def _run_callback(self, on_complete: OnComplete, messages: List[Message]):
+        try:
+            await on_complete(messages)
+        except Exception as e:
+            logging.error(f"Failed to process media group {messages[0].media_group_id}: {e}")
+
+
+class SharedMediaGroups:
+    """
+    Album aggregation across replicas. Each replica collects the items it received with its
+    local aggregator, then appends them to a shared list. The replica that takes the album's
+    lock waits `settle` seconds for the others' items and processes the whole album; the
+    others are done. Once it is processed, the album is marked done for `ttl` seconds, so an
+    item arriving late on any replica is dropped instead of starting a new album.
+    """
+
+    def __init__(self, local: MediaGroupAggregator, state: SharedState, settle: float = 1.5, ttl: float = 60.0):
+        self.local = local
+        self.state = state
+        self.settle = settle
+        self.ttl = ttl
+
+    def __len__(self) -> int:
+        return len(self.local)
+
+    def __getattr__(self, name: str):
+        # Counters and stats() come from the local aggregator
+        return getattr(self.local, name)
+
+    def add(self, message: Message, on_complete: OnComplete) -> AddResult:
+        return self.local.add(message, lambda messages: self._merge(messages, on_complete))
+
+    async def _merge(self, messages: List[Message], on_complete: OnComplete):
+        first = messages[0]
+        key = f"album:{first.chat.id}:{first.from_user.id}:{first.media_group_id}"
+        raws = [message.model_dump_json(exclude_none=True) for message in messages]
+        # Refused once the album is processed; checked in the same step as the append
+        if not await self.state.push(key, raws, self.ttl, unless=f"{key}:done"):
+            self.local.late += 1
+            return
+        if not await self.state.set(f"{key}:lock", secrets.token_hex(8), self.ttl, only_if_absent=True):
+            return  # Another replica is collecting this album
+        await asyncio.sleep(self.settle)
+
+        # Marked done in the same step that empties the list and releases the lock
+        raws = await self.state.take_all(key, f"{key}:lock", mark=f"{key}:done", ttl=self.ttl)
+        if not raws:
+            return  # Another replica took our items with the album before we got the lock
+        collected: Dict[int, Message] = {}
+        for raw in raws:
+            message = Message.model_validate_json(raw)
+            collected[message.message_id] = message
+        # Our own objects keep their bot binding
+        collected.update((message.message_id, message) for message in messages)
+        await on_complete(sorted(collected.values(), key=lambda message: message.message_id))
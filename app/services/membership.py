@@ -0,0 +1,81 @@
+# app/services/membership.py
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+
+from aiogram import Bot
+
+MEMBER_STATUSES = ("creator", "administrator", "member")
+
+
+class MembershipCache:
+    """
+    Caches required-channel membership checks with a TTL and a bounded size.
+    Concurrent lookups for the same user share one get_chat_member request.
+    """
+
+    def __init__(self, ttl: float = 300, max_size: int = 10000, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        # (chat_id, user_id) -> (expires_at, is_member), oldest first
+        self._entries: "OrderedDict[Tuple[int, int], Tuple[float, bool]]" = OrderedDict()
+        self._inflight: Dict[Tuple[int, int], asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def is_member(self, bot: Bot, chat_id: int, user_id: int) -> bool:
+        key = (chat_id, user_id)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > self.clock():
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            # Someone is already asking Telegram about this user; counted once, as their miss
+            return await asyncio.shield(task)
+
+        self.misses += 1
+        task = asyncio.ensure_future(self._lookup(bot, chat_id, user_id))
+        self._inflight[key] = task
+        try:
+            is_member = await asyncio.shield(task)
+        finally:
+            # An invalidation while the request was in flight drops its result
+            owns_result = self._inflight.get(key) is task
+            if owns_result:
+                del self._inflight[key]
+
+        if owns_result:
+            self._store(key, is_member)
+        return is_member
+
+    @staticmethod
+    async def _lookup(bot: Bot, chat_id: int, user_id: int) -> bool:
+        member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+        return member.status in MEMBER_STATUSES
+
+    def _store(self, key: Tuple[int, int], is_member: bool):
+        self._entries[key] = (self.clock() + self.ttl, is_member)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, chat_id: int, user_id: int):
+        key = (chat_id, user_id)
+        self._entries.pop(key, None)
+        self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
@@ -0,0 +1,231 @@
+# app/services/metrics.py
+
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+# Seconds; covers fast cache hits up to slow uploads
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+
+class CallbackGauge(_Metric):
+    """
+    A gauge (or counter) read from a service when scraped, e.g. its stats().
+    With `labelnames`, read() returns a value per tuple of label values.
+    """
+
+    def __init__(
+        self, name: str, documentation: str, read: Callable[[], float], kind: str = "gauge",
+        labelnames: Sequence[str] = (),
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.read = read
+        self.kind = kind
+
+    def samples(self) -> List[str]:
+        try:
+            if self.labelnames:
+                return [
+                    f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                    for labels, value in self.read().items()
+                ]
+            return [f"{self.name} {_format_value(self.read())}"]
+        except Exception as e:
+            logging.warning(f"Could not read metric {self.name}: {e}")
+            return []
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., count above the last bucket, sum]
+        self._values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        counts = self._values.get(labels)
+        if counts is None:
+            counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def count(self, *labels: str) -> int:
+        counts = self._values.get(labels)
+        return int(sum(counts[:-1])) if counts else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, counts in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Metrics:
+    """
+    A small in-process metrics registry rendered in the Prometheus text format.
+    Recording is a dict lookup and an addition, cheap enough to leave on in production.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(
+        self, name: str, documentation: str, read: Callable[[], float], kind: str = "gauge",
+        labelnames: Sequence[str] = (),
+    ):
+        self._register(CallbackGauge(name, documentation, read, kind, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Session middleware timing every Bot API call per method, and counting errors and 429s.
+    Registered after the SendScheduler, it measures the request itself, not the queueing.
+    """
+
+    def __init__(self, metrics: Metrics):
+        self.duration = metrics.histogram(
+            "bot_api_request_duration_seconds", "Bot API request latency.", ["method"]
+        )
+        self.errors = metrics.counter("bot_api_errors_total", "Failed Bot API requests.", ["method", "error"])
+        self.flood_waits = metrics.counter(
+            "bot_api_flood_waits_total", "Bot API requests answered with 429 Too Many Requests.", ["method"]
+        )
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        api_method = method.__api_method__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            self.flood_waits.inc(api_method)
+            raise
+        except Exception as e:
+            self.errors.inc(api_method, type(e).__name__)
+            raise
+        finally:
+            self.duration.observe(time.perf_counter() - start, api_method)
+
+
+async def start_metrics_server(metrics: Metrics, host: str = "127.0.0.1", port: int = 9090) -> web.AppRunner:
+    """Serves GET /metrics; returns the runner so the caller can clean it up."""
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logging.info(f"Metrics served on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,244 @@
+# app/services/moderation.py
+
+import asyncio
+import logging
+from enum import Enum
+from typing import Awaitable, Dict, Iterable, List, Optional
+
+from aiogram import Bot
+
+from app.services.broadcaster import PUBLISH, Broadcaster, publish_payload
+from app.services.config import tenant_config
+from app.services.localization import Localization
+from app.services.outbox import STATUS_FAILED, STATUS_SENT, Outbox
+from app.services.publish_queue import PublishQueue
+from app.services.send_scheduler import low_priority
+from app.services.submission_store import STATUS_APPROVED, STATUS_DELETED, BaseSubmissionStore, PendingSubmission
+from app.utils.message_helpers import get_log_message
+
+
+# Telegram's deleteMessages accepts at most 100 ids per call
+DELETE_BATCH_SIZE = 100
+
+
+class ModerationResult(Enum):
+    DONE = "done"
+    QUEUED = "queued"        # Approved and waiting in the publish queue
+    RETRYING = "retrying"    # Approved; the post failed to go out and the outbox keeps retrying it
+    NOT_FOUND = "not_found"  # Unknown ID, or already handled by another moderator
+    FAILED = "failed"        # Publishing failed; the submission stays pending
+
+
+class ModerationService:
+    """
+    Approves or deletes pending submissions. Everything is resolved from the SubmissionStore,
+    so an album is published as one media group no matter which report message was clicked,
+    and all report-group messages of the submission are updated together.
+    With several tenants, each submission is published for the tenant owning its report group.
+    """
+
+    def __init__(
+        self, store: BaseSubmissionStore, config: Dict, loc: Localization, bulk_concurrency: int = 4,
+        publish_queue: Optional[PublishQueue] = None, outbox: Optional[Outbox] = None,
+    ):
+        self.store = store
+        self.config = config
+        self.loc = loc
+        self.bulk_concurrency = bulk_concurrency
+        # When set, approved posts wait for a publishing slot instead of going out right away
+        self.publish_queue = publish_queue
+        # When set, posts are sent through it and retried until they go out
+        self.outbox = outbox
+
+    async def approve(self, bot: Bot, submission_id: str, admin_alias: str, admin_id: int) -> ModerationResult:
+        # Claiming takes it out of the pending index, so a second click can't publish it twice
+        pending = await self._claim(submission_id)
+        if pending is None:
+            return ModerationResult.NOT_FOUND
+
+        result = await self._publish(bot, pending)
+        if result is ModerationResult.FAILED:
+            await self.store.release(pending)
+            return result
+        await self.store.resolve(pending, STATUS_APPROVED)
+
+        await self._run_concurrently(
+            self._send_log(bot, "report_approved_log", pending, admin_alias, admin_id),
+            *self._mark_report(bot, pending, self._approved_status(admin_alias, result)),
+        )
+        return result
+
+    async def delete(self, bot: Bot, submission_id: str, admin_alias: str, admin_id: int) -> ModerationResult:
+        pending = await self._claim(submission_id)
+        if pending is None:
+            return ModerationResult.NOT_FOUND
+        await self.store.resolve(pending, STATUS_DELETED)
+
+        calls = [self._send_log(bot, "report_deleted_log", pending, admin_alias, admin_id)]
+        if pending.report_message_ids:
+            # Remove the header, the forwarded content and the keyboard message in one call
+            calls.append(bot.delete_messages(chat_id=pending.report_chat_id, message_ids=pending.report_message_ids))
+        await self._run_concurrently(*calls)
+        return ModerationResult.DONE
+
+    async def approve_many(
+        self, bot: Bot, submission_ids: Iterable[str], admin_alias: str, admin_id: int,
+        report_chat_id: Optional[int] = None,
+    ) -> Dict[str, int]:
+        """
+        Publishes several submissions, oldest first, and reports them in one summary message
+        (sent to `report_chat_id`, by default the report group).
+        Posts go out one after another so the channel keeps their order; the report-group
+        edits run alongside with at most `bulk_concurrency` in flight.
+        """
+        claimed, not_found = await self._claim_all(submission_ids)
+        semaphore = asyncio.Semaphore(self.bulk_concurrency)
+        edits = []
+        approved = failed = 0
+        for pending in claimed:
+            result = await self._publish(bot, pending)
+            if result is ModerationResult.FAILED:
+                await self.store.release(pending)
+                failed += 1
+                continue
+            await self.store.resolve(pending, STATUS_APPROVED)
+            approved += 1
+            status = self._approved_status(admin_alias, result)
+            edits.extend(
+                asyncio.ensure_future(self._limited(semaphore, edit)) for edit in self._mark_report(bot, pending, status)
+            )
+
+        summary = get_log_message(
+            "bulk_approved_log", self.loc, admin_alias=admin_alias, admin_id=admin_id, count=approved, failed=failed
+        )
+        await self._run_concurrently(self._send_summary(bot, summary, report_chat_id), *edits)
+        return {"approved": approved, "failed": failed, "not_found": not_found}
+
+    async def delete_many(
+        self, bot: Bot, submission_ids: Iterable[str], admin_alias: str, admin_id: int,
+        report_chat_id: Optional[int] = None,
+    ) -> Dict[str, int]:
+        """Deletes several submissions with batched deleteMessages calls and one summary message."""
+        claimed, not_found = await self._claim_all(submission_ids)
+        if claimed:
+            await self.store.resolve_many(claimed, STATUS_DELETED)
+
+        message_ids: Dict[int, List[int]] = {}
+        for pending in claimed:
+            message_ids.setdefault(pending.report_chat_id, []).extend(pending.report_message_ids)
+        semaphore = asyncio.Semaphore(self.bulk_concurrency)
+        deletes = [
+            self._limited(semaphore, bot.delete_messages(chat_id=chat_id, message_ids=ids[i:i + DELETE_BATCH_SIZE]))
+            for chat_id, ids in message_ids.items()
+            for i in range(0, len(ids), DELETE_BATCH_SIZE)
+        ]
+
+        summary = get_log_message(
+            "bulk_deleted_log", self.loc, admin_alias=admin_alias, admin_id=admin_id, count=len(claimed)
+        )
+        await self._run_concurrently(self._send_summary(bot, summary, report_chat_id), *deletes)
+        return {"deleted": len(claimed), "not_found": not_found}
+
+    async def _publish(self, bot: Bot, pending: PendingSubmission) -> ModerationResult:
+        config = tenant_config(self.config, pending.report_chat_id)
+        if self.publish_queue is not None:
+            try:
+                await self.publish_queue.enqueue(
+                    pending.submission, pending.subject, is_regular_user_post=True,
+                    channel_id=config["output_channel_id"],
+                )
+                return ModerationResult.QUEUED
+            except Exception as e:
+                logging.error(f"Failed to queue submission {pending.id}: {e}")
+                return ModerationResult.FAILED
+        if self.outbox is not None:
+            # Keyed by the submission, so approving it again after a failure can't post it twice
+            delivery = await self.outbox.submit(
+                PUBLISH, f"publish:{pending.id}", config["output_channel_id"],
+                publish_payload(pending.submission, pending.subject, config["output_channel_id"], True),
+            )
+            if delivery.status == STATUS_FAILED:
+                return ModerationResult.FAILED
+            return ModerationResult.DONE if delivery.status == STATUS_SENT else ModerationResult.RETRYING
+        # Pass the flag to add the #ارسالی tag
+        published = await Broadcaster.post_to_output_channel(
+            bot, pending.submission, pending.subject, config, self.loc, is_regular_user_post=True
+        )
+        return ModerationResult.DONE if published else ModerationResult.FAILED
+
+    def _approved_status(self, admin_alias: str, result: ModerationResult = ModerationResult.DONE) -> str:
+        status = f"✅ تایید شده توسط {admin_alias}"
+        if result is ModerationResult.QUEUED:
+            return f"{status} (در صف انتشار)"
+        if result is ModerationResult.RETRYING:
+            return f"{status} (در انتظار ارسال مجدد)"
+        return status
+
+    async def _claim(self, submission_id: str) -> Optional[PendingSubmission]:
+        # The submission may have been created by another process or replica
+        return await self.store.acquire(submission_id)
+
+    async def _claim_all(self, submission_ids: Iterable[str]):
+        claimed = []
+        not_found = 0
+        for submission_id in submission_ids:
+            pending = await self._claim(submission_id)
+            if pending is None:
+                not_found += 1
+            else:
+                claimed.append(pending)
+        claimed.sort(key=lambda pending: pending.created_at)
+        return claimed, not_found
+
+    def _mark_report(self, bot: Bot, pending: PendingSubmission, status: str) -> List[Awaitable]:
+        """Edits that stamp the status on the report header and remove the buttons."""
+        message_ids = pending.report_message_ids
+        if not message_ids:
+            return []
+        chat_id = pending.report_chat_id
+        submission = pending.submission
+        edits = []
+        if pending.report_header:
+            edits.append(bot.edit_message_text(
+                chat_id=chat_id, message_id=message_ids[0],
+                text=f"{pending.report_header}\n\n{status}", disable_web_page_preview=True,
+            ))
+        # The last message carries the keyboard; editing it without reply_markup drops the buttons
+        if submission.is_album:
+            edits.append(bot.edit_message_text(chat_id=chat_id, message_id=message_ids[-1], text=status))
+        elif submission.text:
+            edits.append(bot.edit_message_text(
+                chat_id=chat_id, message_id=message_ids[-1], text=f"{submission.text}\n\n{status}",
+                entities=submission.entity_objects(), parse_mode=None,
+            ))
+        else:
+            caption = f"{submission.caption}\n\n{status}" if submission.caption else status
+            edits.append(bot.edit_message_caption(
+                chat_id=chat_id, message_id=message_ids[-1], caption=caption,
+                caption_entities=submission.entity_objects(), parse_mode=None,
+            ))
+        return edits
+
+    async def _send_log(self, bot: Bot, log_key: str, pending: PendingSubmission, admin_alias: str, admin_id: int):
+        log_message_text = get_log_message(
+            log_key, self.loc, admin_alias=admin_alias, admin_id=admin_id, submitter_id=pending.submitter_id
+        )
+        with low_priority():
+            await bot.send_message(tenant_config(self.config, pending.report_chat_id)["report_group_id"], log_message_text)
+
+    async def _send_summary(self, bot: Bot, text: str, report_chat_id: Optional[int] = None):
+        with low_priority():
+            await bot.send_message(report_chat_id or self.config["report_group_id"], text)
+
+    @staticmethod
+    async def _limited(semaphore: asyncio.Semaphore, call: Awaitable):
+        async with semaphore:
+            return await call
+
+    @staticmethod
+    async def _run_concurrently(*calls: Awaitable):
+        # The decision is already recorded; a failed edit or log message only gets logged
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logging.warning(f"Could not update the report group: {result}")
@@ -0,0 +1,529 @@
+# app/services/outbox.py
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import random
+import sqlite3
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramEntityTooLarge, TelegramForbiddenError, TelegramNotFound,
+    TelegramRetryAfter, TelegramUnauthorizedError,
+)
+
+from app.utils.sqlite import SQLiteDatabase
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    result TEXT,
+    error TEXT,
+    worker INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outbox_status ON outbox (worker, status);
+"""
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+# Was being sent when the bot stopped; it may or may not have reached the chat
+STATUS_INTERRUPTED = "interrupted"
+
+# Tries at saving a delivery that went out; it is never sent again, whatever they return
+SENT_WRITE_ATTEMPTS = 3
+
+# Telegram rejected the request itself; sending it again would fail the same way
+PERMANENT_ERRORS = (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNotFound, TelegramUnauthorizedError, TelegramEntityTooLarge,
+)
+
+_COLUMNS = "key, kind, chat_id, payload, status, attempts, next_attempt_at, created_at, result, error"
+
+
+@dataclass(slots=True)
+class Delivery:
+    """One message (or album) to send, identified by its idempotency key."""
+    key: str
+    kind: str
+    chat_id: int
+    payload: Dict[str, Any]
+    status: str
+    created_at: float
+    next_attempt_at: float
+    attempts: int = 0
+    # Message ids Telegram returned once sent
+    result: Optional[List[int]] = None
+    error: Optional[str] = None
+
+
+Sender = Callable[[Dict[str, Any]], Awaitable[List[int]]]
+Callback = Callable[[Delivery], Awaitable[Any]]
+
+
+@dataclass(slots=True)
+class _Kind:
+    send: Sender
+    on_sent: Optional[Callback]
+    on_failed: Optional[Callback]
+    resend_interrupted: bool
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Exponential backoff with jitter: somewhere in the upper half of base * 2^(attempt-1), capped."""
+    delay = min(maximum, base * 2 ** min(attempt - 1, 32))
+    return random.uniform(delay / 2, delay)
+
+
+class CircuitBreaker:
+    """
+    Stops sending to a chat after `threshold` failures in a row. After `cooldown` seconds one
+    message is let through as a trial; each failed trial doubles the pause, up to `max_cooldown`.
+    """
+
+    __slots__ = ("threshold", "cooldown", "max_cooldown", "failures", "open_until")
+
+    def __init__(self, threshold: int, cooldown: float, max_cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failures = 0
+        self.open_until = 0.0
+
+    def is_open(self, now: float) -> bool:
+        return self.open_until > now
+
+    def record_failure(self, now: float) -> bool:
+        """Returns True if this failure opened the breaker."""
+        self.failures += 1
+        if self.failures < self.threshold:
+            return False
+        trips = self.failures - self.threshold
+        self.open_until = now + min(self.max_cooldown, self.cooldown * 2 ** min(trips, 32))
+        return trips == 0
+
+
+class OwnerAlerts:
+    """
+    Collects problems to tell the owner about and sends them as one summary at most every
+    `interval` seconds, so an outage produces a message per interval instead of one per failure.
+    Repeated alerts are counted rather than listed again.
+    """
+
+    def __init__(
+        self, send: Callable[[str], Awaitable[Any]], interval: float = 300.0, max_lines: int = 10,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.send = send
+        self.interval = interval
+        self.max_lines = max_lines
+        self.clock = clock
+        self._counts: Dict[str, int] = {}
+        self._last_sent = float("-inf")
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+
+    def alert(self, text: str):
+        self._counts[text] = self._counts.get(text, 0) + 1
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._counts:
+            # Not sent now: Telegram may be the reason for them, and shutdown shouldn't wait on it
+            logging.warning(f"{sum(self._counts.values())} owner alert(s) were not sent before shutdown.")
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            delay = self._last_sent + self.interval - self.clock()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.flush()
+
+    async def flush(self):
+        self._wakeup.clear()
+        if not self._counts:
+            return
+        counts, self._counts = self._counts, {}
+        self._last_sent = self.clock()
+        try:
+            await self.send(self._format(counts))
+            self.sent += 1
+        except Exception as e:
+            logging.error(f"Could not send the owner an alert: {e}")
+            # Kept for the next summary
+            for text, count in counts.items():
+                self._counts[text] = self._counts.get(text, 0) + count
+            self._wakeup.set()
+
+    def _format(self, counts: Dict[str, int]) -> str:
+        lines = [f"⚠️ {sum(counts.values())} problem(s) since the last alert:"]
+        for text, count in list(counts.items())[:self.max_lines]:
+            lines.append(f"• {text}" + (f" (×{count})" if count > 1 else ""))
+        if len(counts) > self.max_lines:
+            lines.append(f"…and {len(counts) - self.max_lines} more.")
+        return "\n".join(lines)
+
+
+def _row_to_delivery(row) -> Delivery:
+    return Delivery(
+        key=row[0],
+        kind=row[1],
+        chat_id=row[2],
+        payload=json.loads(row[3]),
+        status=row[4],
+        attempts=row[5],
+        next_attempt_at=row[6],
+        created_at=row[7],
+        result=json.loads(row[8]) if row[8] else None,
+        error=row[9],
+    )
+
+
+def _insert(connection: sqlite3.Connection, delivery: Delivery, worker: int) -> Tuple[bool, Delivery]:
+    """Adds the delivery unless its key is known; returns (added, the stored delivery)."""
+    with connection:
+        added = connection.execute(
+            f"INSERT OR IGNORE INTO outbox ({_COLUMNS}, worker) VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL, NULL, ?)",
+            (
+                delivery.key, delivery.kind, delivery.chat_id, json.dumps(delivery.payload, ensure_ascii=False),
+                delivery.status, delivery.attempts, delivery.next_attempt_at, delivery.created_at, worker,
+            ),
+        ).rowcount
+        if added:
+            return True, delivery
+        row = connection.execute(f"SELECT {_COLUMNS} FROM outbox WHERE key = ?", (delivery.key,)).fetchone()
+    return False, _row_to_delivery(row)
+
+
+def _update(connection: sqlite3.Connection, key: str, fields: Dict[str, Any]):
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with connection:
+        connection.execute(f"UPDATE outbox SET {assignments} WHERE key = ?", (*fields.values(), key))
+
+
+class Outbox:
+    """
+    Every channel post and report-group forward, recorded in SQLite before it is sent.
+    A send that fails is retried with jittered exponential backoff, in order per chat, until it
+    goes through or `max_attempts` is reached; errors Telegram gives for the request itself are
+    not retried. A chat that keeps failing is paused by a circuit breaker.
+
+    Each delivery has an idempotency key: submitting a key again never sends it twice, and a
+    delivery that was mid-send when the bot stopped is not resent unless its kind allows it
+    (posting twice to a channel is worse than an admin checking one post). Problems reach the
+    owner through OwnerAlerts, coalesced.
+
+    In worker mode every process retries only the deliveries it created (`worker`).
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        alerts: Optional[OwnerAlerts] = None,
+        max_attempts: int = 10,
+        base_delay: float = 2.0,
+        max_delay: float = 600.0,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 60.0,
+        max_breaker_cooldown: float = 900.0,
+        retention: float = 7 * 86400,
+        worker: int = 0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.db = SQLiteDatabase(path)
+        self.db.execute_script(SCHEMA)
+        self.alerts = alerts
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.max_breaker_cooldown = max_breaker_cooldown
+        self.retention = retention
+        self.worker = worker
+        self.clock = clock
+        self._kinds: Dict[str, _Kind] = {}
+        self._breakers: Dict[int, CircuitBreaker] = {}
+        # Deliveries waiting for a retry, in order per chat; only each chat's first is attempted
+        self._queues: Dict[int, Deque[Delivery]] = {}
+        # (due, sequence, chat_id); one entry per chat with a queue
+        self._heap: List[Tuple[float, int, int]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Counters for monitoring
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+
+    def register(
+        self, kind: str, send: Sender, on_sent: Optional[Callback] = None, on_failed: Optional[Callback] = None,
+        resend_interrupted: bool = False,
+    ):
+        """
+        Sets how deliveries of `kind` are sent: `send(payload)` returns the sent message ids.
+        `on_sent` and `on_failed` run once a delivery is sent or given up on.
+        """
+        self._kinds[kind] = _Kind(send, on_sent, on_failed, resend_interrupted)
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def open_circuits(self) -> int:
+        now = self.clock()
+        return sum(breaker.is_open(now) for breaker in self._breakers.values())
+
+    def start(self):
+        """Picks up the deliveries left from the last run and starts retrying; call after register()."""
+        if self._task is not None:
+            return
+        self._load()
+        if self.alerts is not None:
+            self.alerts.start()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.alerts is not None:
+            await self.alerts.close()
+        await self.db.close()
+
+    def _load(self):
+        connection = self.db.connection
+        with connection:
+            connection.execute(
+                "DELETE FROM outbox WHERE status IN (?, ?, ?) AND created_at < ?",
+                (STATUS_SENT, STATUS_FAILED, STATUS_INTERRUPTED, self.clock() - self.retention),
+            )
+        rows = connection.execute(
+            f"SELECT {_COLUMNS} FROM outbox WHERE worker = ? AND status IN (?, ?) ORDER BY created_at",
+            (self.worker, STATUS_PENDING, STATUS_SENDING),
+        ).fetchall()
+        for delivery in map(_row_to_delivery, rows):
+            kind = self._kinds.get(delivery.kind)
+            if kind is None:
+                logging.error(f"Outbox delivery {delivery.key} has unknown kind {delivery.kind!r}; leaving it.")
+                continue
+            if delivery.status == STATUS_SENDING:
+                if not kind.resend_interrupted:
+                    _update(connection, delivery.key, {"status": STATUS_INTERRUPTED})
+                    logging.error(f"Delivery {delivery.key} was being sent when the bot stopped; not sending it again.")
+                    self._alert(
+                        f"A {delivery.kind} to chat {delivery.chat_id} was being sent when the bot stopped "
+                        f"and may be missing; check the chat ({delivery.key})."
+                    )
+                    continue
+                delivery.status = STATUS_PENDING
+                _update(connection, delivery.key, {"status": STATUS_PENDING})
+            self._enqueue(delivery)
+
+    async def submit(self, kind: str, key: str, chat_id: int, payload: Dict[str, Any]) -> Delivery:
+        """
+        Records a delivery and sends it right away unless the chat is paused or has older deliveries
+        waiting. Returns it with its status: sent, pending (will be retried) or failed.
+        A key seen before returns the stored delivery instead; only a failed one is tried again.
+        """
+        now = self.clock()
+        delivery = Delivery(key, kind, chat_id, payload, STATUS_PENDING, created_at=now, next_attempt_at=now)
+        added, stored = await self.db.run(_insert, delivery, self.worker)
+        if not added:
+            if stored.status != STATUS_FAILED:
+                return stored
+            delivery.created_at = stored.created_at
+            await self.db.run(_update, key, {
+                "status": STATUS_PENDING, "attempts": 0, "next_attempt_at": now, "error": None,
+                "payload": json.dumps(payload, ensure_ascii=False), "worker": self.worker,
+            })
+
+        breaker = self._breakers.get(chat_id)
+        if chat_id in self._queues or (breaker is not None and breaker.is_open(now)):
+            self._enqueue(delivery)
+            return delivery
+        # The chat's queue is taken before the first attempt, so deliveries submitted meanwhile
+        # wait behind this one, and a failed attempt is retried before them
+        queue = self._queues[chat_id] = deque([delivery])
+        try:
+            await self._attempt(delivery)
+        except BaseException:
+            # Left as recorded in the database, as before the queue was taken
+            queue.popleft()
+            self._next(chat_id)
+            raise
+        if delivery.status != STATUS_PENDING:
+            queue.popleft()
+        self._next(chat_id)
+        return delivery
+
+    def _enqueue(self, delivery: Delivery):
+        queue = self._queues.setdefault(delivery.chat_id, deque())
+        queue.append(delivery)
+        if len(queue) == 1:
+            self._schedule(delivery.chat_id)
+
+    def _schedule(self, chat_id: int):
+        breaker = self._breakers.get(chat_id)
+        due = max(self._queues[chat_id][0].next_attempt_at, breaker.open_until if breaker is not None else 0.0)
+        heapq.heappush(self._heap, (due, next(self._seq), chat_id))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            due = self._heap[0][0]
+            now = self.clock()
+            if due > now:
+                # One timer for every chat; a new delivery due earlier wakes it up
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), due - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, chat_id = heapq.heappop(self._heap)
+            queue = self._queues[chat_id]
+            delivery = queue[0]
+            try:
+                await self._attempt(delivery)
+            except Exception as e:
+                # Only database errors before or instead of a send get here; tried again after the longest backoff
+                logging.error(f"Outbox error on delivery {delivery.key}: {e}")
+                delivery.status = STATUS_PENDING
+                delivery.next_attempt_at = self.clock() + self.max_delay
+            if delivery.status != STATUS_PENDING:
+                queue.popleft()
+            self._next(chat_id)
+
+    def _next(self, chat_id: int):
+        """Schedules the chat's next delivery, or frees the chat if none is waiting."""
+        if self._queues[chat_id]:
+            self._schedule(chat_id)
+        else:
+            del self._queues[chat_id]
+
+    async def _attempt(self, delivery: Delivery):
+        kind = self._kinds[delivery.kind]
+        delivery.status = STATUS_SENDING
+        delivery.attempts += 1
+        # Recorded before sending, so a crash mid-send can be told apart from a send never made
+        await self.db.run(_update, delivery.key, {"status": STATUS_SENDING, "attempts": delivery.attempts})
+        try:
+            result = await kind.send(delivery.payload)
+        except Exception as e:
+            await self._attempt_failed(delivery, kind, e)
+            return
+
+        delivery.status = STATUS_SENT
+        delivery.result = list(result or [])
+        delivery.error = None
+        self.sent += 1
+        breaker = self._breakers.pop(delivery.chat_id, None)
+        if breaker is not None and breaker.failures >= self.breaker_threshold:
+            logging.info(f"Chat {delivery.chat_id} is reachable again.")
+        await self._record_sent(delivery)
+        await self._callback(kind.on_sent, delivery)
+
+    async def _record_sent(self, delivery: Delivery):
+        """
+        Saves a delivery that went out. It stays sent whatever the database says, since going back to
+        pending would send it twice; only the write is tried again. If that keeps failing, the row is
+        left as sending, which the next start treats as interrupted.
+        """
+        fields = {"status": STATUS_SENT, "sent_at": self.clock(), "result": json.dumps(delivery.result), "error": None}
+        for attempt in range(1, SENT_WRITE_ATTEMPTS + 1):
+            try:
+                await self.db.run(_update, delivery.key, fields)
+                return
+            except Exception as e:
+                error = e
+            if attempt < SENT_WRITE_ATTEMPTS:
+                await asyncio.sleep(backoff_delay(attempt, self.base_delay, self.max_delay))
+        logging.error(f"Delivery {delivery.key} was sent but could not be recorded: {error}")
+        self._alert(f"A {delivery.kind} to chat {delivery.chat_id} was sent but could not be recorded: {error}")
+
+    async def _attempt_failed(self, delivery: Delivery, kind: _Kind, error: Exception):
+        now = self.clock()
+        delivery.error = f"{type(error).__name__}: {error}"
+        permanent = isinstance(error, PERMANENT_ERRORS)
+        if not permanent:
+            breaker = self._breakers.get(delivery.chat_id)
+            if breaker is None:
+                breaker = self._breakers[delivery.chat_id] = CircuitBreaker(
+                    self.breaker_threshold, self.breaker_cooldown, self.max_breaker_cooldown
+                )
+            if breaker.record_failure(now):
+                logging.error(f"Chat {delivery.chat_id} keeps failing; pausing sends to it.")
+                self._alert(f"Sends to chat {delivery.chat_id} keep failing and are paused for now: {delivery.error}")
+
+        if permanent or delivery.attempts >= self.max_attempts:
+            delivery.status = STATUS_FAILED
+            self.failed += 1
+            logging.error(f"Giving up on delivery {delivery.key} after {delivery.attempts} attempt(s): {delivery.error}")
+            self._alert(f"Could not send a {delivery.kind} to chat {delivery.chat_id}: {delivery.error}")
+            await self.db.run(_update, delivery.key, {"status": STATUS_FAILED, "error": delivery.error})
+            await self._callback(kind.on_failed, delivery)
+            return
+
+        delay = backoff_delay(delivery.attempts, self.base_delay, self.max_delay)
+        if isinstance(error, TelegramRetryAfter):
+            delay = max(delay, error.retry_after)
+        delivery.status = STATUS_PENDING
+        delivery.next_attempt_at = now + delay
+        self.retries += 1
+        logging.warning(
+            f"Delivery {delivery.key} failed (attempt {delivery.attempts}/{self.max_attempts}), "
+            f"retrying in {delay:.1f}s: {delivery.error}"
+        )
+        await self.db.run(_update, delivery.key, {
+            "status": STATUS_PENDING, "next_attempt_at": delivery.next_attempt_at, "error": delivery.error,
+        })
+
+    def _alert(self, text: str):
+        if self.alerts is not None:
+            self.alerts.alert(text)
+
+    @staticmethod
+    async def _callback(callback: Optional[Callback], delivery: Delivery):
+        if callback is None:
+            return
+        try:
+            await callback(delivery)
+        except Exception as e:
+            logging.error(f"Outbox callback failed for delivery {delivery.key}: {e}")
@@ -0,0 +1,346 @@
+# app/services/publish_queue.py
+
+import asyncio
+import heapq
+import json
+import logging
+import sqlite3
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from app.utils.sqlite import SQLiteDatabase
+from app.utils.submission import Submission
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS publish_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    subject TEXT NOT NULL,
+    submission TEXT NOT NULL,
+    is_regular_user_post INTEGER NOT NULL,
+    position REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    published_at REAL,
+    channel_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS publish_queue_status ON publish_queue (status);
+"""
+
+STATUS_QUEUED = "queued"
+STATUS_PUBLISHING = "publishing"
+STATUS_PUBLISHED = "published"
+STATUS_CANCELLED = "cancelled"
+STATUS_FAILED = "failed"
+# Was being published when the bot stopped; it may or may not be in the channel
+STATUS_INTERRUPTED = "interrupted"
+
+HOUR = 3600
+DAY = 86400
+
+
+@dataclass(slots=True)
+class QueuedPost:
+    """An approved post waiting for its publishing slot."""
+    id: int
+    subject: str
+    submission: Submission
+    is_regular_user_post: bool
+    position: float
+    created_at: float
+    attempts: int = 0
+    # Output channel of the tenant the post belongs to; None for the configured one
+    channel_id: Optional[int] = None
+
+
+Publisher = Callable[[QueuedPost], Awaitable[bool]]
+
+
+def parse_quiet_hours(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Parses "01:00-07:00" into (start, end) seconds after midnight. The range may wrap midnight."""
+    if not value:
+        return None
+    start, end = (part.strip() for part in value.split("-"))
+
+    def seconds(clock_time: str) -> int:
+        hours, minutes = clock_time.split(":")
+        return int(hours) * HOUR + int(minutes) * 60
+
+    return seconds(start), seconds(end)
+
+
+def _insert(
+    connection: sqlite3.Connection, subject: str, submission: str, is_regular_user_post: bool,
+    position: float, created_at: float, channel_id: Optional[int],
+) -> int:
+    with connection:
+        cursor = connection.execute(
+            "INSERT INTO publish_queue "
+            "(subject, submission, is_regular_user_post, position, status, created_at, channel_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (subject, submission, int(is_regular_user_post), position, STATUS_QUEUED, created_at, channel_id),
+        )
+    return cursor.lastrowid
+
+
+def _add_missing_columns(connection: sqlite3.Connection):
+    # Databases created before posts were tagged with their tenant's channel
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(publish_queue)")}
+    if "channel_id" not in columns:
+        with connection:
+            connection.execute("ALTER TABLE publish_queue ADD COLUMN channel_id INTEGER")
+
+
+def _update(connection: sqlite3.Connection, post_id: int, fields: Dict[str, Any]):
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with connection:
+        connection.execute(f"UPDATE publish_queue SET {assignments} WHERE id = ?", (*fields.values(), post_id))
+
+
+class PublishQueue:
+    """
+    Approved posts waiting to be published, persisted in SQLite and ordered by a heap.
+    One background task publishes the head of the queue whenever the next slot opens:
+    at least `slot_spacing` seconds apart, at most `per_hour` posts in any hour, and
+    never during quiet hours (local time, given as an offset from UTC).
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        publish: Publisher,
+        slot_spacing: float = 300.0,
+        per_hour: int = 0,
+        quiet_hours: Optional[Tuple[int, int]] = None,
+        utc_offset: float = 0.0,
+        max_attempts: int = 3,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.db = SQLiteDatabase(path)
+        self.db.execute_script(SCHEMA)
+        _add_missing_columns(self.db.connection)
+        self.publish = publish
+        self.slot_spacing = slot_spacing
+        self.per_hour = per_hour
+        self.quiet_hours = quiet_hours
+        self.utc_offset = utc_offset
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self._items: Dict[int, QueuedPost] = {}
+        # (position, id); entries left behind by moves and cancels are skipped when popped
+        self._heap: List[Tuple[float, int]] = []
+        # Highest position handed out; new posts go behind it
+        self._tail = 0.0
+        # Publish times within the last hour, for the hourly cap
+        self._recent: Deque[float] = deque()
+        self._last_attempt_at = float("-inf")
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._load()
+
+    def _load(self):
+        connection = self.db.connection
+        with connection:
+            interrupted = connection.execute(
+                "UPDATE publish_queue SET status = ? WHERE status = ?", (STATUS_INTERRUPTED, STATUS_PUBLISHING)
+            ).rowcount
+        if interrupted:
+            # Publishing them again could post them twice, so they are left for an admin to check
+            logging.error(f"{interrupted} queued post(s) were being published when the bot stopped; not retrying them.")
+
+        rows = connection.execute(
+            "SELECT id, subject, submission, is_regular_user_post, position, created_at, attempts, channel_id "
+            "FROM publish_queue WHERE status = ?",
+            (STATUS_QUEUED,),
+        ).fetchall()
+        for row in rows:
+            post = QueuedPost(
+                id=row[0],
+                subject=row[1],
+                submission=Submission.from_dict(json.loads(row[2])),
+                is_regular_user_post=bool(row[3]),
+                position=row[4],
+                created_at=row[5],
+                attempts=row[6],
+                channel_id=row[7],
+            )
+            self._items[post.id] = post
+            self._heap.append((post.position, post.id))
+        heapq.heapify(self._heap)
+        self._tail = max((post.position for post in self._items.values()), default=0.0)
+
+        recent = connection.execute(
+            "SELECT published_at FROM publish_queue WHERE status = ? AND published_at > ? ORDER BY published_at",
+            (STATUS_PUBLISHED, self.clock() - HOUR),
+        ).fetchall()
+        self._recent.extend(row[0] for row in recent)
+        if self._recent:
+            self._last_attempt_at = self._recent[-1]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.db.close()
+
+    async def enqueue(
+        self, submission: Submission, subject: str, is_regular_user_post: bool = False,
+        channel_id: Optional[int] = None,
+    ) -> QueuedPost:
+        created_at = self.clock()
+        self._tail += 1
+        position = self._tail
+        post_id = await self.db.run(
+            _insert, subject, json.dumps(submission.to_dict(), ensure_ascii=False), is_regular_user_post,
+            position, created_at, channel_id,
+        )
+        post = QueuedPost(post_id, subject, submission, is_regular_user_post, position, created_at, channel_id=channel_id)
+        self._push(post)
+        self._wakeup.set()
+        return post
+
+    def items(self) -> List[QueuedPost]:
+        """Queued posts in publishing order."""
+        return sorted(self._items.values(), key=lambda post: post.position)
+
+    def schedule(self) -> List[Tuple[QueuedPost, float]]:
+        """Queued posts in order, each with its estimated publish time."""
+        now = self.clock()
+        recent = [published_at for published_at in self._recent if published_at > now - HOUR]
+        last = self._last_attempt_at
+        planned = []
+        for post in self.items():
+            at = self._next_slot(max(now, last + self.slot_spacing), recent)
+            planned.append((post, at))
+            recent.append(at)
+            last = at
+        return planned
+
+    async def cancel(self, post_id: int) -> bool:
+        if self._items.pop(post_id, None) is None:
+            return False
+        await self.db.run(_update, post_id, {"status": STATUS_CANCELLED})
+        return True
+
+    async def move(self, post_id: int, index: int) -> bool:
+        """Moves a queued post to a 0-based place in the publishing order."""
+        post = self._items.get(post_id)
+        if post is None:
+            return False
+        others = [item for item in self.items() if item.id != post_id]
+        index = max(0, min(index, len(others)))
+        if not others:
+            return True
+        if index == 0:
+            position = others[0].position - 1
+        elif index == len(others):
+            self._tail = position = max(self._tail, others[-1].position) + 1
+        else:
+            position = (others[index - 1].position + others[index].position) / 2
+        post.position = position
+        heapq.heappush(self._heap, (position, post_id))
+        await self.db.run(_update, post_id, {"position": position})
+        return True
+
+    def _push(self, post: QueuedPost):
+        self._items[post.id] = post
+        heapq.heappush(self._heap, (post.position, post.id))
+        # Drop stale entries once they outnumber live ones
+        if len(self._heap) > 2 * len(self._items) + 64:
+            self._heap = [(item.position, item.id) for item in self._items.values()]
+            heapq.heapify(self._heap)
+        self._tail = max(self._tail, post.position)
+
+    def _pop_head(self) -> Optional[QueuedPost]:
+        while self._heap:
+            position, post_id = heapq.heappop(self._heap)
+            post = self._items.get(post_id)
+            if post is not None and post.position == position:
+                del self._items[post_id]
+                return post
+        return None
+
+    def _next_slot(self, earliest: float, recent: List[float]) -> float:
+        at = earliest
+        if self.per_hour and len(recent) >= self.per_hour:
+            # Wait until the oldest post counting against the cap is an hour old
+            at = max(at, recent[-self.per_hour] + HOUR)
+        return self._after_quiet_hours(at)
+
+    def _after_quiet_hours(self, at: float) -> float:
+        if not self.quiet_hours:
+            return at
+        start, end = self.quiet_hours
+        second_of_day = (at + self.utc_offset * HOUR) % DAY
+        if start <= end:
+            if start <= second_of_day < end:
+                return at + end - second_of_day
+        elif second_of_day >= start:
+            return at + DAY - second_of_day + end
+        elif second_of_day < end:
+            return at + end - second_of_day
+        return at
+
+    async def _run(self):
+        while True:
+            if not self._items:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = self.clock()
+            while self._recent and self._recent[0] <= now - HOUR:
+                self._recent.popleft()
+            due = self._next_slot(max(now, self._last_attempt_at + self.slot_spacing), list(self._recent))
+            if due > now:
+                # One timer for the whole queue, however many posts are waiting
+                await asyncio.sleep(due - now)
+                continue
+
+            post = self._pop_head()
+            if post is None:
+                continue
+            self._last_attempt_at = self.clock()
+            try:
+                await self._publish_one(post)
+            except Exception as e:
+                # Only database errors get here; the row keeps its last saved status
+                logging.error(f"Publish queue error on post {post.id}: {e}")
+
+    async def _publish_one(self, post: QueuedPost):
+        # Recorded before sending, so a crash mid-publish is never retried into a double post
+        await self.db.run(_update, post.id, {"status": STATUS_PUBLISHING})
+        try:
+            success = await self.publish(post)
+        except Exception as e:
+            logging.error(f"Failed to publish queued post {post.id}: {e}")
+            success = False
+
+        if success:
+            published_at = self.clock()
+            self._recent.append(published_at)
+            await self.db.run(_update, post.id, {"status": STATUS_PUBLISHED, "published_at": published_at})
+            return
+
+        post.attempts += 1
+        if post.attempts < self.max_attempts:
+            # Stays at the head and is retried in the next slot
+            self._push(post)
+            await self.db.run(_update, post.id, {"status": STATUS_QUEUED, "attempts": post.attempts})
+        else:
+            logging.error(f"Giving up on queued post {post.id} after {post.attempts} attempts.")
+            await self.db.run(_update, post.id, {"status": STATUS_FAILED, "attempts": post.attempts})
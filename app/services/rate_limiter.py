@@ -0,0 +1,141 @@
+# app/services/rate_limiter.py
+
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Hashable, Tuple
+
+# Number of least-recently-used keys inspected for idleness on every hit.
+# Keeps eviction amortized O(1) without a background task.
+SWEEP_PER_HIT = 2
+
+
+class RateLimiter(ABC):
+    """
+    Base class for constant-memory-per-key limiters.
+    State lives in an LRU-ordered dict whose first element is always the time at
+    which the key becomes idle (equivalent to never having been seen).
+    """
+
+    def __init__(self, max_keys: int = 100_000, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._state: "OrderedDict[Hashable, Tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._state)
+
+    def hit(self, key: Hashable, limit: int, period: float) -> bool:
+        """Registers a request for `key`. Returns False if it exceeds `limit` per `period`."""
+        now = self.clock()
+        state = self._state.get(key)
+        if state is not None and state[0] <= now:
+            state = None
+
+        allowed, new_state = self._check(state, now, limit, period)
+        if new_state is not None:
+            self._state[key] = new_state
+            self._state.move_to_end(key)
+        self._evict(now)
+        return allowed
+
+    def _evict(self, now: float):
+        state = self._state
+        for _ in range(SWEEP_PER_HIT):
+            if not state:
+                return
+            key, oldest = next(iter(state.items()))
+            if oldest[0] > now:
+                break
+            del state[key]
+        # Hard cap on tracked keys, dropping the least recently seen
+        while len(state) > self.max_keys:
+            state.popitem(last=False)
+
+    def sweep(self) -> int:
+        """Drops every idle key. Returns how many were removed."""
+        now = self.clock()
+        idle = [key for key, state in self._state.items() if state[0] <= now]
+        for key in idle:
+            del self._state[key]
+        return len(idle)
+
+    @abstractmethod
+    def _check(self, state, now: float, limit: int, period: float):
+        """Returns (allowed, new state); a new state of None leaves the key's state unchanged."""
+
+
+class GCRALimiter(RateLimiter):
+    """
+    Generic Cell Rate Algorithm (a token bucket without a refill timer).
+    State per key is a single float: the theoretical arrival time (TAT).
+    Allows bursts of up to `limit` requests, refilled at `limit / period` per second.
+    """
+
+    def _check(self, state, now: float, limit: int, period: float):
+        interval = period / limit
+        tat = max(state[0], now) if state is not None else now
+        new_tat = tat + interval
+        if new_tat - now > period:
+            return False, None
+        return True, (new_tat,)
+
+
+class SlidingWindowLimiter(RateLimiter):
+    """
+    Sliding-window counter: weights the previous fixed window's count by how much
+    of it still overlaps the sliding window.
+    State per key is (idle_at, window_index, previous_count, current_count).
+    """
+
+    def _check(self, state, now: float, limit: int, period: float):
+        window = int(now // period)
+        if state is None:
+            previous, current = 0, 0
+        elif state[1] == window:
+            previous, current = state[2], state[3]
+        elif state[1] == window - 1:
+            previous, current = state[3], 0
+        else:
+            previous, current = 0, 0
+
+        weight = 1 - (now - window * period) / period
+        if previous * weight + current + 1 > limit:
+            return False, None
+        return True, ((window + 2) * period, window, previous, current + 1)
+
+
+class SharedRateLimiter:
+    """
+    GCRA on the shared state backend, so every replica draws from the same budget per user.
+    hit() is a coroutine here. If the backend is unreachable requests are let through:
+    a brief outage shouldn't lock every user out.
+    """
+
+    def __init__(self, state, prefix: str = "throttle"):
+        self.state = state
+        self.prefix = prefix
+
+    async def hit(self, key: Hashable, limit: int, period: float) -> bool:
+        parts = key if isinstance(key, tuple) else (key,)
+        try:
+            return await self.state.hit(":".join([self.prefix, *map(str, parts)]), limit, period)
+        except Exception as e:
+            logging.error(f"Shared rate limit check failed, allowing the request: {e}")
+            return True
+
+
+ALGORITHMS = {
+    "gcra": GCRALimiter,
+    "token_bucket": GCRALimiter,
+    "sliding_window": SlidingWindowLimiter,
+}
+
+
+def create_rate_limiter(algorithm: str = "gcra", max_keys: int = 100_000, **kwargs) -> RateLimiter:
+    try:
+        limiter_cls = ALGORITHMS[algorithm]
+    except KeyError:
+        raise ValueError(f"Unknown rate limit algorithm '{algorithm}'. Choose one of: {', '.join(ALGORITHMS)}")
+    return limiter_cls(max_keys=max_keys, **kwargs)
@@ -0,0 +1,248 @@
+# app/services/send_scheduler.py
+
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+# Lower value = sent first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+_priority: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("send_priority", default=None)
+
+# API methods that post or change messages and therefore count against Telegram's flood limits
+_LIMITED_METHODS = {"copyMessage", "copyMessages", "forwardMessage", "forwardMessages"}
+
+
+@contextlib.contextmanager
+def low_priority() -> Iterator[None]:
+    """Sends made inside this block (e.g. log messages) yield to everything else."""
+    token = _priority.set(PRIORITY_LOW)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def is_rate_limited(method: TelegramMethod) -> bool:
+    name = method.__api_method__
+    return name.startswith("send") or name.startswith("editMessage") or name in _LIMITED_METHODS
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def ready_at(self, now: float) -> float:
+        """Earliest time at which one token can be taken."""
+        self._refill(now)
+        ready = now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+        return max(ready, self.paused_until)
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """
+    Session middleware that queues every message-sending Bot API call behind a global
+    token bucket and one bucket per chat, releasing them in priority order.
+    A 429 pauses the affected chat (or everything) for `retry_after` and retries the call.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        global_burst: Optional[float] = None,
+        private_rate: float = 1,
+        group_rate: float = 20 / 60,
+        chat_burst: float = 3,
+        max_retries: int = 5,
+        high_priority_chats: Tuple[int, ...] = (),
+        max_idle_buckets: int = 10000,
+    ):
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.high_priority_chats = set(high_priority_chats)
+        self.max_idle_buckets = max_idle_buckets
+        self.clock = time.monotonic
+        self._global = TokenBucket(global_rate, global_burst or global_rate, self.clock())
+        self._chats: Dict[int, TokenBucket] = {}
+        # Waiting requests per chat, sorted by (priority, sequence); each entry is (priority, seq, future)
+        self._waiting: Dict[Optional[int], List[Tuple[int, int, asyncio.Future]]] = {}
+        # Heap of the chats' first requests, as (priority, seq, chat_id); checked against their bucket when popped
+        self._ready: List[Tuple[int, int, Optional[int]]] = []
+        # Heap of chats waiting for their bucket, as (ready_at, seq, chat_id)
+        self._blocked: List[Tuple[float, int, Optional[int]]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pump: Optional[asyncio.Task] = None
+        # Metrics
+        self.sent = 0
+        self.retries = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if not is_rate_limited(method):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        chat_id = chat_id if isinstance(chat_id, int) else None
+        priority = _priority.get()
+        if priority is None:
+            priority = PRIORITY_HIGH if chat_id in self.high_priority_chats else PRIORITY_NORMAL
+
+        # A retry keeps its place, ahead of the chat's later requests
+        seq = next(self._seq)
+        attempt = 0
+        while True:
+            await self._acquire(chat_id, priority, seq)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self.retries += 1
+                self._pause(chat_id, e.retry_after)
+                if attempt > self.max_retries:
+                    raise
+                logging.warning(
+                    f"Flood control on {method.__api_method__} in chat {chat_id}, "
+                    f"retrying in {e.retry_after}s (attempt {attempt}/{self.max_retries})"
+                )
+
+    def _bucket(self, chat_id: Optional[int], now: float) -> Optional[TokenBucket]:
+        if chat_id is None:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_idle_buckets:
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.is_idle(now)}
+            rate = self.private_rate if chat_id > 0 else self.group_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, self.chat_burst, now)
+        return bucket
+
+    def _pause(self, chat_id: Optional[int], retry_after: float):
+        until = self.clock() + retry_after
+        bucket = self._bucket(chat_id, self.clock())
+        target = bucket if bucket is not None else self._global
+        target.paused_until = max(target.paused_until, until)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _acquire(self, chat_id: Optional[int], priority: int, seq: int):
+        loop = asyncio.get_running_loop()
+        if self._pump is None or self._pump.done():
+            self._wakeup = asyncio.Event()
+            self._pump = loop.create_task(self._run())
+        future = loop.create_future()
+        queue = self._waiting.setdefault(chat_id, [])
+        bisect.insort(queue, (priority, seq, future), key=lambda entry: entry[:2])
+        if queue[0][2] is future:
+            heapq.heappush(self._ready, (priority, seq, chat_id))
+        self._wakeup.set()
+        enqueued = self.clock()
+        await future
+        waited = self.clock() - enqueued
+        self.sent += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    async def _run(self):
+        while True:
+            now = self.clock()
+            while self._blocked and self._blocked[0][0] <= now:
+                self._schedule(heapq.heappop(self._blocked)[2])
+            global_ready = self._global.ready_at(now)
+            if not self._ready or global_ready > now:
+                wake = [self._blocked[0][0]] if self._blocked else []
+                if self._ready:
+                    wake.append(global_ready)
+                await self._sleep(min(wake, default=None))
+                continue
+
+            priority, seq, chat_id = heapq.heappop(self._ready)
+            queue = self._waiting.get(chat_id)
+            if not queue or queue[0][:2] != (priority, seq):
+                continue  # Already sent, or overtaken by a more urgent request of the same chat
+            if queue[0][2].done():  # Caller gave up waiting
+                queue.pop(0)
+                self._schedule(chat_id)
+                continue
+            bucket = self._bucket(chat_id, now)
+            ready = bucket.ready_at(now) if bucket is not None else now
+            if ready > now:
+                heapq.heappush(self._blocked, (ready, seq, chat_id))
+                continue
+            self._global.consume(now)
+            if bucket is not None:
+                bucket.consume(now)
+            queue.pop(0)[2].set_result(None)
+            self._schedule(chat_id)
+
+    def _schedule(self, chat_id: Optional[int]):
+        """Offers the chat's first waiting request to the next free token."""
+        queue = self._waiting.get(chat_id)
+        if not queue:
+            self._waiting.pop(chat_id, None)
+            return
+        priority, seq, _ = queue[0]
+        heapq.heappush(self._ready, (priority, seq, chat_id))
+
+    async def _sleep(self, until: Optional[float]):
+        self._wakeup.clear()
+        timeout = None if until is None else max(0.0, until - self.clock())
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queue_depth": sum(1 for queue in self._waiting.values() for entry in queue if not entry[2].done()),
+            "sent": self.sent,
+            "retries": self.retries,
+            "avg_wait": self.total_wait / self.sent if self.sent else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+    async def close(self):
+        if self._pump is not None:
+            self._pump.cancel()
+            self._pump = None
@@ -0,0 +1,427 @@
+# app/services/shared_state.py
+
+import asyncio
+import hashlib
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Set, Tuple, Union
+from urllib.parse import unquote, urlparse
+
+from app.services.rate_limiter import GCRALimiter
+
+# GCRA (see GCRALimiter) run inside Redis, so replicas share one budget per key.
+# Uses the server clock, so replicas with skewed clocks still agree. Needs Redis 5+.
+GCRA_SCRIPT = """
+local now_t = redis.call('TIME')
+local now = tonumber(now_t[1]) + tonumber(now_t[2]) / 1000000
+local limit = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local tat = now
+local stored = redis.call('GET', KEYS[1])
+if stored then
+    tat = math.max(tonumber(stored), now)
+end
+local new_tat = tat + period / limit
+if new_tat - now > period then
+    return 0
+end
+redis.call('SET', KEYS[1], string.format('%.6f', new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return 1
+"""
+
+# Replaces a value only if it is still the one the caller read; ARGV[1] is '1' when it expects no value
+COMPARE_AND_SET_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if ARGV[1] == '1' then
+    if current then
+        return 0
+    end
+elseif current ~= ARGV[2] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[3])
+return 1
+"""
+
+# Appends ARGV[2..] to the list at KEYS[1] and sets its expiry, unless KEYS[2] exists; returns the new length or 0
+PUSH_UNLESS_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+local length = redis.call('RPUSH', KEYS[1], unpack(ARGV, 2))
+redis.call('PEXPIRE', KEYS[1], ARGV[1])
+return length
+"""
+
+# Writes between sweeps of expired keys in MemoryState
+_SWEEP_EVERY = 1000
+
+
+class RedisError(Exception):
+    """An error reply from the server, or a connection that failed mid-command."""
+
+
+class SharedState(ABC):
+    """
+    State that every replica of the bot must agree on: rate-limit counters, album buffers,
+    FSM state and the admin list. Values are strings; keys get the backend's prefix.
+    Each method is atomic, so N replicas behave like one bot.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        """Returns the value at `key`, or None if it is missing or has expired."""
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: Optional[float] = None, only_if_absent: bool = False) -> bool:
+        """Stores `value`, expiring after `ttl` seconds. Returns False if `only_if_absent` and the key exists."""
+
+    @abstractmethod
+    async def compare_and_set(self, key: str, expected: Optional[str], value: str) -> bool:
+        """
+        Stores `value`, without expiry, only if `key` still holds `expected` (None: only if it is missing).
+        Read, change, and retry on False to update a value without losing another replica's write.
+        """
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> int:
+        """Deletes the keys; returns how many existed."""
+
+    @abstractmethod
+    async def hit(self, key: str, limit: int, period: float) -> bool:
+        """Registers a request for `key`; returns False if it exceeds `limit` per `period` (GCRA)."""
+
+    @abstractmethod
+    async def push(self, key: str, values: Sequence[str], ttl: float, unless: Optional[str] = None) -> int:
+        """
+        Appends to the list at `key` and (re)sets its expiry; returns the new length.
+        Appends nothing and returns 0 if the key `unless` exists.
+        """
+
+    @abstractmethod
+    async def take_all(
+        self, key: str, *also_delete: str, mark: Optional[str] = None, ttl: Optional[float] = None
+    ) -> List[str]:
+        """
+        Returns the list at `key` and deletes it, together with `also_delete`, in one step.
+        The same step sets `mark`, expiring after `ttl` seconds, so a later push can check for it.
+        """
+
+    @abstractmethod
+    async def add_members(self, key: str, *members: str) -> int:
+        """Adds to the set at `key`, which never expires; returns how many were new."""
+
+    @abstractmethod
+    async def remove_members(self, key: str, *members: str) -> int:
+        """Removes from the set at `key`; returns how many were in it."""
+
+    @abstractmethod
+    async def members(self, key: str) -> Set[str]:
+        """Returns the set at `key`, empty if it is missing."""
+
+    async def close(self):
+        pass
+
+
+class MemoryState(SharedState):
+    """The in-process backend: one replica, no server needed."""
+
+    def __init__(self, max_keys: int = 100_000, clock=time.monotonic):
+        self.clock = clock
+        # key -> (value, expires_at or None)
+        self._values: Dict[str, Tuple[Union[str, List[str], Set[str]], Optional[float]]] = {}
+        self._limiter = GCRALimiter(max_keys=max_keys, clock=clock)
+        self._writes = 0
+
+    def _get(self, key: str):
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= self.clock():
+            del self._values[key]
+            return None
+        return entry[0]
+
+    def _put(self, key: str, value, ttl: Optional[float]):
+        self._values[key] = (value, self.clock() + ttl if ttl is not None else None)
+        self._writes += 1
+        if self._writes % _SWEEP_EVERY == 0:
+            now = self.clock()
+            for expired in [k for k, (_, at) in self._values.items() if at is not None and at <= now]:
+                del self._values[expired]
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self._get(key)
+        return value if isinstance(value, str) else None
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None, only_if_absent: bool = False) -> bool:
+        if only_if_absent and self._get(key) is not None:
+            return False
+        self._put(key, value, ttl)
+        return True
+
+    async def compare_and_set(self, key: str, expected: Optional[str], value: str) -> bool:
+        if self._get(key) != expected:
+            return False
+        self._put(key, value, None)
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self._values.pop(key, None) is not None for key in keys)
+
+    async def hit(self, key: str, limit: int, period: float) -> bool:
+        return self._limiter.hit(key, limit, period)
+
+    async def push(self, key: str, values: Sequence[str], ttl: float, unless: Optional[str] = None) -> int:
+        if unless is not None and self._get(unless) is not None:
+            return 0
+        items = self._get(key)
+        items = list(items) if isinstance(items, list) else []
+        items.extend(values)
+        self._put(key, items, ttl)
+        return len(items)
+
+    async def take_all(
+        self, key: str, *also_delete: str, mark: Optional[str] = None, ttl: Optional[float] = None
+    ) -> List[str]:
+        items = self._get(key)
+        await self.delete(key, *also_delete)
+        if mark is not None:
+            self._put(mark, "1", ttl)
+        return list(items) if isinstance(items, list) else []
+
+    async def add_members(self, key: str, *members: str) -> int:
+        current = self._get(key)
+        current = current if isinstance(current, set) else set()
+        added = len(set(members) - current)
+        if added:
+            self._put(key, current | set(members), None)
+        return added
+
+    async def remove_members(self, key: str, *members: str) -> int:
+        current = self._get(key)
+        if not isinstance(current, set):
+            return 0
+        removed = len(current & set(members))
+        if removed:
+            remaining = current - set(members)
+            if remaining:
+                self._put(key, remaining, None)
+            else:
+                del self._values[key]
+        return removed
+
+    async def members(self, key: str) -> Set[str]:
+        current = self._get(key)
+        return set(current) if isinstance(current, set) else set()
+
+
+def _encode(args: Sequence[Any]) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    """Reads one RESP2 reply. Error replies are returned as RedisError, not raised."""
+    line = await reader.readuntil(b"\r\n")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode("utf-8")
+    if kind == b"-":
+        return RedisError(body.decode("utf-8"))
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2].decode("utf-8")
+    if kind == b"*":
+        length = int(body)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RedisError(f"Unexpected reply from server: {line!r}")
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def pipeline(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        # All commands go out in one write; the replies come back in order
+        self.writer.write(b"".join(_encode(command) for command in commands))
+        await self.writer.drain()
+        return [await read_reply(self.reader) for _ in commands]
+
+    def close(self):
+        self.writer.close()
+
+
+class RedisState(SharedState):
+    """
+    The shared backend: any server speaking the Redis protocol (Redis, Valkey, KeyDB...).
+    A small built-in client keeps up to `pool_size` connections; a broken connection is
+    dropped and replaced on the next call.
+    """
+
+    def __init__(
+        self, url: str = "redis://localhost:6379/0", prefix: str = "bot:", pool_size: int = 4, timeout: float = 5.0
+    ):
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Unsupported shared state URL {url!r}; use redis://[:password@]host[:port][/db]")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._idle: Deque[_Connection] = deque()
+        self._slots = asyncio.Semaphore(pool_size)
+        self._script_shas: Dict[str, str] = {}
+
+    async def _connect(self) -> _Connection:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        connection = _Connection(reader, writer)
+        setup = []
+        if self.password is not None:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            for reply in await connection.pipeline(setup):
+                if isinstance(reply, RedisError):
+                    connection.close()
+                    raise reply
+        return connection
+
+    async def pipeline(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        """Runs commands back to back on one connection; error replies are returned in place."""
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else None
+            try:
+                if connection is None:
+                    connection = await asyncio.wait_for(self._connect(), self.timeout)
+                replies = await asyncio.wait_for(connection.pipeline(commands), self.timeout)
+            except (OSError, EOFError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                if connection is not None:
+                    connection.close()
+                raise RedisError(f"Shared state server {self.host}:{self.port} unavailable: {e!r}") from e
+            except BaseException:
+                # Cancelled mid-reply: the connection's read position is unknown
+                if connection is not None:
+                    connection.close()
+                raise
+            self._idle.append(connection)
+            return replies
+
+    async def execute(self, *args: Any) -> Any:
+        reply = (await self.pipeline([args]))[0]
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    async def transaction(self, *commands: Sequence[Any]) -> List[Any]:
+        """Runs the commands atomically (MULTI/EXEC) and returns their replies."""
+        replies = await self.pipeline([("MULTI",), *commands, ("EXEC",)])
+        result = replies[-1]
+        if isinstance(result, RedisError):
+            raise result
+        for reply in result:
+            if isinstance(reply, RedisError):
+                raise reply
+        return result
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.execute("GET", self.prefix + key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None, only_if_absent: bool = False) -> bool:
+        args = ["SET", self.prefix + key, value]
+        if ttl is not None:
+            args += ["PX", max(1, int(ttl * 1000))]
+        if only_if_absent:
+            args.append("NX")
+        return await self.execute(*args) is not None
+
+    async def compare_and_set(self, key: str, expected: Optional[str], value: str) -> bool:
+        args = (1, self.prefix + key, "1" if expected is None else "0", expected or "", value)
+        return bool(await self._eval(COMPARE_AND_SET_SCRIPT, *args))
+
+    async def delete(self, *keys: str) -> int:
+        return await self.execute("DEL", *(self.prefix + key for key in keys))
+
+    async def _eval(self, script: str, *args: Any) -> Any:
+        sha = self._script_shas.get(script)
+        if sha is None:
+            sha = self._script_shas[script] = hashlib.sha1(script.encode("utf-8")).hexdigest()
+        try:
+            return await self.execute("EVALSHA", sha, *args)
+        except RedisError as e:
+            if not str(e).startswith("NOSCRIPT"):
+                raise
+            # First use on this server; EVAL also caches it for the next EVALSHA
+            return await self.execute("EVAL", script, *args)
+
+    async def hit(self, key: str, limit: int, period: float) -> bool:
+        return bool(await self._eval(GCRA_SCRIPT, 1, self.prefix + key, limit, period))
+
+    async def push(self, key: str, values: Sequence[str], ttl: float, unless: Optional[str] = None) -> int:
+        key = self.prefix + key
+        milliseconds = max(1, int(ttl * 1000))
+        if unless is not None:
+            return await self._eval(PUSH_UNLESS_SCRIPT, 2, key, self.prefix + unless, milliseconds, *values)
+        length, _ = await self.transaction(("RPUSH", key, *values), ("PEXPIRE", key, milliseconds))
+        return length
+
+    async def take_all(
+        self, key: str, *also_delete: str, mark: Optional[str] = None, ttl: Optional[float] = None
+    ) -> List[str]:
+        commands = [
+            ("LRANGE", self.prefix + key, 0, -1), ("DEL", self.prefix + key, *(self.prefix + k for k in also_delete))
+        ]
+        if mark is not None:
+            commands.append(("SET", self.prefix + mark, "1", *(("PX", max(1, int(ttl * 1000))) if ttl else ())))
+        items = (await self.transaction(*commands))[0]
+        return items or []
+
+    async def add_members(self, key: str, *members: str) -> int:
+        return await self.execute("SADD", self.prefix + key, *members)
+
+    async def remove_members(self, key: str, *members: str) -> int:
+        return await self.execute("SREM", self.prefix + key, *members)
+
+    async def members(self, key: str) -> Set[str]:
+        return set(await self.execute("SMEMBERS", self.prefix + key) or [])
+
+    async def close(self):
+        while self._idle:
+            connection = self._idle.pop()
+            connection.close()
+            try:
+                await connection.writer.wait_closed()
+            except OSError:
+                pass
+
+
+def create_shared_state(config) -> Optional[SharedState]:
+    """The shared state backend selected in config.yaml, or None to keep all state in this process."""
+    shared_config = config.get("shared_state", {})
+    if not shared_config.get("enabled"):
+        return None
+    backend = shared_config.get("backend", "redis")
+    if backend == "memory":
+        return MemoryState()
+    logging.info(f"Sharing state through {shared_config.get('url', 'redis://localhost:6379/0')}.")
+    return RedisState(
+        shared_config.get("url", "redis://localhost:6379/0"),
+        prefix=shared_config.get("prefix", "bot:"),
+        pool_size=shared_config.get("pool_size", 4),
+        timeout=shared_config.get("timeout", 5.0),
+    )
@@ -1,34 +1,181 @@
 import asyncio
 import json
 import logging
+import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.services.shared_state import SharedState
+
+# (version, user_id, alias); alias None means removal
+Change = Tuple[int, int, Optional[str]]
+
+
+def _fsync_directory(path: Path):
+    """Makes a rename in `path` durable. Not supported (nor needed) on Windows."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
 
 class StorageService:
-    def __init__(self, filepath: Path, backup_count: int = 3):
+    """
+    The admin registry: served from memory, persisted to a JSON file with rotating backups.
+    File I/O runs on a dedicated writer thread, so a slow disk never stalls the event loop.
+    Changes apply in memory at once; mutations made while a write is running are saved
+    together by the next write (group commit), and each caller returns once its change is on disk.
+
+    With a shared state backend, the registry is also kept under `shared_key`: saved changes are
+    applied to the shared copy by compare-and-set, so edits made on several replicas at once are
+    merged, and watch() adopts the changes other replicas make.
+    """
+
+    def __init__(
+        self, filepath: Path, backup_count: int = 3, shared: Optional[SharedState] = None, shared_key: str = "admins"
+    ):
         self.filepath = filepath
         self.backup_count = backup_count
+        self.shared = shared
+        self.shared_key = shared_key
+        # The shared registry as last published or adopted by this replica
+        self._shared_seen: Optional[str] = None
+        # Held while a write is in progress
         self.lock = asyncio.Lock()
+        # Authoritative in-memory registry, keyed by user id
+        self._admins: Dict[int, dict] = {}
+        # The registry as last written to disk, and the changes made since
+        self._durable: Dict[int, dict] = {}
+        self._changes: List[Change] = []
+        self._version = 0
+        self._written_version = 0
+        self._writing: Optional[asyncio.Task] = None
+        self._writing_version = 0
+        self._mtime: Optional[int] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="admins-writer")
         self._initialize_file()
 
     def _initialize_file(self):
-        """Ensures the admin file exists and is valid JSON."""
+        """Ensures the admin file exists and is valid JSON, then loads it into memory."""
         if not self.filepath.exists():
             with open(self.filepath, "w", encoding="utf-8") as f:
                 json.dump({"admins": []}, f, indent=2)
-        else:
+        try:
+            self._load()
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+            logging.error(f"Error: {self.filepath} is malformed. Please fix it or delete it to start fresh.")
+            raise ValueError(f"Malformed JSON in {self.filepath}")
+
+    def _load(self):
+        """Reads the admin file and rebuilds the in-memory index."""
+        mtime = self.filepath.stat().st_mtime_ns
+        with open(self.filepath, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        admins = {int(admin["id"]): {"id": int(admin["id"]), "alias": admin["alias"]}
+                  for admin in data.get("admins", [])}
+        self._admins = admins
+        self._durable = {user_id: dict(admin) for user_id, admin in admins.items()}
+        self._mtime = mtime
+
+    def reload_if_changed(self) -> bool:
+        """Reloads the registry if admins.json was edited outside the bot."""
+        try:
+            if self.filepath.stat().st_mtime_ns == self._mtime:
+                return False
+            self._load()
+        except (OSError, KeyError, TypeError, ValueError) as e:
+            logging.error(f"Failed to reload {self.filepath}, keeping current admins: {e}")
+            return False
+        logging.info(f"Reloaded {len(self._admins)} admins from {self.filepath}.")
+        return True
+
+    async def watch(self, interval: float = 2.0):
+        """Polls the file's mtime and reloads external edits, and syncs with other replicas. Runs until cancelled."""
+        while True:
+            # Unsaved changes would be lost by a reload
+            if not self.lock.locked() and not self._changes:
+                if self.reload_if_changed():
+                    await self._publish()
+                if self.shared is not None:
+                    await self.sync_shared()
+            await asyncio.sleep(interval)
+
+    def _payload(self, admins: Dict[int, dict]) -> str:
+        return json.dumps({"admins": list(admins.values())}, ensure_ascii=False, sort_keys=True)
+
+    @staticmethod
+    def _parse(payload: str) -> Dict[int, dict]:
+        return {int(admin["id"]): {"id": int(admin["id"]), "alias": admin["alias"]}
+                for admin in json.loads(payload)["admins"]}
+
+    async def _publish(self, changes: Optional[List[Change]] = None):
+        """
+        Applies `changes` to the shared registry as it is now, retrying if another replica wrote it
+        in between. Without `changes`, the local registry replaces the shared one (admins.json was edited).
+        """
+        if self.shared is None:
+            return
+        local = self._payload(self._durable)
+        try:
+            if changes is None:
+                await self.shared.set(self.shared_key, local)
+                payload = local
+            else:
+                while True:
+                    current = await self.shared.get(self.shared_key)
+                    admins = self._parse(current) if current is not None else dict(self._durable)
+                    for change in changes:
+                        self._apply_to(admins, change)
+                    payload = self._payload(admins)
+                    if await self.shared.compare_and_set(self.shared_key, current, payload):
+                        break
+        except Exception as e:
+            logging.error(f"Failed to share the admin list, other replicas keep their copy for now: {e}")
+            return
+        # If other replicas' changes were merged in, the next sync adopts them
+        if payload == local:
+            self._shared_seen = payload
+
+    async def sync_shared(self):
+        """Adopts the admin list another replica published; the first replica to start seeds it."""
+        try:
+            payload = await self.shared.get(self.shared_key)
+        except Exception as e:
+            logging.error(f"Failed to read the shared admin list: {e}")
+            return
+        if payload is None:
+            payload = self._payload(self._durable)
             try:
-                with open(self.filepath, "r", encoding="utf-8") as f:
-                    json.load(f)
-            except (json.JSONDecodeError, ValueError):
-                logging.error(f"Error: {self.filepath} is malformed. Please fix it or delete it to start fresh.")
-                raise ValueError(f"Malformed JSON in {self.filepath}")
-
-    async def _rotate_backups(self):
-        """Manages backup rotation."""
+                if await self.shared.compare_and_set(self.shared_key, None, payload):
+                    self._shared_seen = payload
+            except Exception as e:
+                logging.error(f"Failed to share the admin list, other replicas keep their copy for now: {e}")
+            return
+        if payload == self._shared_seen or self.lock.locked() or self._changes:
+            return
+        admins = self._parse(payload)
+        self._admins = admins
+        self._durable = {user_id: dict(admin) for user_id, admin in admins.items()}
+        self._shared_seen = payload
+        # Keep the local file current, for restarts without the shared backend
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            self._mtime = await loop.run_in_executor(self._executor, self._write_file, list(admins.values()))
+        logging.info(f"Adopted {len(admins)} admins from another replica.")
+
+    def _rotate_backups(self):
+        """Manages backup rotation. Runs on the writer thread."""
         if not self.filepath.exists():
             return
-        
+
         # Delete the oldest backup if we've reached the limit
         oldest_backup = self.filepath.with_suffix(f".bak{self.backup_count}")
         if oldest_backup.exists():
@@ -39,48 +186,108 @@ class StorageService:
             src = self.filepath.with_suffix(f".bak{i}")
             dst = self.filepath.with_suffix(f".bak{i+1}")
             if src.exists():
-                shutil.move(src, dst)
-        
+                os.replace(src, dst)
+
         # Create the newest backup
-        shutil.copy(self.filepath, self.filepath.with_suffix(".bak1"))
+        shutil.copyfile(self.filepath, self.filepath.with_suffix(".bak1"))
 
-    async def _read_data(self):
+    def _write_file(self, admins: List[dict]) -> int:
+        """Rotates backups and replaces the file atomically; returns its new mtime. Runs on the writer thread."""
+        payload = json.dumps({"admins": admins}, indent=2, ensure_ascii=False).encode("utf-8")
+        self._rotate_backups()
+        temp_filepath = self.filepath.with_suffix(".tmp")
+        with open(temp_filepath, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        # Atomic move; syncing the directory makes the rename itself survive a crash
+        os.replace(temp_filepath, self.filepath)
+        _fsync_directory(self.filepath.parent)
+        return self.filepath.stat().st_mtime_ns
+
+    async def _write_snapshot(self, version: int, snapshot: Dict[int, dict]):
+        """Writes a snapshot of the registry holding every change up to `version`."""
         async with self.lock:
+            loop = asyncio.get_running_loop()
             try:
-                with open(self.filepath, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                return {"admins": []}
+                self._mtime = await loop.run_in_executor(self._executor, self._write_file, list(snapshot.values()))
+            except Exception:
+                # Undo the changes this write was meant to save; later ones are replayed on top
+                self._admins = {user_id: dict(admin) for user_id, admin in self._durable.items()}
+                self._changes = [change for change in self._changes if change[0] > version]
+                for change in self._changes:
+                    self._apply(change)
+                raise
+            finally:
+                self._writing = None
+            self._durable = snapshot
+            self._written_version = version
+            written = [change for change in self._changes if change[0] <= version]
+            self._changes = [change for change in self._changes if change[0] > version]
+        await self._publish(written)
 
-    async def _write_data(self, data):
-        async with self.lock:
-            await self._rotate_backups()
-            temp_filepath = self.filepath.with_suffix(".tmp")
-            with open(temp_filepath, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            # Atomic move
-            temp_filepath.rename(self.filepath)
+    async def _commit(self):
+        """Returns once every change made so far is on disk; raises if the write holding ours failed."""
+        version = self._version
+        while self._written_version < version:
+            if self._writing is None:
+                self._writing_version = self._version
+                snapshot = {user_id: dict(admin) for user_id, admin in self._admins.items()}
+                self._writing = asyncio.ensure_future(self._write_snapshot(self._version, snapshot))
+            writing, covers = self._writing, self._writing_version
+            try:
+                # Shielded, so one cancelled caller doesn't abort the write for the others
+                await asyncio.shield(writing)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                if covers >= version:
+                    raise
+                # That write only held earlier changes; ours goes into the next one
+
+    @staticmethod
+    def _apply_to(admins: Dict[int, dict], change: Change):
+        _, user_id, alias = change
+        if alias is None:
+            admins.pop(user_id, None)
+        else:
+            admins[user_id] = {"id": user_id, "alias": alias}
+
+    def _apply(self, change: Change):
+        self._apply_to(self._admins, change)
 
-    async def get_admins(self):
-        data = await self._read_data()
-        return data.get("admins", [])
+    def _change(self, user_id: int, alias: Optional[str]):
+        self._version += 1
+        change = (self._version, user_id, alias)
+        self._changes.append(change)
+        self._apply(change)
+
+    def __len__(self) -> int:
+        return len(self._admins)
+
+    def get_admin(self, user_id: int) -> Optional[dict]:
+        """O(1) lookup that never touches the disk."""
+        return self._admins.get(user_id)
+
+    async def get_admins(self) -> List[dict]:
+        return [dict(admin) for admin in self._admins.values()]
 
     async def add_admin(self, user_id: int, alias: str):
-        data = await self._read_data()
-        admins = data.get("admins", [])
         # Avoid duplicates
-        if not any(admin["id"] == user_id for admin in admins):
-            admins.append({"id": user_id, "alias": alias})
-            data["admins"] = admins
-            await self._write_data(data)
+        if user_id not in self._admins:
+            self._change(user_id, alias)
+        await self._commit()
 
     async def remove_admin(self, user_id: int) -> bool:
-        data = await self._read_data()
-        admins = data.get("admins", [])
-        original_len = len(admins)
-        admins = [admin for admin in admins if admin["id"] != user_id]
-        if len(admins) < original_len:
-            data["admins"] = admins
-            await self._write_data(data)
-            return True
-        return False
\ No newline at end of file
+        if user_id not in self._admins:
+            return False
+        self._change(user_id, None)
+        await self._commit()
+        return True
+
+    async def close(self):
+        """Waits for pending changes to be written and stops the writer thread."""
+        try:
+            await self._commit()
+        finally:
+            self._executor.shutdown(wait=True)
@@ -0,0 +1,469 @@
+# app/services/submission_store.py
+
+import json
+import logging
+import secrets
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Union
+
+from app.services.shared_state import SharedState
+from app.utils.sqlite import SQLiteDatabase
+from app.utils.submission import Submission
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id TEXT PRIMARY KEY,
+    submitter_id INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    submission TEXT NOT NULL,
+    report_chat_id INTEGER NOT NULL,
+    report_message_ids TEXT NOT NULL,
+    report_header TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    resolved_at REAL
+);
+CREATE INDEX IF NOT EXISTS submissions_status ON submissions (status);
+CREATE INDEX IF NOT EXISTS submissions_resolved_at ON submissions (resolved_at);
+"""
+
+# Resolved submissions are swept at most this often while the bot runs
+PRUNE_INTERVAL = 3600
+
+# A claim not resolved or released by then (its replica died) lapses, and the submission can be handled again
+CLAIM_TTL = 600
+# Shared state set of the ids of pending submissions
+SHARED_INDEX_KEY = "submissions:pending"
+
+STATUS_PENDING = "pending"
+STATUS_APPROVED = "approved"
+STATUS_DELETED = "deleted"
+STATUS_FAILED = "failed"
+
+
+@dataclass(slots=True)
+class PendingSubmission:
+    """A user submission waiting in the report group for a moderator's decision."""
+    id: str
+    submitter_id: int
+    subject: str
+    submission: Submission
+    report_chat_id: int
+    created_at: float
+    report_header: str = ""
+    report_message_ids: List[int] = field(default_factory=list)
+
+
+def _insert(connection: sqlite3.Connection, pending: PendingSubmission):
+    with connection:
+        connection.execute(
+            "INSERT INTO submissions "
+            "(id, submitter_id, subject, submission, report_chat_id, report_message_ids, report_header, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                pending.id, pending.submitter_id, pending.subject,
+                json.dumps(pending.submission.to_dict(), ensure_ascii=False),
+                pending.report_chat_id, json.dumps(pending.report_message_ids), pending.report_header,
+                STATUS_PENDING, pending.created_at,
+            ),
+        )
+
+
+def _add_missing_columns(connection: sqlite3.Connection):
+    # Databases created before report headers were stored
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(submissions)")}
+    if "report_header" not in columns:
+        with connection:
+            connection.execute("ALTER TABLE submissions ADD COLUMN report_header TEXT NOT NULL DEFAULT ''")
+
+
+def _dump_pending(pending: PendingSubmission) -> str:
+    return json.dumps({
+        "id": pending.id, "submitter_id": pending.submitter_id, "subject": pending.subject,
+        "submission": pending.submission.to_dict(), "report_chat_id": pending.report_chat_id,
+        "created_at": pending.created_at, "report_header": pending.report_header,
+        "report_message_ids": pending.report_message_ids,
+    }, ensure_ascii=False)
+
+
+def _load_pending(payload: str) -> PendingSubmission:
+    data = json.loads(payload)
+    return PendingSubmission(**{**data, "submission": Submission.from_dict(data["submission"])})
+
+
+def _row_to_pending(row) -> PendingSubmission:
+    return PendingSubmission(
+        id=row[0],
+        submitter_id=row[1],
+        subject=row[2],
+        submission=Submission.from_dict(json.loads(row[3])),
+        report_chat_id=row[4],
+        report_message_ids=json.loads(row[5]),
+        report_header=row[6],
+        created_at=row[7],
+    )
+
+
+_SELECT_PENDING = (
+    "SELECT id, submitter_id, subject, submission, report_chat_id, report_message_ids, report_header, created_at "
+    "FROM submissions WHERE status = ?"
+)
+
+
+def _select_pending(connection: sqlite3.Connection, submission_id: Optional[str] = None) -> List[PendingSubmission]:
+    if submission_id is None:
+        rows = connection.execute(f"{_SELECT_PENDING} ORDER BY created_at", (STATUS_PENDING,)).fetchall()
+    else:
+        rows = connection.execute(f"{_SELECT_PENDING} AND id = ?", (STATUS_PENDING, submission_id)).fetchall()
+    return [_row_to_pending(row) for row in rows]
+
+
+def _update_messages(connection: sqlite3.Connection, submission_id: str, message_ids: List[int]):
+    with connection:
+        connection.execute(
+            "UPDATE submissions SET report_message_ids = ? WHERE id = ?", (json.dumps(message_ids), submission_id)
+        )
+
+
+def _update_status(connection: sqlite3.Connection, submission_id: str, status: str, resolved_at: Optional[float]):
+    with connection:
+        connection.execute(
+            "UPDATE submissions SET status = ?, resolved_at = ? WHERE id = ?", (status, resolved_at, submission_id)
+        )
+
+
+def _prune(connection: sqlite3.Connection, resolved_before: float) -> int:
+    with connection:
+        return connection.execute(
+            "DELETE FROM submissions WHERE status != ? AND resolved_at < ?", (STATUS_PENDING, resolved_before)
+        ).rowcount
+
+
+def _update_status_many(connection: sqlite3.Connection, submission_ids: List[str], status: str, resolved_at: float):
+    with connection:
+        connection.executemany(
+            "UPDATE submissions SET status = ?, resolved_at = ? WHERE id = ?",
+            [(status, resolved_at, submission_id) for submission_id in submission_ids],
+        )
+
+
+class BaseSubmissionStore(ABC):
+    """
+    Pending submissions indexed in memory by a short ID; the subclasses decide where they persist.
+    The ID is what goes into callback_data, so buttons stay well under Telegram's 64-byte limit
+    and every approve/delete is a dictionary lookup.
+    A store with `index=False` only writes; it is for processes that never moderate.
+    """
+
+    def __init__(self, shared: bool, index: bool, clock: Callable[[], float]):
+        self.shared = shared
+        self.index = index
+        self.clock = clock
+        self._pending: Dict[str, PendingSubmission] = {}
+        # Claimed but not yet resolved in the database; fetch() must not bring them back
+        self._claimed: Set[str] = set()
+
+    def _add(self, pendings: List[PendingSubmission]):
+        for pending in pendings:
+            if pending.id not in self._claimed:
+                self._pending.setdefault(pending.id, pending)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _new_id(self) -> str:
+        while True:
+            # 8 URL-safe characters (48 random bits)
+            submission_id = secrets.token_urlsafe(6)
+            if submission_id not in self._pending:
+                return submission_id
+
+    def _new_pending(
+        self, submission: Submission, subject: str, report_chat_id: int, report_header: str
+    ) -> PendingSubmission:
+        return PendingSubmission(
+            id=self._new_id(),
+            submitter_id=submission.user_id,
+            subject=subject,
+            submission=submission,
+            report_chat_id=report_chat_id,
+            created_at=time.time(),
+            report_header=report_header,
+        )
+
+    @abstractmethod
+    async def create(
+        self, submission: Submission, subject: str, report_chat_id: int, report_header: str = ""
+    ) -> PendingSubmission:
+        """Stores a new pending submission."""
+
+    @abstractmethod
+    async def set_report_messages(self, submission_id: str, message_ids: List[int]):
+        """Records which report group messages show the submission."""
+
+    def get(self, submission_id: str) -> Optional[PendingSubmission]:
+        return self._pending.get(submission_id)
+
+    @abstractmethod
+    async def fetch(self, submission_id: str) -> Optional[PendingSubmission]:
+        """Like get(), but a shared store also looks for submissions of other processes."""
+
+    @abstractmethod
+    async def refresh(self):
+        """Indexes the pending submissions other processes added; a no-op unless the store is shared."""
+
+    def pending(self) -> List[PendingSubmission]:
+        """All pending submissions, oldest first."""
+        return sorted(self._pending.values(), key=lambda pending: pending.created_at)
+
+    def select(
+        self, submitter_id: Optional[int] = None, created_before: Optional[float] = None,
+        report_chat_id: Optional[int] = None,
+    ) -> List[PendingSubmission]:
+        """Pending submissions of one submitter and/or created before a timestamp, oldest first."""
+        return [
+            pending for pending in self.pending()
+            if (submitter_id is None or pending.submitter_id == submitter_id)
+            and (created_before is None or pending.created_at < created_before)
+            and (report_chat_id is None or pending.report_chat_id == report_chat_id)
+        ]
+
+    def claim(self, submission_id: str) -> Optional[PendingSubmission]:
+        """
+        Takes a submission out of the pending index so concurrent clicks can't handle it twice.
+        Follow up with resolve() once handled, or release() to put it back.
+        """
+        pending = self._pending.pop(submission_id, None)
+        if pending is not None:
+            self._claimed.add(submission_id)
+        return pending
+
+    async def acquire(self, submission_id: str) -> Optional[PendingSubmission]:
+        """fetch() and claim() in one: what a moderator's click goes through."""
+        await self.fetch(submission_id)
+        return self.claim(submission_id)
+
+    async def release(self, pending: PendingSubmission):
+        self._claimed.discard(pending.id)
+        self._pending[pending.id] = pending
+
+    @abstractmethod
+    async def resolve(self, pending: PendingSubmission, status: str):
+        """Records the decision on a claimed submission and drops it from the index."""
+
+    @abstractmethod
+    async def resolve_many(self, pendings: List[PendingSubmission], status: str):
+        """Resolves several submissions in one step."""
+
+    @abstractmethod
+    async def prune(self) -> int:
+        """Deletes long resolved submissions; returns how many."""
+
+    async def close(self):
+        pass
+
+
+class SubmissionStore(BaseSubmissionStore):
+    """
+    Pending submissions, persisted in SQLite.
+
+    With `shared`, other processes add submissions to the same database: fetch() and refresh()
+    pick them up. Approved and deleted submissions are forgotten `retention` seconds after they
+    were resolved.
+    """
+
+    def __init__(
+        self, path: Union[str, Path], shared: bool = False, index: bool = True,
+        retention: float = 30 * 86400, clock: Callable[[], float] = time.time,
+    ):
+        super().__init__(shared, index, clock)
+        self.db = SQLiteDatabase(path)
+        self.db.execute_script(SCHEMA)
+        _add_missing_columns(self.db.connection)
+        self.retention = retention
+        self._next_prune = 0.0
+        if index:
+            # Only moderating processes resolve submissions, so only they sweep
+            self._add(_select_pending(self.db.connection))
+            self._log_pruned(_prune(self.db.connection, self._start_prune()))
+
+    async def create(
+        self, submission: Submission, subject: str, report_chat_id: int, report_header: str = ""
+    ) -> PendingSubmission:
+        pending = self._new_pending(submission, subject, report_chat_id, report_header)
+        if self.index:
+            self._pending[pending.id] = pending
+        try:
+            await self.db.run(_insert, pending)
+        except Exception:
+            self._pending.pop(pending.id, None)
+            raise
+        return pending
+
+    async def set_report_messages(self, submission_id: str, message_ids: List[int]):
+        pending = self._pending.get(submission_id)
+        if pending is not None:
+            pending.report_message_ids = list(message_ids)
+        await self.db.run(_update_messages, submission_id, list(message_ids))
+
+    async def fetch(self, submission_id: str) -> Optional[PendingSubmission]:
+        pending = self._pending.get(submission_id)
+        if pending is None and self.shared and submission_id not in self._claimed:
+            self._add(await self.db.run(_select_pending, submission_id))
+            pending = self._pending.get(submission_id)
+        return pending
+
+    async def refresh(self):
+        if self.shared and self.index:
+            self._add(await self.db.run(_select_pending))
+
+    async def resolve(self, pending: PendingSubmission, status: str):
+        self._pending.pop(pending.id, None)
+        self._claimed.add(pending.id)
+        try:
+            await self.db.run(_update_status, pending.id, status, self.clock())
+        finally:
+            self._claimed.discard(pending.id)
+        await self.prune()
+
+    async def resolve_many(self, pendings: List[PendingSubmission], status: str):
+        """Resolves several submissions in one transaction."""
+        for pending in pendings:
+            self._pending.pop(pending.id, None)
+            self._claimed.add(pending.id)
+        try:
+            await self.db.run(_update_status_many, [pending.id for pending in pendings], status, self.clock())
+        finally:
+            self._claimed.difference_update(pending.id for pending in pendings)
+        await self.prune()
+
+    def _start_prune(self) -> float:
+        """Schedules the next sweep and returns the cutoff for this one."""
+        now = self.clock()
+        self._next_prune = now + PRUNE_INTERVAL
+        return now - self.retention
+
+    @staticmethod
+    def _log_pruned(deleted: int) -> int:
+        if deleted:
+            logging.info(f"Removed {deleted} resolved submissions older than the retention period.")
+        return deleted
+
+    async def prune(self) -> int:
+        """Deletes submissions resolved more than `retention` seconds ago; does nothing if the last sweep was recent."""
+        if self.clock() < self._next_prune:
+            return 0
+        return self._log_pruned(await self.db.run(_prune, self._start_prune()))
+
+    async def close(self):
+        await self.db.close()
+
+
+class SharedSubmissionStore(BaseSubmissionStore):
+    """
+    Pending submissions kept in shared state instead of SQLite, for replicas that each have their
+    own database: a submission reported by one replica can be approved or deleted on any other,
+    and a claim holds across all of them. Resolved submissions are removed right away.
+    The local index is a cache; fetch() and refresh() bring it up to date.
+    """
+
+    def __init__(
+        self, state: SharedState, index: bool = True, claim_ttl: float = CLAIM_TTL,
+        clock: Callable[[], float] = time.time,
+    ):
+        super().__init__(True, index, clock)
+        self.state = state
+        self.claim_ttl = claim_ttl
+
+    async def create(
+        self, submission: Submission, subject: str, report_chat_id: int, report_header: str = ""
+    ) -> PendingSubmission:
+        while True:
+            pending = self._new_pending(submission, subject, report_chat_id, report_header)
+            # Another replica may have picked the same id
+            if await self.state.set(f"submission:{pending.id}", _dump_pending(pending), only_if_absent=True):
+                break
+        try:
+            await self.state.add_members(SHARED_INDEX_KEY, pending.id)
+        except Exception:
+            await self.state.delete(f"submission:{pending.id}")
+            raise
+        if self.index:
+            self._pending[pending.id] = pending
+        return pending
+
+    async def set_report_messages(self, submission_id: str, message_ids: List[int]):
+        pending = self._pending.get(submission_id)
+        if pending is not None:
+            pending.report_message_ids = list(message_ids)
+        key = f"submission:{submission_id}"
+        while True:
+            current = await self.state.get(key)
+            # Already resolved; writing it back would bring it back to life
+            if current is None:
+                return
+            updated = _load_pending(current)
+            updated.report_message_ids = list(message_ids)
+            if await self.state.compare_and_set(key, current, _dump_pending(updated)):
+                return
+
+    async def fetch(self, submission_id: str) -> Optional[PendingSubmission]:
+        pending = self._pending.get(submission_id)
+        if pending is None and submission_id not in self._claimed:
+            payload = await self.state.get(f"submission:{submission_id}")
+            if payload is not None:
+                self._add([_load_pending(payload)])
+                pending = self._pending.get(submission_id)
+        return pending
+
+    async def refresh(self):
+        """Indexes the submissions other replicas added and forgets the ones they resolved."""
+        if not self.index:
+            return
+        ids = await self.state.members(SHARED_INDEX_KEY)
+        for submission_id in set(self._pending) - ids:
+            del self._pending[submission_id]
+        for submission_id in ids:
+            await self.fetch(submission_id)
+
+    async def acquire(self, submission_id: str) -> Optional[PendingSubmission]:
+        if await self.fetch(submission_id) is None:
+            return None
+        claim_key = f"submission:{submission_id}:claim"
+        if not await self.state.set(claim_key, "1", ttl=self.claim_ttl, only_if_absent=True):
+            return None
+        # This replica's index may still hold a submission another one has resolved
+        pending = self.claim(submission_id) if await self.state.get(f"submission:{submission_id}") else None
+        if pending is None:
+            self._pending.pop(submission_id, None)
+            await self.state.delete(claim_key)
+        return pending
+
+    async def release(self, pending: PendingSubmission):
+        await super().release(pending)
+        await self.state.delete(f"submission:{pending.id}:claim")
+
+    async def resolve(self, pending: PendingSubmission, status: str):
+        await self.resolve_many([pending], status)
+
+    async def resolve_many(self, pendings: List[PendingSubmission], status: str):
+        ids = [pending.id for pending in pendings]
+        for submission_id in ids:
+            self._pending.pop(submission_id, None)
+            self._claimed.add(submission_id)
+        try:
+            await self.state.delete(*(key for i in ids for key in (f"submission:{i}", f"submission:{i}:claim")))
+            await self.state.remove_members(SHARED_INDEX_KEY, *ids)
+        finally:
+            self._claimed.difference_update(ids)
+
+    async def prune(self) -> int:
+        return 0
+
+    async def close(self):
+        # The shared state is closed by its owner
+        pass
@@ -0,0 +1,89 @@
+# app/services/tenants.py
+
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app.services.config import DEFAULT_TENANT, Config
+from app.services.shared_state import SharedState
+from app.services.storage import StorageService
+
+# FSM destiny of a user's tenant choice, apart from the conversation state that handlers clear
+SELECTION_DESTINY = "tenant"
+
+
+class TenantRegistry:
+    """
+    Resolves the tenant of an update and holds each tenant's admin registry.
+    Group and channel updates belong to the tenant owning the chat; private chats to the
+    tenant the user last chose, by a /start <tenant> deep link or the tenant keyboard.
+    Choices are kept in `selections`, the FSM storage, so they last as long as the bot's
+    other per-user state and are seen by every replica sharing it.
+    """
+
+    def __init__(
+        self, root: Path, default_storage: StorageService, shared: Optional[SharedState] = None,
+        selections: Optional[BaseStorage] = None,
+    ):
+        self.root = root
+        self.shared = shared
+        self.default_storage = default_storage
+        self.selections = selections if selections is not None else MemoryStorage()
+        # Keyed by admins file, so pointing a tenant at another file takes effect on reload
+        self._storages: Dict[Path, StorageService] = {}
+        self._watchers: List[asyncio.Task] = []
+
+    def open(self, config: Config):
+        """Loads every tenant's admin file up front, so a malformed one stops the bot at startup."""
+        for tenant in config.tenants.values():
+            self.storage(tenant)
+
+    def storage(self, tenant: Config) -> StorageService:
+        if tenant.name == DEFAULT_TENANT:
+            return self.default_storage
+        path = self.root / tenant["admins_file"]
+        storage = self._storages.get(path)
+        if storage is None:
+            storage = self._storages[path] = StorageService(
+                path, shared=self.shared, shared_key=f"admins:{tenant.name}"
+            )
+            self._watchers.append(asyncio.ensure_future(storage.watch()))
+            logging.info(f"Loaded {len(storage)} admins of tenant '{tenant.name}' from {path}.")
+        return storage
+
+    def is_admin(self, user_id: int) -> bool:
+        """Whether the user is an admin of any tenant."""
+        return self.default_storage.get_admin(user_id) is not None or any(
+            storage.get_admin(user_id) is not None for storage in self._storages.values()
+        )
+
+    @staticmethod
+    def _key(bot_id: int, user_id: int) -> StorageKey:
+        return StorageKey(bot_id=bot_id, chat_id=user_id, user_id=user_id, destiny=SELECTION_DESTINY)
+
+    async def select(self, bot_id: int, user_id: int, name: str):
+        await self.selections.set_data(self._key(bot_id, user_id), {"tenant": name})
+
+    async def resolve(
+        self, config: Config, bot_id: int, chat_id: Optional[int], user_id: Optional[int]
+    ) -> Optional[Config]:
+        """
+        The tenant of an update. None for a private chat whose user has no valid choice: never made,
+        expired with the FSM data, or naming a tenant a reload removed. The user must then choose again.
+        """
+        tenant = config.tenant_for_chat(chat_id) if chat_id is not None else None
+        if tenant is not None or user_id is None or (chat_id is not None and chat_id != user_id):
+            return tenant or config
+        name = (await self.selections.get_data(self._key(bot_id, user_id))).get("tenant")
+        return config.tenant(name) if name is not None else None
+
+    async def close(self):
+        for watcher in self._watchers:
+            watcher.cancel()
+        await asyncio.gather(*self._watchers, return_exceptions=True)
+        for storage in self._storages.values():
+            await storage.close()
@@ -0,0 +1,171 @@
+# app/services/update_scheduler.py
+
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Set, Tuple
+
+from app.services.metrics import Metrics
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class _Key:
+    __slots__ = ("jobs", "priority", "running")
+
+    def __init__(self, priority: bool):
+        # (job, context, queued at)
+        self.jobs: Deque[Tuple[Job, contextvars.Context, float]] = deque()
+        self.priority = priority
+        self.running = False
+
+
+class UpdateScheduler:
+    """
+    Runs update handling with at most `max_concurrent` updates at once. Updates with the same
+    key (a user in a chat) run one after another in arrival order, so a user's FSM steps never
+    interleave; different keys take turns, so one busy user can't hold up the others.
+
+    At most `max_pending` updates wait overall, and `max_pending_per_key` per key. When full,
+    a regular user's update is dropped (shed); a priority update (owner, admins) waits for room
+    instead, which slows down intake. Priority keys also run before regular ones.
+    """
+
+    def __init__(
+        self, max_concurrent: int = 100, max_pending: int = 10000, max_pending_per_key: int = 20,
+        metrics: Optional[Metrics] = None, clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self.max_pending_per_key = max_pending_per_key
+        self.clock = clock
+        self._keys: Dict[Hashable, _Key] = {}
+        # Keys with waiting updates and none running, in turn order
+        self._ready: Deque[Hashable] = deque()
+        self._ready_priority: Deque[Hashable] = deque()
+        self._room = asyncio.Condition()
+        self._tasks: Set[asyncio.Task] = set()
+        self._closing = False
+        self.pending = 0
+        self.running = 0
+        # Counters for monitoring
+        self.started = 0
+        self.shed = 0
+        self.wait_total = 0.0
+        self.max_wait = 0.0
+        self._wait_histogram = (
+            metrics.histogram("bot_update_queue_wait_seconds", "Time updates waited for a slot.", ["priority"])
+            if metrics is not None else None
+        )
+
+    def _full(self, key: Hashable) -> bool:
+        entry = self._keys.get(key)
+        return self.pending >= self.max_pending or (
+            entry is not None and len(entry.jobs) >= self.max_pending_per_key
+        )
+
+    async def submit(self, job: Job, key: Hashable, priority: bool = False) -> bool:
+        """Queues `job` to run in its turn; returns False if it was shed instead."""
+        if self._closing:
+            return False
+        if self._full(key):
+            if not priority:
+                self.shed += 1
+                return False
+            async with self._room:
+                await self._room.wait_for(lambda: not self._full(key))
+        entry = self._keys.get(key)
+        if entry is None:
+            entry = self._keys[key] = _Key(priority)
+        promoted = priority and not entry.priority
+        entry.priority = entry.priority or priority
+        entry.jobs.append((job, contextvars.copy_context(), self.clock()))
+        self.pending += 1
+        if not entry.running and len(entry.jobs) == 1:
+            (self._ready_priority if entry.priority else self._ready).append(key)
+        elif promoted and not entry.running:
+            # Already waiting for a regular turn; it now takes a priority one instead
+            self._ready.remove(key)
+            self._ready_priority.append(key)
+        self._dispatch()
+        return True
+
+    async def run(self, job: Job, key: Hashable, priority: bool = False) -> Any:
+        """
+        Like submit(), but waits until `job` has run in its turn and returns its result, or raises
+        its exception. Returns None if the job was shed.
+        """
+        done = asyncio.get_running_loop().create_future()
+
+        async def tracked():
+            try:
+                result = await job()
+            except asyncio.CancelledError:
+                done.cancel()
+                raise
+            except Exception as e:
+                if not done.done():
+                    done.set_exception(e)
+            else:
+                if not done.done():
+                    done.set_result(result)
+
+        if not await self.submit(tracked, key, priority):
+            return None
+        return await done
+
+    def _dispatch(self):
+        while self.running < self.max_concurrent and (self._ready_priority or self._ready):
+            key = (self._ready_priority or self._ready).popleft()
+            entry = self._keys[key]
+            job, context, queued_at = entry.jobs.popleft()
+            self.pending -= 1
+            self.running += 1
+            entry.running = True
+            self._record_wait(self.clock() - queued_at, entry.priority)
+            # In the context of the update's arrival, not of whichever update finished last
+            task = asyncio.get_running_loop().create_task(self._run(key, job), context=context)
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _record_wait(self, wait: float, priority: bool):
+        self.started += 1
+        self.wait_total += wait
+        self.max_wait = max(self.max_wait, wait)
+        if self._wait_histogram is not None:
+            self._wait_histogram.observe(wait, "high" if priority else "normal")
+
+    async def _run(self, key: Hashable, job: Job):
+        try:
+            await job()
+        except Exception as e:
+            logging.error(f"Failed to handle update: {e}")
+        finally:
+            self.running -= 1
+            entry = self._keys[key]
+            entry.running = False
+            if entry.jobs:
+                (self._ready_priority if entry.priority else self._ready).append(key)
+            else:
+                del self._keys[key]
+            self._dispatch()
+            async with self._room:
+                self._room.notify_all()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "running": self.running,
+            "pending": self.pending,
+            "started": self.started,
+            "shed": self.shed,
+            "avg_wait": self.wait_total / self.started if self.started else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+    async def close(self):
+        """Stops taking updates and waits for the queued ones to finish."""
+        self._closing = True
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
@@ -0,0 +1,132 @@
+# app/services/webhook.py
+
+import asyncio
+import logging
+import secrets
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Acknowledges each update immediately and handles it in the background,
+    with at most `max_concurrent_updates` updates in progress. When all slots are busy
+    the request waits for one before answering, which makes Telegram slow down.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrent_updates: int = 100, **kwargs: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self.max_concurrent_updates = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self.in_flight = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), self.bot):
+            return web.Response(body="Unauthorized", status=401)
+        await self._slots.acquire()
+        self.in_flight += 1
+        try:
+            return await self._handle_request_background(bot=self.bot, request=request)
+        except BaseException:
+            # The background task was never created, so it won't free the slot
+            self._release()
+            raise
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        try:
+            await super()._background_feed_update(bot, update)
+        finally:
+            self._release()
+
+    def _release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+
+def create_webhook_app(dp: Dispatcher, bot: Bot, webhook_config: Dict) -> web.Application:
+    """Builds the aiohttp application serving the webhook and a health endpoint."""
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        max_concurrent_updates=webhook_config.get("max_concurrent_updates", 100),
+        secret_token=webhook_config.get("secret_token"),
+    )
+    handler.register(app, path=webhook_config.get("path", "/webhook"))
+
+    async def health(request: web.Request) -> web.Response:
+        status = {
+            "status": "ok",
+            "in_flight": handler.in_flight,
+            "max_concurrent_updates": handler.max_concurrent_updates,
+        }
+        if dp.get("update_scheduler") is not None:
+            status["scheduler"] = dp["update_scheduler"].stats()
+        return web.json_response(status)
+
+    app.router.add_get(webhook_config.get("health_path", "/healthz"), health)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+def create_ingest_app(
+    submit: Callable[[Dict[str, Any]], Awaitable[None]], webhook_config: Dict,
+    stats: Optional[Callable[[], Any]] = None,
+) -> web.Application:
+    """
+    The webhook of the supervisor in worker mode: checks the secret and hands each update to
+    `submit` as plain JSON. The request is answered once the update is queued for its worker,
+    so a full queue makes Telegram slow down.
+    """
+    app = web.Application()
+    secret_token = webhook_config.get("secret_token")
+
+    async def handle(request: web.Request) -> web.Response:
+        received = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if secret_token and not secrets.compare_digest(received, secret_token):
+            return web.Response(body="Unauthorized", status=401)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(body="Bad Request", status=400)
+        await submit(update)
+        return web.json_response({})
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", "workers": stats() if stats is not None else []})
+
+    app.router.add_post(webhook_config.get("path", "/webhook"), handle)
+    app.router.add_get(webhook_config.get("health_path", "/healthz"), health)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, webhook_config: Dict, allowed_updates: list):
+    """Registers the webhook with Telegram and serves it until cancelled."""
+    await serve_webhook(create_webhook_app(dp, bot, webhook_config), bot, webhook_config, allowed_updates)
+
+
+async def serve_webhook(app: web.Application, bot: Bot, webhook_config: Dict, allowed_updates: list):
+    """Serves a webhook application and registers it with Telegram, until cancelled."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    host = webhook_config.get("host", "0.0.0.0")
+    port = webhook_config.get("port", 8080)
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+
+    if webhook_config.get("url"):
+        await bot.set_webhook(
+            url=webhook_config["url"].rstrip("/") + webhook_config.get("path", "/webhook"),
+            secret_token=webhook_config.get("secret_token"),
+            allowed_updates=allowed_updates,
+            max_connections=webhook_config.get("max_connections", 40),
+            drop_pending_updates=webhook_config.get("drop_pending_updates", False),
+        )
+    logging.info(f"Webhook server listening on {host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
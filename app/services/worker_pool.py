@@ -0,0 +1,345 @@
+# app/services/worker_pool.py
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import aiohttp
+
+# Seconds a worker must have run for its next crash to restart it without the backoff delay
+STABLE_AFTER = 60.0
+
+
+def update_chat_and_user(update: Dict[str, Any]) -> Tuple[Optional[int], Optional[int]]:
+    """The chat and sender IDs of a raw update, without parsing it into aiogram types."""
+    for name, event in update.items():
+        if name == "update_id" or not isinstance(event, dict):
+            continue
+        user = event.get("from") or event.get("user")
+        # A callback query's chat is the chat of the message with the button
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        return (chat or {}).get("id"), (user or {}).get("id")
+    return None, None
+
+
+def shard_key(update: Dict[str, Any]) -> Any:
+    """Updates with the same key must be handled in order: the chat, else the sender."""
+    chat_id, user_id = update_chat_and_user(update)
+    if chat_id is not None:
+        return chat_id
+    if user_id is not None:
+        return user_id
+    return update.get("update_id")
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hashing of keys onto nodes. Each node owns `vnodes` points on the ring, so keys
+    spread evenly, and adding or removing a node only moves the keys of that node.
+    """
+
+    def __init__(self, nodes: Iterable[int], vnodes: int = 64):
+        points = sorted((_hash(f"{node}:{i}"), node) for node in nodes for i in range(vnodes))
+        if not points:
+            raise ValueError("A hash ring needs at least one node")
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: Any) -> int:
+        index = bisect.bisect(self._hashes, _hash(str(key)))
+        return self._nodes[index % len(self._nodes)]
+
+
+class UpdateRouter:
+    """
+    Picks the worker for each raw update. Worker 0 gets everything outside private chats
+    (report groups, channels) and all updates of the owner and admins, so moderation, the
+    publish queue and admin-file writes stay in one process. Private chats of regular users
+    are spread over the other workers by a consistent hash of the chat, so a user always
+    reaches the same worker and their FSM steps and album items stay in order.
+    """
+
+    def __init__(self, workers: int, is_staff: Callable[[int], bool], vnodes: int = 64):
+        self.ring = HashRing(range(1, workers), vnodes) if workers > 1 else None
+        self.is_staff = is_staff
+
+    def route(self, update: Dict[str, Any]) -> int:
+        if self.ring is None:
+            return 0
+        chat_id, user_id = update_chat_and_user(update)
+        # Group and channel IDs are negative
+        if chat_id is not None and chat_id < 0:
+            return 0
+        if user_id is not None and self.is_staff(user_id):
+            return 0
+        key = chat_id if chat_id is not None else user_id
+        return self.ring.node_for(key) if key is not None else 0
+
+
+class _Worker:
+    __slots__ = ("queue", "taken", "done", "submitted", "process", "restarts", "started_at", "restart_at", "delay")
+
+    def __init__(self, context, queue_size: int, restart_delay: float):
+        self.queue = context.Queue(maxsize=queue_size)
+        # Written by the worker process only (and by the pool once it is dead), so no lock is needed
+        self.taken = context.RawValue("q", 0)
+        self.done = context.RawValue("q", 0)
+        self.submitted = 0
+        self.process = None
+        self.restarts = 0
+        self.started_at = 0.0
+        self.restart_at: Optional[float] = None
+        self.delay = restart_delay
+
+
+class WorkerPool:
+    """
+    Runs `target(index, updates, taken, done, *args)` in `count` processes, each fed raw updates
+    through its own bounded queue. When a queue is full, submit() waits, so the caller slows
+    down instead of buffering without limit. A worker that dies is started again after a delay
+    that doubles with each crash in a row, up to `max_restart_delay`; its queue is kept, so the
+    updates waiting in it are handled by the new process.
+    """
+
+    def __init__(
+        self, count: int, target: Callable, args: Tuple = (), queue_size: int = 1000,
+        restart_delay: float = 1.0, max_restart_delay: float = 30.0, check_interval: float = 0.5,
+    ):
+        # Fresh interpreters: nothing of the supervisor's loop or open files leaks into a worker
+        self._context = multiprocessing.get_context("spawn")
+        self.target = target
+        self.args = args
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.check_interval = check_interval
+        self.workers = [_Worker(self._context, queue_size, restart_delay) for _ in range(count)]
+        self._monitor: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.workers)
+
+    def start(self):
+        for index in range(len(self.workers)):
+            self._spawn(index)
+        self._monitor = asyncio.ensure_future(self._watch())
+
+    def _spawn(self, index: int):
+        worker = self.workers[index]
+        worker.process = self._context.Process(
+            target=self.target,
+            args=(index, worker.queue, worker.taken, worker.done, *self.args),
+            name=f"bot-worker-{index}",
+            daemon=True,
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        logging.info(f"Worker {index} started (pid {worker.process.pid}).")
+
+    async def submit(self, index: int, update: Dict[str, Any]):
+        worker = self.workers[index]
+        while True:
+            try:
+                worker.queue.put_nowait(update)
+                break
+            except queue.Full:
+                # Backpressure: the poller or webhook request waits, and so does Telegram
+                await asyncio.sleep(0.01)
+        worker.submitted += 1
+
+    def depth(self, index: int) -> int:
+        """Updates waiting in the worker's queue."""
+        worker = self.workers[index]
+        return worker.submitted - worker.taken.value
+
+    def in_flight(self, index: int) -> int:
+        worker = self.workers[index]
+        return worker.taken.value - worker.done.value
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "worker": index,
+                "pid": worker.process.pid if worker.process is not None else None,
+                "alive": worker.process is not None and worker.process.is_alive(),
+                "queue_depth": self.depth(index),
+                "in_flight": self.in_flight(index),
+                "restarts": worker.restarts,
+            }
+            for index, worker in enumerate(self.workers)
+        ]
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for index in range(len(self.workers)):
+                self.check(index)
+
+    def check(self, index: int, now: Optional[float] = None):
+        """Schedules the restart of a dead worker, or restarts it once its delay is over."""
+        worker = self.workers[index]
+        if worker.process is None or worker.process.is_alive():
+            return
+        now = time.monotonic() if now is None else now
+        if worker.restart_at is None:
+            # Updates it had taken from the queue died with it
+            lost = worker.taken.value - worker.done.value
+            worker.done.value = worker.taken.value
+            if now - worker.started_at >= STABLE_AFTER:
+                worker.delay = self.restart_delay
+            logging.error(
+                f"Worker {index} exited with code {worker.process.exitcode}, losing {lost} updates in progress; "
+                f"restarting in {worker.delay:.0f}s."
+            )
+            worker.restart_at = now + worker.delay
+            worker.delay = min(worker.delay * 2, self.max_restart_delay)
+        elif now >= worker.restart_at:
+            worker.process.close()
+            worker.restarts += 1
+            self._spawn(index)
+
+    def signal(self, signum: int):
+        """Forwards a signal, e.g. SIGHUP to reload config.yaml, to every live worker."""
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                os.kill(worker.process.pid, signum)
+
+    async def close(self, timeout: float = 10.0):
+        """Lets each worker finish the updates already queued, then stops it."""
+        if self._monitor is not None:
+            self._monitor.cancel()
+        loop = asyncio.get_running_loop()
+        live = [worker for worker in self.workers if worker.process is not None and worker.process.is_alive()]
+        for worker in live:
+            try:
+                # The sentinel goes after the queued updates
+                await loop.run_in_executor(None, lambda: worker.queue.put(None, timeout=timeout))
+            except queue.Full:
+                pass
+        for worker in live:
+            await loop.run_in_executor(None, worker.process.join, timeout)
+            if worker.process.is_alive():
+                logging.warning(f"Worker {worker.process.name} did not stop in {timeout:.0f}s; terminating it.")
+                worker.process.terminate()
+                await loop.run_in_executor(None, worker.process.join, timeout)
+        for worker in self.workers:
+            worker.queue.close()
+            # Don't wait at exit for updates nobody will read
+            worker.queue.cancel_join_thread()
+
+
+def _read_updates(updates, taken, slots: threading.Semaphore, loop: asyncio.AbstractEventLoop, deliver: Callable):
+    # Blocks on the process queue in its own thread, and only while there is a free slot
+    while True:
+        slots.acquire()
+        try:
+            update = updates.get()
+        except (EOFError, OSError):
+            update = None  # The supervisor is gone
+        if update is not None:
+            taken.value += 1
+        try:
+            loop.call_soon_threadsafe(deliver, update)
+        except RuntimeError:
+            return  # The loop is closed
+        if update is None:
+            return
+
+
+async def consume_updates(
+    handle: Callable[[Dict[str, Any]], Awaitable[Any]], updates, taken, done, max_concurrent: int = 100
+):
+    """
+    The worker side of WorkerPool: runs `handle` for each queued update, at most `max_concurrent`
+    at once. Updates with the same shard key run one after another in arrival order, so a user's
+    FSM steps and album items are handled exactly as in a single process. Returns after the
+    stop sentinel, once the updates taken before it are handled.
+    """
+    loop = asyncio.get_running_loop()
+    slots = threading.Semaphore(max_concurrent)
+    inbox: asyncio.Queue = asyncio.Queue()
+    # A daemon thread, so a worker blocked on an empty queue can still exit
+    threading.Thread(
+        target=_read_updates, args=(updates, taken, slots, loop, inbox.put_nowait), name="update-reader", daemon=True
+    ).start()
+
+    # Stop, as after the sentinel, if the supervisor dies without sending it
+    parent = multiprocessing.parent_process()
+    if parent is not None:
+        loop.add_reader(parent.sentinel, inbox.put_nowait, None)
+
+    tails: Dict[Any, asyncio.Task] = {}
+    tasks: Set[asyncio.Task] = set()
+
+    def finished(key: Any, task: asyncio.Task):
+        tasks.discard(task)
+        if tails.get(key) is task:
+            del tails[key]
+        done.value += 1
+        slots.release()
+
+    while (update := await inbox.get()) is not None:
+        key = shard_key(update)
+        task = loop.create_task(_run_after(tails.get(key), handle, update))
+        tails[key] = task
+        tasks.add(task)
+        task.add_done_callback(lambda task, key=key: finished(key, task))
+    if parent is not None:
+        loop.remove_reader(parent.sentinel)
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _run_after(previous: Optional[asyncio.Task], handle: Callable, update: Dict[str, Any]):
+    if previous is not None:
+        await asyncio.wait([previous])
+    try:
+        await handle(update)
+    except Exception as e:
+        logging.error(f"Failed to handle update {update.get('update_id')}: {e}")
+
+
+async def poll_raw_updates(
+    session: aiohttp.ClientSession, url: str, submit: Callable[[Dict[str, Any]], Awaitable[None]],
+    allowed_updates: List[str], timeout: int = 30,
+):
+    """
+    Long-polls getUpdates at `url` and submits each update as plain JSON, so the ingest process
+    never builds aiogram objects. Retries with a growing delay on network and server errors.
+    """
+    offset = None
+    delay = 1.0
+    while True:
+        params = {"timeout": timeout, "allowed_updates": allowed_updates}
+        if offset is not None:
+            params["offset"] = offset
+        try:
+            async with session.post(url, json=params, timeout=aiohttp.ClientTimeout(total=timeout + 10)) as response:
+                result = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logging.error(f"getUpdates failed, retrying in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+            continue
+        if not result.get("ok"):
+            retry_after = (result.get("parameters") or {}).get("retry_after")
+            logging.error(f"getUpdates failed, retrying: {result.get('description')}")
+            await asyncio.sleep(retry_after or delay)
+            delay = min(delay * 2, 30.0)
+            continue
+        delay = 1.0
+        for update in result["result"]:
+            # Submitted in order, so each worker queue keeps Telegram's order
+            await submit(update)
+            offset = update["update_id"] + 1
@@ -1,11 +1,14 @@
 # app/utils/message_helpers.py
 
-import json
 from datetime import datetime
-from pathlib import Path
-from typing import Dict, Any, List
+from typing import TYPE_CHECKING, Dict, Any, List
 
-from aiogram.types import Message, InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio
+from aiogram.types import Message, MessageEntity, InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio
+
+from app.services.localization import Localization
+
+if TYPE_CHECKING:
+    from app.utils.submission import Submission
 
 def get_message_type(message: Message) -> str:
     # ... (same as before)
@@ -25,19 +28,16 @@ def get_message_type(message: Message) -> str:
 
 
 def get_report_header(
-    loc_path: Path,
+    loc: Localization,
     user_id: int,
     role: str,
     subject: str,
     message_type: str,
 ) -> str:
-    # ... (same as before)
-    with open(loc_path, 'r', encoding='utf-8') as f:
-        loc = json.load(f)
-    
     timestamp = datetime.utcnow().isoformat() + "Z"
     
-    return loc["report_message_header"].format(
+    return loc.format(
+        "report_message_header",
         user_id=user_id,
         role=role,
         subject=subject,
@@ -48,35 +48,37 @@ def get_report_header(
 
 def get_log_message(
     log_key: str,
-    loc_path: Path,
+    loc: Localization,
     **kwargs: Any
 ) -> str:
-    # ... (same as before)
-    with open(loc_path, 'r', encoding='utf-8') as f:
-        loc = json.load(f)
-    
     timestamp = datetime.utcnow().isoformat() + "Z"
     kwargs["timestamp"] = timestamp
     
-    return loc[log_key].format(**kwargs)
+    return loc.format(log_key, **kwargs)
 
 
-def convert_messages_to_input_media(messages: List[Message], caption: str = None) -> List:
+def convert_messages_to_input_media(
+    submission: "Submission",
+    caption: str = None,
+    caption_entities: List[MessageEntity] = None,
+) -> List:
     """
-    Converts a list of Message objects into a list of InputMedia objects.
+    Converts the media of a submission into a list of InputMedia objects.
     Attaches the caption to the first item only.
     """
     media_list = []
-    for i, msg in enumerate(messages):
+    for i, item in enumerate(submission.media):
         media_caption = caption if i == 0 else None
-        
-        if msg.photo:
-            media_list.append(InputMediaPhoto(media=msg.photo[-1].file_id, caption=media_caption))
-        elif msg.video:
-            media_list.append(InputMediaVideo(media=msg.video.file_id, caption=media_caption))
-        elif msg.document:
-            media_list.append(InputMediaDocument(media=msg.document.file_id, caption=media_caption))
-        elif msg.audio:
-            media_list.append(InputMediaAudio(media=msg.audio.file_id, caption=media_caption))
+        # The caption is plain text plus entities; parsing it as HTML would choke on "<" or "&"
+        extra = {"caption_entities": caption_entities, "parse_mode": None} if i == 0 else {}
+
+        if item.type == "photo":
+            media_list.append(InputMediaPhoto(media=item.file_id, caption=media_caption, **extra))
+        elif item.type == "video":
+            media_list.append(InputMediaVideo(media=item.file_id, caption=media_caption, **extra))
+        elif item.type == "document":
+            media_list.append(InputMediaDocument(media=item.file_id, caption=media_caption, **extra))
+        elif item.type == "audio":
+            media_list.append(InputMediaAudio(media=item.file_id, caption=media_caption, **extra))
             
-    return media_list
\ No newline at end of file
+    return media_list
@@ -0,0 +1,41 @@
+# app/utils/sqlite.py
+
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Union
+
+
+class SQLiteDatabase:
+    """
+    A sqlite3 connection in WAL mode whose queries run on a dedicated worker thread,
+    so disk I/O never blocks the event loop.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sqlite-{self.path.stem}")
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._closed = False
+
+    def execute_script(self, script: str):
+        """Runs schema setup synchronously; intended for startup only."""
+        with self.connection:
+            self.connection.executescript(script)
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Runs func(connection, *args) on the database thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, self.connection, *args)
+
+    async def close(self):
+        # aiogram closes the FSM storage on shutdown too, so a second call is a no-op
+        if self._closed:
+            return
+        self._closed = True
+        await self.run(lambda connection: connection.close())
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,105 @@
+# app/utils/submission.py
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram.types import Message, MessageEntity
+
+from app.utils.message_helpers import get_message_type
+
+# Media kinds that can be part of an album, in the order they are checked
+ALBUM_MEDIA_TYPES = ("photo", "video", "document", "audio")
+
+
+@dataclass(slots=True, frozen=True)
+class MediaItem:
+    """One photo/video/document/audio of a submission."""
+    type: str
+    file_id: str
+    file_unique_id: str
+    message_id: int
+
+
+@dataclass(slots=True)
+class Submission:
+    """
+    What publishing a user's post needs, and nothing more: where the original messages
+    live, the media file ids, and the text or caption with its formatting entities.
+    """
+    chat_id: int
+    user_id: int
+    message_ids: Tuple[int, ...]
+    message_type: str
+    media: Tuple[MediaItem, ...] = ()
+    text: Optional[str] = None
+    caption: Optional[str] = None
+    entities: Optional[List[Dict[str, Any]]] = None
+
+    @property
+    def is_album(self) -> bool:
+        return len(self.message_ids) > 1
+
+    @classmethod
+    def from_messages(cls, messages: List[Message]) -> "Submission":
+        first = messages[0]
+        media = []
+        for msg in messages:
+            item = _media_item(msg)
+            if item is not None:
+                media.append(item)
+        entities = first.entities if first.text else first.caption_entities
+        return cls(
+            chat_id=first.chat.id,
+            user_id=first.from_user.id,
+            message_ids=tuple(msg.message_id for msg in messages),
+            message_type="album" if len(messages) > 1 else get_message_type(first),
+            media=tuple(media),
+            text=first.text,
+            caption=first.caption,
+            entities=[entity.model_dump(exclude_none=True) for entity in entities] if entities else None,
+        )
+
+    def entity_objects(self) -> Optional[List[MessageEntity]]:
+        return [MessageEntity(**entity) for entity in self.entities] if self.entities else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """A small JSON-friendly form for FSM state and databases."""
+        data: Dict[str, Any] = {
+            "chat_id": self.chat_id,
+            "user_id": self.user_id,
+            "message_ids": list(self.message_ids),
+            "message_type": self.message_type,
+        }
+        if self.media:
+            data["media"] = [[item.type, item.file_id, item.file_unique_id, item.message_id] for item in self.media]
+        if self.text is not None:
+            data["text"] = self.text
+        if self.caption is not None:
+            data["caption"] = self.caption
+        if self.entities:
+            data["entities"] = self.entities
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Submission":
+        return cls(
+            chat_id=data["chat_id"],
+            user_id=data["user_id"],
+            message_ids=tuple(data["message_ids"]),
+            message_type=data["message_type"],
+            media=tuple(MediaItem(*item) for item in data.get("media", ())),
+            text=data.get("text"),
+            caption=data.get("caption"),
+            entities=data.get("entities"),
+        )
+
+
+def _media_item(message: Message) -> Optional[MediaItem]:
+    if message.photo:
+        photo = message.photo[-1]
+        return MediaItem("photo", photo.file_id, photo.file_unique_id, message.message_id)
+    for media_type in ALBUM_MEDIA_TYPES[1:]:
+        media = getattr(message, media_type)
+        if media:
+            return MediaItem(media_type, media.file_id, media.file_unique_id, message.message_id)
+    return None
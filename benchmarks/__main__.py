@@ -0,0 +1,46 @@
+# benchmarks/__main__.py
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import benchmarks.cases  # noqa: F401  (registers the benchmarks)
+from benchmarks.harness import compare, format_ns, run
+
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline micro-benchmarks for the bot's hot paths.")
+    parser.add_argument("-k", "--filter", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("-o", "--output", type=Path, help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="Baseline to compare with")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds spent timing each benchmark")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.filter, min_time=args.min_time))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline first.")
+        return 0
+
+    regressions = compare(results, json.loads(args.baseline.read_text()), args.threshold)
+    for name, base, current in regressions:
+        print(f"REGRESSION {name}: {format_ns(base)} -> {format_ns(current)} (+{current / base - 1:.0%})")
+    if regressions:
+        return 1
+    print(f"No regressions above {args.threshold:.0%}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+# benchmarks/cases.py
+
+import itertools
+import json
+import random
+from pathlib import Path
+from types import SimpleNamespace
+
+from aiogram.types import Message
+
+from app.middlewares.acl import ACLMiddleware
+from app.middlewares.throttling import ThrottlingMiddleware
+from app.services.localization import Localization
+from app.services.membership import MembershipCache
+from app.services.rate_limiter import create_rate_limiter
+from app.services.storage import StorageService
+from app.utils.message_helpers import convert_messages_to_input_media, get_log_message, get_report_header
+from app.utils.submission import Submission
+from benchmarks.harness import benchmark
+
+REPO_ROOT = Path(__file__).parent.parent
+CONFIG = {"owner_id": 1, "required_channel_id": -100, "report_group_id": -200, "output_channel_id": -300}
+ADMINS = 10_000
+
+
+async def _handler(event, data):
+    return None
+
+
+def _write_admins(path: Path, count: int) -> Path:
+    path.write_text(json.dumps({"admins": [{"id": 1000 + i, "alias": f"admin{i}"} for i in range(count)]}))
+    return path
+
+
+class _MemberBot:
+    async def get_chat_member(self, chat_id: int, user_id: int):
+        return SimpleNamespace(status="member")
+
+
+def _album(size: int = 10) -> list:
+    return [
+        Message.model_validate({
+            "message_id": i,
+            "date": 1700000000,
+            "chat": {"id": 42, "type": "private"},
+            "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+            "media_group_id": "album",
+            "photo": [
+                {"file_id": f"small-{i}", "file_unique_id": f"s{i}", "width": 90, "height": 90},
+                {"file_id": f"large-{i}", "file_unique_id": f"l{i}", "width": 1280, "height": 960},
+            ],
+            "caption": "کپشن آلبوم با **قالب‌بندی**" if i == 1 else None,
+            "caption_entities": [{"type": "bold", "offset": 0, "length": 4}] if i == 1 else None,
+        })
+        for i in range(1, size + 1)
+    ]
+
+
+# --- ACL role resolution ------------------------------------------------------
+
+async def _acl(tmp: Path, user_id: int):
+    storage = StorageService(_write_admins(tmp / "admins.json", ADMINS))
+    middleware = ACLMiddleware(storage, CONFIG, MembershipCache())
+    bot = _MemberBot()
+    user = SimpleNamespace(id=user_id)
+    event = object()
+
+    async def op():
+        await middleware(_handler, event, {"event_from_user": user, "bot": bot})
+
+    await op()  # Warm the membership cache, as in steady state
+    return op
+
+
+@benchmark("acl_role_user")
+async def acl_role_user(tmp: Path):
+    return await _acl(tmp, user_id=999_999)
+
+
+@benchmark("acl_role_admin")
+async def acl_role_admin(tmp: Path):
+    return await _acl(tmp, user_id=1000 + ADMINS // 2)
+
+
+@benchmark("acl_role_owner")
+async def acl_role_owner(tmp: Path):
+    return await _acl(tmp, user_id=CONFIG["owner_id"])
+
+
+# --- Throttling -----------------------------------------------------------------
+
+def _throttling(users: int):
+    async def setup(tmp: Path):
+        limiter = create_rate_limiter("gcra", max_keys=users)
+        loc = Localization(REPO_ROOT / "fa.json")
+        middleware = ThrottlingMiddleware(limiter, limit=1_000_000, period=3600, loc=loc)
+        for user_id in range(users):
+            limiter.hit(user_id, 1_000_000, 3600)
+        rng = random.Random(1)
+        events = itertools.cycle([
+            SimpleNamespace(from_user=SimpleNamespace(id=rng.randrange(users))) for _ in range(4096)
+        ])
+        data = {"user_role": "user"}
+
+        async def op():
+            await middleware(_handler, next(events), data)
+
+        return op
+    return setup
+
+
+for _users, _label in ((10_000, "10k"), (100_000, "100k"), (1_000_000, "1m")):
+    benchmark(f"throttling_{_label}_users")(_throttling(_users))
+
+
+# --- StorageService -------------------------------------------------------------
+
+@benchmark("storage_get_admin_10k")
+async def storage_get_admin(tmp: Path):
+    storage = StorageService(_write_admins(tmp / "admins.json", ADMINS))
+    ids = itertools.cycle(range(1000, 1000 + ADMINS, 7))
+    return lambda: storage.get_admin(next(ids))
+
+
+@benchmark("storage_add_admin_10k")
+async def storage_add_admin(tmp: Path):
+    storage = StorageService(_write_admins(tmp / "admins.json", ADMINS))
+    ids = itertools.count(10_000_000)
+
+    async def op():
+        await storage.add_admin(next(ids), "bench")
+
+    return op
+
+
+# --- Formatting -----------------------------------------------------------------
+
+@benchmark("format_report_header")
+async def format_report_header(tmp: Path):
+    loc = Localization(REPO_ROOT / "fa.json")
+    return lambda: get_report_header(loc, user_id=42, role="کاربر", subject="فرمد", message_type="album")
+
+
+@benchmark("format_log_message")
+async def format_log_message(tmp: Path):
+    loc = Localization(REPO_ROOT / "fa.json")
+    return lambda: get_log_message("report_approved_log", loc, admin_alias="ali", admin_id=7, submitter_id=42)
+
+
+@benchmark("convert_album_to_input_media")
+async def convert_album(tmp: Path):
+    submission = Submission.from_messages(_album())
+    entities = submission.entity_objects()
+    return lambda: convert_messages_to_input_media(submission, "caption", entities)
+
+
+# --- FSM state serialization ------------------------------------------------------
+
+@benchmark("fsm_album_message_json")
+async def fsm_album_message_json(tmp: Path):
+    # What the FSM used to hold: every Message of the album, dumped to JSON and parsed back
+    messages = _album()
+
+    def op():
+        data = json.dumps([message.model_dump(mode="json") for message in messages])
+        return [Message.model_validate(item) for item in json.loads(data)]
+
+    return op
+
+
+@benchmark("fsm_album_submission_json")
+async def fsm_album_submission_json(tmp: Path):
+    submission = Submission.from_messages(_album())
+    return lambda: Submission.from_dict(json.loads(json.dumps(submission.to_dict())))
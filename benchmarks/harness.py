@@ -0,0 +1,93 @@
+# benchmarks/harness.py
+
+import inspect
+import platform
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# name -> async setup(tmp_dir) returning the operation to time (sync or async, no arguments)
+Setup = Callable[[Path], Awaitable[Callable[[], Any]]]
+BENCHMARKS: Dict[str, Setup] = {}
+
+
+def benchmark(name: str):
+    """Registers a benchmark. The decorated coroutine prepares the data and returns the operation to time."""
+    def register(setup: Setup) -> Setup:
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+async def _time(op: Callable[[], Any], number: int, is_async: bool) -> float:
+    if is_async:
+        start = time.perf_counter()
+        for _ in range(number):
+            await op()
+        return time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(number):
+        op()
+    return time.perf_counter() - start
+
+
+async def measure(op: Callable[[], Any], min_time: float = 0.2, rounds: int = 5) -> Tuple[float, int]:
+    """
+    Times `op` in `rounds` rounds of equal length and returns (nanoseconds per call, calls per round).
+    The fastest round is kept: slower ones only measured noise from the rest of the machine.
+    """
+    is_async = inspect.iscoroutinefunction(op)
+    round_time = min_time / rounds
+    number = 1
+    while True:
+        elapsed = await _time(op, number, is_async)
+        if elapsed >= round_time:
+            break
+        # Aim a little past the target so calibration ends in a step or two
+        number = max(number * 2, int(number * round_time * 1.2 / max(elapsed, 1e-9)))
+    best = elapsed
+    for _ in range(rounds - 1):
+        best = min(best, await _time(op, number, is_async))
+    return best / number * 1e9, number
+
+
+async def run(name_filter: Optional[str] = None, min_time: float = 0.2, rounds: int = 5) -> Dict[str, Any]:
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if name_filter and name_filter not in name:
+            continue
+        with tempfile.TemporaryDirectory() as tmp:
+            op = await setup(Path(tmp))
+            ns_per_op, number = await measure(op, min_time, rounds)
+        results[name] = {"ns_per_op": round(ns_per_op, 1), "number": number}
+        print(f"{name:<40} {format_ns(ns_per_op):>12}")
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Tuple[str, float, float]]:
+    """Returns (name, baseline ns, current ns) for every benchmark slower than the baseline by more than `threshold`."""
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        if result["ns_per_op"] > base["ns_per_op"] * (1 + threshold):
+            regressions.append((name, base["ns_per_op"], result["ns_per_op"]))
+    return regressions
+
+
+def format_ns(ns: float) -> str:
+    for unit, scale in (("s", 1e9), ("ms", 1e6), ("us", 1e3)):
+        if ns >= scale:
+            return f"{ns / scale:.2f} {unit}"
+    return f"{ns:.0f} ns"
+
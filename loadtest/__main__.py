@@ -0,0 +1,60 @@
+# loadtest/__main__.py
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import tempfile
+from pathlib import Path
+
+import yaml
+
+from loadtest.scenario import ROOT, LoadTestOptions, format_report, run_load_test
+
+
+def main() -> int:
+    defaults = LoadTestOptions()
+    parser = argparse.ArgumentParser(description="End-to-end load test against a local fake Bot API.")
+    parser.add_argument("--config", type=Path, default=ROOT / "config.yaml.example", help="Bot config to start from")
+    parser.add_argument("--mode", choices=["polling", "webhook"], default=defaults.mode)
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--submissions", type=int, default=defaults.submissions, help="Submissions per user")
+    parser.add_argument("--album-share", type=float, default=defaults.album_share)
+    parser.add_argument("--command-share", type=float, default=defaults.command_share,
+                        help="Share of submissions started with /submit instead of a direct message")
+    parser.add_argument("--ramp", type=float, default=defaults.ramp, help="Seconds over which users start")
+    parser.add_argument("--think", type=float, default=defaults.think, help="Mean seconds between a user's submissions")
+    parser.add_argument("--moderators", type=int, default=defaults.moderators)
+    parser.add_argument("--approve-share", type=float, default=defaults.approve_share)
+    parser.add_argument("--moderator-delay", type=float, default=defaults.moderator_delay)
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="Fake Bot API latency, seconds")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter)
+    parser.add_argument("--flood-rate", type=float, default=defaults.flood_rate, help="Share of sends answered with 429")
+    parser.add_argument("--retry-after", type=int, default=defaults.retry_after)
+    parser.add_argument("--real-send-limits", action="store_true", help="Keep send_limits from the config")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("-o", "--output", type=Path, help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = yaml.safe_load(f)
+    options = LoadTestOptions(
+        mode=args.mode, users=args.users, submissions=args.submissions, album_share=args.album_share,
+        command_share=args.command_share, ramp=args.ramp, think=args.think, moderators=args.moderators,
+        approve_share=args.approve_share, moderator_delay=args.moderator_delay, latency=args.latency,
+        jitter=args.jitter, flood_rate=args.flood_rate, retry_after=args.retry_after,
+        real_send_limits=args.real_send_limits, seed=args.seed,
+    )
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        report = asyncio.run(run_load_test(config, options, Path(workdir)))
+    print(format_report(report))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
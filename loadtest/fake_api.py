@@ -0,0 +1,276 @@
+# loadtest/fake_api.py
+
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+# Form fields that are always plain strings, even when they look like JSON
+_TEXT_FIELDS = {"text", "caption", "url", "secret_token", "callback_query_id", "data", "description"}
+
+# Methods that post or change messages; only these are answered with 429s
+_FLOOD_PREFIXES = ("send", "copy", "forward", "editMessage")
+
+Payload = Dict[str, Any]
+# Called with (method, params, result, timestamp) after every successful call
+SendHook = Callable[[str, Payload, Any, float], None]
+
+
+def _decode(key: str, value: str) -> Any:
+    if key in _TEXT_FIELDS:
+        return value
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+class FakeTelegramServer:
+    """
+    A local stand-in for the Bot API, good enough to run the real Dispatcher against.
+    Updates pushed with push_update() are served by getUpdates long polling, or POSTed to
+    the webhook once the bot calls setWebhook. Every call waits `latency` seconds (plus up
+    to `jitter`), and message-sending calls fail with 429 retry_after at `flood_rate`.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        flood_rate: float = 0.0,
+        retry_after: int = 1,
+        on_call: Optional[SendHook] = None,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.on_call = on_call
+        self._random = random.Random(seed)
+        self._update_ids = itertools.count(1)
+        self._message_ids: Dict[int, itertools.count] = {}
+        self._updates: Deque[Payload] = deque()
+        self._updates_ready = asyncio.Event()
+        self._inboxes: Dict[int, asyncio.Queue] = {}
+        self._webhook: Optional[Payload] = None
+        self._webhook_queue: "asyncio.Queue[Payload]" = asyncio.Queue()
+        self._deliverers: List[asyncio.Task] = []
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+        self._closing = False
+        self.calls: Dict[str, int] = {}
+        self.floods = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Starts serving; returns the base URL to give TelegramAPIServer.from_base()."""
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_host, bound_port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{bound_host}:{bound_port}"
+        return self.base_url
+
+    async def close(self):
+        # Ends pending long polls, which would otherwise hold up the shutdown until they time out
+        self._closing = True
+        self._updates_ready.set()
+        await self._stop_webhook()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    # --- Simulated clients -------------------------------------------------
+
+    def open_chat(self, chat_id: int) -> asyncio.Queue:
+        """Messages the bot sends to this chat from now on are put in the returned queue."""
+        return self._inboxes.setdefault(chat_id, asyncio.Queue())
+
+    def next_message_id(self, chat_id: int) -> int:
+        counter = self._message_ids.get(chat_id)
+        if counter is None:
+            counter = self._message_ids[chat_id] = itertools.count(1)
+        return next(counter)
+
+    def push_update(self, update: Payload) -> int:
+        update_id = next(self._update_ids)
+        update = {"update_id": update_id, **update}
+        if self._webhook is not None:
+            self._webhook_queue.put_nowait(update)
+        else:
+            self._updates.append(update)
+            self._updates_ready.set()
+        return update_id
+
+    @property
+    def backlog(self) -> int:
+        """Updates pushed but not yet picked up by the bot."""
+        return len(self._updates) + self._webhook_queue.qsize()
+
+    # --- Bot API -----------------------------------------------------------
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            form = await request.post()
+            params = {key: _decode(key, value) for key, value in form.items() if isinstance(value, str)}
+
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method != "getUpdates" and (self.latency or self.jitter):
+            await asyncio.sleep(self.latency + self._random.random() * self.jitter)
+        if self.flood_rate and method.startswith(_FLOOD_PREFIXES) and self._random.random() < self.flood_rate:
+            self.floods += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            })
+
+        handler = getattr(self, f"_api_{method}", None)
+        if handler is None:
+            return web.json_response({"ok": False, "error_code": 404, "description": "Not Found: method not found"})
+        result = await handler(params)
+        if self.on_call is not None:
+            try:
+                self.on_call(method, params, result, time.perf_counter())
+            except Exception as e:
+                logging.error(f"Load test hook failed on {method}: {e}")
+        return web.json_response({"ok": True, "result": result})
+
+    def _message(self, chat_id: Any, **fields: Any) -> Payload:
+        chat_id = int(chat_id)
+        chat = {"id": chat_id, "type": "private", "first_name": "User"} if chat_id > 0 else {
+            "id": chat_id, "type": "supergroup", "title": "Chat"
+        }
+        message = {"message_id": self.next_message_id(chat_id), "date": int(time.time()), "chat": chat, **fields}
+        inbox = self._inboxes.get(chat_id)
+        if inbox is not None:
+            inbox.put_nowait(message)
+        return message
+
+    async def _api_getMe(self, params: Payload) -> Payload:
+        return {"id": 1, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot"}
+
+    async def _api_getUpdates(self, params: Payload) -> List[Payload]:
+        offset = int(params.get("offset", 0))
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates:
+            self._updates_ready.clear()
+            try:
+                await asyncio.wait_for(self._updates_ready.wait(), float(params.get("timeout", 0)))
+            except asyncio.TimeoutError:
+                return []
+            if self._closing:
+                return []
+        limit = int(params.get("limit", 100))
+        return list(itertools.islice(self._updates, limit))
+
+    async def _api_setWebhook(self, params: Payload) -> bool:
+        await self._stop_webhook()
+        self._webhook = params
+        # Updates waiting for getUpdates move to the webhook, as with Telegram
+        while self._updates:
+            self._webhook_queue.put_nowait(self._updates.popleft())
+        self._http = aiohttp.ClientSession()
+        self._deliverers = [
+            asyncio.create_task(self._deliver()) for _ in range(int(params.get("max_connections", 40)))
+        ]
+        return True
+
+    async def _api_deleteWebhook(self, params: Payload) -> bool:
+        await self._stop_webhook()
+        if params.get("drop_pending_updates"):
+            self._updates.clear()
+        return True
+
+    async def _stop_webhook(self):
+        for task in self._deliverers:
+            task.cancel()
+        await asyncio.gather(*self._deliverers, return_exceptions=True)
+        self._deliverers = []
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+        if self._webhook is not None:
+            self._webhook = None
+            while not self._webhook_queue.empty():
+                self._updates.append(self._webhook_queue.get_nowait())
+            if self._updates:
+                self._updates_ready.set()
+
+    async def _deliver(self):
+        headers = {}
+        if self._webhook.get("secret_token"):
+            headers["X-Telegram-Bot-Api-Secret-Token"] = self._webhook["secret_token"]
+        url = self._webhook["url"]
+        while True:
+            update = await self._webhook_queue.get()
+            while True:
+                try:
+                    async with self._http.post(url, json=update, headers=headers) as response:
+                        if response.status == 200:
+                            break
+                        logging.warning(f"Webhook answered {response.status}; retrying update {update['update_id']}.")
+                except aiohttp.ClientError as e:
+                    logging.warning(f"Webhook delivery failed: {e}")
+                # Telegram backs off before redelivering
+                await asyncio.sleep(0.5)
+
+    async def _api_sendMessage(self, params: Payload) -> Payload:
+        fields = {"text": params.get("text", "")}
+        if params.get("reply_markup"):
+            fields["reply_markup"] = params["reply_markup"]
+        return self._message(params["chat_id"], **fields)
+
+    async def _api_sendMediaGroup(self, params: Payload) -> List[Payload]:
+        messages = []
+        for item in params.get("media", []):
+            media = {"file_id": item["media"], "file_unique_id": item["media"]}
+            if item["type"] == "photo":
+                fields = {"photo": [{**media, "width": 1280, "height": 720}]}
+            elif item["type"] == "video":
+                fields = {"video": {**media, "width": 1280, "height": 720, "duration": 1}}
+            elif item["type"] == "audio":
+                fields = {"audio": {**media, "duration": 1}}
+            else:
+                fields = {"document": media}
+            if item.get("caption"):
+                fields["caption"] = item["caption"]
+            messages.append(self._message(params["chat_id"], media_group_id="1", **fields))
+        return messages
+
+    async def _api_copyMessage(self, params: Payload) -> Payload:
+        fields = {}
+        if params.get("reply_markup"):
+            fields["reply_markup"] = params["reply_markup"]
+        return {"message_id": self._message(params["chat_id"], **fields)["message_id"]}
+
+    async def _api_editMessageText(self, params: Payload) -> bool:
+        return True
+
+    async def _api_editMessageCaption(self, params: Payload) -> bool:
+        return True
+
+    async def _api_deleteMessages(self, params: Payload) -> bool:
+        return True
+
+    async def _api_answerCallbackQuery(self, params: Payload) -> bool:
+        return True
+
+    async def _api_getChatMember(self, params: Payload) -> Payload:
+        user_id = int(params["user_id"])
+        return {"status": "member", "user": {"id": user_id, "is_bot": False, "first_name": "Member"}}
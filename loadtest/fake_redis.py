@@ -0,0 +1,221 @@
+# loadtest/fake_redis.py
+
+import asyncio
+import hashlib
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from app.services.shared_state import (
+    COMPARE_AND_SET_SCRIPT, GCRA_SCRIPT, PUSH_UNLESS_SCRIPT, RedisError, read_reply,
+)
+
+Value = Union[str, List[str], Set[str]]
+
+
+def _reply(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, RedisError):
+        return b"-%s\r\n" % str(value).encode("utf-8")
+    if isinstance(value, bool):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_reply(item) for item in value)
+    if value == "OK" or value == "QUEUED":
+        return b"+%s\r\n" % value.encode("utf-8")
+    data = str(value).encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class FakeRedisServer:
+    """
+    A local stand-in for a Redis server: the commands RedisState uses, over real RESP on a
+    TCP port. Lua isn't available, so the bot's known scripts run as Python equivalents.
+    Each command runs without yielding to the loop, so it is as atomic as in Redis.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        # key -> (value, expires_at or None)
+        self.data: Dict[str, Tuple[Value, Optional[float]]] = {}
+        self.commands: Dict[str, int] = {}
+        self._scripts: Dict[str, Callable] = {
+            hashlib.sha1(script.encode("utf-8")).hexdigest(): run
+            for script, run in (
+                (GCRA_SCRIPT, self._gcra),
+                (COMPARE_AND_SET_SCRIPT, self._compare_and_set),
+                (PUSH_UNLESS_SCRIPT, self._push_unless),
+            )
+        }
+        self._loaded: set = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: set = set()
+        self.url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._server = await asyncio.start_server(self._serve, host, port)
+        bound_host, bound_port = self._server.sockets[0].getsockname()[:2]
+        self.url = f"redis://{bound_host}:{bound_port}/0"
+        return self.url
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._clients.add(writer)
+        queued: Optional[List[List[str]]] = None
+        try:
+            while True:
+                command = await read_reply(reader)
+                name = command[0].upper()
+                self.commands[name] = self.commands.get(name, 0) + 1
+                if name == "MULTI":
+                    queued = []
+                    writer.write(_reply("OK"))
+                elif name == "EXEC":
+                    writer.write(_reply([self._run(queued_command) for queued_command in queued or []]))
+                    queued = None
+                elif queued is not None:
+                    queued.append(command)
+                    writer.write(_reply("QUEUED"))
+                else:
+                    writer.write(_reply(self._run(command)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    def _run(self, command: List[str]) -> Any:
+        handler = getattr(self, f"_cmd_{command[0].lower()}", None)
+        if handler is None:
+            return RedisError(f"ERR unknown command '{command[0]}'")
+        return handler(*command[1:])
+
+    def _get(self, key: str) -> Optional[Value]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= self.clock():
+            del self.data[key]
+            return None
+        return entry[0]
+
+    def ttl(self, key: str) -> Optional[float]:
+        entry = self.data.get(key)
+        return entry[1] - self.clock() if entry is not None and entry[1] is not None else None
+
+    # --- Commands ----------------------------------------------------------
+
+    def _cmd_ping(self):
+        return "PONG"
+
+    def _cmd_select(self, db):
+        return "OK"
+
+    def _cmd_auth(self, password):
+        return "OK"
+
+    def _cmd_get(self, key):
+        value = self._get(key)
+        if value is not None and not isinstance(value, str):
+            return RedisError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def _cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        if "NX" in options and self._get(key) is not None:
+            return None
+        expires_at = None
+        if "PX" in options:
+            expires_at = self.clock() + int(options[options.index("PX") + 1]) / 1000
+        self.data[key] = (value, expires_at)
+        return "OK"
+
+    def _cmd_del(self, *keys):
+        return sum(self._get(key) is not None and self.data.pop(key, None) is not None for key in keys)
+
+    def _cmd_rpush(self, key, *values):
+        items = self._get(key) or []
+        items = [*items, *values]
+        entry = self.data.get(key)
+        self.data[key] = (items, entry[1] if entry is not None else None)
+        return len(items)
+
+    def _cmd_pexpire(self, key, milliseconds):
+        value = self._get(key)
+        if value is None:
+            return 0
+        self.data[key] = (value, self.clock() + int(milliseconds) / 1000)
+        return 1
+
+    def _cmd_lrange(self, key, start, stop):
+        items = self._get(key) or []
+        stop = int(stop)
+        return items[int(start):None if stop == -1 else stop + 1]
+
+    def _cmd_sadd(self, key, *members):
+        current = self._get(key) or set()
+        added = len(set(members) - current)
+        self.data[key] = (current | set(members), None)
+        return added
+
+    def _cmd_srem(self, key, *members):
+        current = self._get(key) or set()
+        removed = len(current & set(members))
+        if current - set(members):
+            self.data[key] = (current - set(members), None)
+        else:
+            self.data.pop(key, None)
+        return removed
+
+    def _cmd_smembers(self, key):
+        return sorted(self._get(key) or ())
+
+    def _cmd_evalsha(self, sha, numkeys, *args):
+        if sha not in self._loaded:
+            return RedisError("NOSCRIPT No matching script. Please use EVAL.")
+        numkeys = int(numkeys)
+        return self._scripts[sha](args[:numkeys], args[numkeys:])
+
+    def _cmd_eval(self, script, numkeys, *args):
+        sha = hashlib.sha1(script.encode("utf-8")).hexdigest()
+        if sha not in self._scripts:
+            return RedisError("ERR the stand-in only runs the bot's own scripts")
+        self._loaded.add(sha)
+        return self._cmd_evalsha(sha, numkeys, *args)
+
+    # --- Scripts -----------------------------------------------------------
+
+    def _gcra(self, keys, args):
+        now = self.clock()
+        limit, period = float(args[0]), float(args[1])
+        stored = self._get(keys[0])
+        tat = max(float(stored), now) if stored is not None else now
+        new_tat = tat + period / limit
+        if new_tat - now > period:
+            return 0
+        self.data[keys[0]] = (f"{new_tat:.6f}", new_tat)
+        return 1
+
+    def _compare_and_set(self, keys, args):
+        expects_none, expected, value = args[0] == "1", args[1], args[2]
+        current = self._get(keys[0])
+        if (current is not None) if expects_none else current != expected:
+            return 0
+        self.data[keys[0]] = (value, None)
+        return 1
+
+    def _push_unless(self, keys, args):
+        if self._get(keys[1]) is not None:
+            return 0
+        length = self._cmd_rpush(keys[0], *args[1:])
+        self._cmd_pexpire(keys[0], args[0])
+        return length
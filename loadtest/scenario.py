@@ -0,0 +1,419 @@
+# loadtest/scenario.py
+
+import asyncio
+import copy
+import gc
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from app.bot import close_workflow, create_dispatcher, create_send_scheduler, create_storage, setup_workflow
+from app.services.localization import Localization
+from app.services.storage import StorageService
+from app.services.webhook import run_webhook
+from loadtest.fake_api import FakeTelegramServer
+
+ROOT = Path(__file__).parent.parent
+TOKEN = "42:LOADTEST"
+FIRST_USER_ID = 10_000_000
+FIRST_MODERATOR_ID = 9_000_000
+# Subjects carry a unique token, which the report header and the channel footer repeat
+SUBJECT_PATTERN = re.compile(r"lt-\d+")
+WORDS = (
+    "خبر", "سلام", "امروز", "دانشگاه", "کلاس", "امتحان", "غذا", "سلف", "کتابخانه", "استاد",
+    "news", "today", "campus", "exam", "library", "lecture", "coffee", "bus", "rain", "event",
+)
+
+
+@dataclass
+class LoadTestOptions:
+    mode: str = "polling"          # polling (getUpdates) or webhook
+    users: int = 1000
+    submissions: int = 1           # Per user
+    album_share: float = 0.3       # Submissions sent as albums
+    album_size: int = 3
+    command_share: float = 0.5     # Submissions started with /submit; the rest are direct messages
+    ramp: float = 10.0             # Seconds over which users start
+    think: float = 2.0             # Mean seconds between two submissions of one user
+    moderators: int = 5
+    approve_share: float = 0.8     # The rest is deleted
+    moderator_delay: float = 1.0   # Moderators click within this many seconds of the report
+    double_click_share: float = 0.05  # Reports clicked by two moderators at once
+    latency: float = 0.02          # Fake Bot API latency per call, seconds
+    jitter: float = 0.02
+    flood_rate: float = 0.0        # Share of sends answered with 429
+    retry_after: int = 1
+    real_send_limits: bool = False  # Keep send_limits from the config instead of lifting them
+    reply_timeout: float = 60.0
+    drain_timeout: float = 60.0
+    webhook_port: int = 0
+    seed: Optional[int] = None
+
+
+def percentiles(samples: List[float]) -> Dict[str, Any]:
+    """Nearest-rank p50/p95/p99 and max, in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(p * len(ordered))) - 1))] * 1000
+
+    return {
+        "count": len(ordered), "p50_ms": rank(0.50), "p95_ms": rank(0.95), "p99_ms": rank(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # Peak rather than current RSS; kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def prepare_config(config: Dict, workdir: Path, options: LoadTestOptions) -> Dict:
+    """
+    The bot's config with everything pointed at the work directory. User throttling is
+    lifted so each simulated user can finish its submissions, and so are the send limits
+    unless `real_send_limits` is set (with them, the report group takes 20 messages a minute).
+    """
+    config = copy.deepcopy(config)
+    config.setdefault("database", {})["path"] = str(workdir / "bot.db")
+    config.setdefault("rate_limit", {}).update({"limit": 1_000_000, "period": 3600, "roles": {}})
+    config.setdefault("publish_queue", {}).setdefault("enabled", False)
+    config.setdefault("metrics", {})["enabled"] = False
+    if not options.real_send_limits:
+        config["send_limits"] = {
+            **config.get("send_limits", {}),
+            "global_per_second": 1_000_000, "private_per_second": 1_000_000,
+            "group_per_minute": 60_000_000, "chat_burst": 1_000_000,
+        }
+    if options.mode == "webhook":
+        port = options.webhook_port or free_port()
+        config["webhook"] = {
+            **config.get("webhook", {}),
+            "enabled": True, "url": f"http://127.0.0.1:{port}", "host": "127.0.0.1", "port": port,
+        }
+    return config
+
+
+class LoadTest:
+    """Simulated users and moderators driving the real Dispatcher through a FakeTelegramServer."""
+
+    def __init__(self, config: Dict, options: LoadTestOptions, server: FakeTelegramServer):
+        self.config = config
+        self.options = options
+        self.server = server
+        self.random = random.Random(options.seed)
+        self.report_group_id = int(config["report_group_id"])
+        self.output_channel_id = int(config["output_channel_id"])
+        self.moderator_ids = [FIRST_MODERATOR_ID + i for i in range(options.moderators)]
+        self.lookup_subject = lambda submission_id: None
+        self._subjects = itertools.count(1)
+        self._media_groups = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+        self.submitted: Dict[str, float] = {}
+        self.approved: Dict[str, float] = {}
+        self.report_latency: List[float] = []
+        self.publish_latency: List[float] = []
+        self.moderation_tasks: List[asyncio.Task] = []
+        self.counts = {
+            "submissions_started": 0, "submissions_received": 0, "reported": 0, "timeouts": 0,
+            "approved": 0, "deleted": 0, "double_clicks": 0, "published": 0,
+        }
+        self.handled_updates = 0
+        self.in_flight = 0
+        server.on_call = self.on_call
+
+    # --- Observing the bot --------------------------------------------------
+
+    async def count_update(self, handler, event, data):
+        self.in_flight += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self.in_flight -= 1
+            self.handled_updates += 1
+
+    def on_call(self, method: str, params: Dict, result: Any, at: float):
+        chat_id = params.get("chat_id")
+        if chat_id is None:
+            return
+        chat_id = int(chat_id)
+        if chat_id == self.report_group_id:
+            self._on_report(params, result, at)
+        elif chat_id == self.output_channel_id:
+            self._on_channel_post(params, at)
+
+    def _on_report(self, params: Dict, result: Any, at: float):
+        # The message with the approve/delete buttons completes the report
+        for row in (params.get("reply_markup") or {}).get("inline_keyboard", []):
+            for button in row:
+                data = button.get("callback_data", "")
+                if data.startswith("approve:"):
+                    submission_id = data.split(":", 1)[1]
+                    subject = self.lookup_subject(submission_id)
+                    submitted_at = self.submitted.pop(subject, None)
+                    if submitted_at is not None:
+                        self.report_latency.append(at - submitted_at)
+                    self.counts["reported"] += 1
+                    self.moderation_tasks.append(
+                        asyncio.create_task(self._moderate(submission_id, subject, result["message_id"]))
+                    )
+                    return
+
+    def _on_channel_post(self, params: Dict, at: float):
+        texts = [params.get("text") or "", params.get("caption") or ""]
+        texts.extend(item.get("caption") or "" for item in params.get("media") or [])
+        match = SUBJECT_PATTERN.search(" ".join(texts))
+        if match is None:
+            return
+        approved_at = self.approved.pop(match.group(0), None)
+        if approved_at is not None:
+            self.publish_latency.append(at - approved_at)
+            self.counts["published"] += 1
+
+    # --- Moderators ---------------------------------------------------------
+
+    async def _moderate(self, submission_id: str, subject: Optional[str], message_id: int):
+        await asyncio.sleep(self.random.random() * self.options.moderator_delay)
+        approve = self.random.random() < self.options.approve_share
+        clicks = 2 if len(self.moderator_ids) > 1 and self.random.random() < self.options.double_click_share else 1
+        if approve:
+            self.counts["approved"] += 1
+            if subject is not None:
+                self.approved[subject] = time.perf_counter()
+        else:
+            self.counts["deleted"] += 1
+        if clicks == 2:
+            self.counts["double_clicks"] += 1
+        action = "approve" if approve else "delete"
+        for moderator_id in self.random.sample(self.moderator_ids, clicks):
+            self.server.push_update({"callback_query": {
+                "id": str(next(self._callback_ids)),
+                "from": {"id": moderator_id, "is_bot": False, "first_name": "Moderator"},
+                "chat_instance": "1",
+                "data": f"{action}:{submission_id}",
+                "message": {
+                    "message_id": message_id, "date": int(time.time()),
+                    "chat": {"id": self.report_group_id, "type": "supergroup", "title": "Reports"},
+                },
+            }})
+
+    # --- Users --------------------------------------------------------------
+
+    def _message(self, user_id: int, **fields: Any) -> Dict:
+        return {"message": {
+            "message_id": self.server.next_message_id(user_id),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": "User"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+            **fields,
+        }}
+
+    def _content(self, user_id: int, subject: str, album: bool) -> List[Dict]:
+        text = f"{subject} " + " ".join(self.random.choices(WORDS, k=12))
+        if not album:
+            return [self._message(user_id, text=text)]
+        group_id = str(next(self._media_groups))
+        items = []
+        for i in range(self.options.album_size):
+            file_id = f"photo-{group_id}-{i}"
+            fields = {"photo": [{"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 720}]}
+            if i == 0:
+                fields["caption"] = text
+            items.append(self._message(user_id, media_group_id=group_id, **fields))
+        return items
+
+    async def _step(self, inbox: asyncio.Queue, updates: List[Dict], final: bool = False, subject: str = ""):
+        """Sends one user step and waits for the bot's reply."""
+        if final:
+            self.submitted[subject] = time.perf_counter()
+        for update in updates:
+            self.server.push_update(update)
+        await asyncio.wait_for(inbox.get(), self.options.reply_timeout)
+
+    async def _submit(self, user_id: int, inbox: asyncio.Queue):
+        subject = f"lt-{next(self._subjects)}"
+        album = self.random.random() < self.options.album_share
+        content = self._content(user_id, subject, album)
+        self.counts["submissions_started"] += 1
+        try:
+            if self.random.random() < self.options.command_share:
+                # Workflow 1: /submit, subject, content
+                await self._step(inbox, [self._message(user_id, text="/submit")])
+                await self._step(inbox, [self._message(user_id, text=subject)])
+                await self._step(inbox, content, final=True, subject=subject)
+            else:
+                # Workflow 2: content first, then the subject
+                await self._step(inbox, content)
+                await self._step(inbox, [self._message(user_id, text=subject)], final=True, subject=subject)
+        except asyncio.TimeoutError:
+            self.counts["timeouts"] += 1
+            self.submitted.pop(subject, None)
+            return
+        self.counts["submissions_received"] += 1
+
+    async def _user(self, user_id: int, start_delay: float):
+        await asyncio.sleep(start_delay)
+        inbox = self.server.open_chat(user_id)
+        for i in range(self.options.submissions):
+            if i and self.options.think:
+                await asyncio.sleep(self.random.expovariate(1 / self.options.think))
+            await self._submit(user_id, inbox)
+
+    async def run_users(self):
+        options = self.options
+        await asyncio.gather(*(
+            self._user(FIRST_USER_ID + i, options.ramp * i / max(options.users, 1)) for i in range(options.users)
+        ))
+
+    async def drain(self):
+        """Waits for the moderators' clicks to be handled and the approved posts to reach the channel."""
+        deadline = time.perf_counter() + self.options.drain_timeout
+        while time.perf_counter() < deadline:
+            self.moderation_tasks = [task for task in self.moderation_tasks if not task.done()]
+            if not (self.moderation_tasks or self.approved or self.server.backlog or self.in_flight):
+                return
+            await asyncio.sleep(0.05)
+
+
+async def run_load_test(config: Dict, options: LoadTestOptions, workdir: Path) -> Dict[str, Any]:
+    """Starts the fake Bot API and the bot, runs the scenario and returns the report."""
+    config = prepare_config(config, workdir, options)
+    server = FakeTelegramServer(
+        latency=options.latency, jitter=options.jitter, flood_rate=options.flood_rate,
+        retry_after=options.retry_after, seed=options.seed,
+    )
+    await server.start()
+    test = LoadTest(config, options, server)
+
+    admins_path = workdir / "admins.json"
+    admins_path.write_text(json.dumps({"admins": [
+        {"id": moderator_id, "alias": f"mod{i}"} for i, moderator_id in enumerate(test.moderator_ids)
+    ]}))
+    storage_service = StorageService(admins_path)
+    loc = Localization(ROOT / "fa.json")
+    bot = Bot(
+        token=TOKEN,
+        session=AiohttpSession(api=TelegramAPIServer.from_base(server.base_url)),
+        default=DefaultBotProperties(parse_mode="HTML"),
+    )
+    send_scheduler = create_send_scheduler(config)
+    bot.session.middleware(send_scheduler)
+    storage = create_storage(config)
+    dp = create_dispatcher(config, storage_service, loc, storage)
+    dp.update.outer_middleware(test.count_update)
+    dp["send_scheduler"] = send_scheduler
+    setup_workflow(dp, config, bot, loc)
+    submission_store = dp["submission_store"]
+    test.lookup_subject = lambda submission_id: getattr(submission_store.get(submission_id), "subject", None)
+
+    allowed_updates = dp.resolve_used_update_types()
+    if options.mode == "webhook":
+        bot_task = asyncio.create_task(run_webhook(dp, bot, config["webhook"], allowed_updates))
+    else:
+        await bot.delete_webhook(drop_pending_updates=True)
+        bot_task = asyncio.create_task(dp.start_polling(
+            bot, allowed_updates=allowed_updates, handle_signals=False, close_bot_session=False
+        ))
+
+    memory: List[List[float]] = []
+    started = time.perf_counter()
+
+    async def sample_memory():
+        while True:
+            memory.append([round(time.perf_counter() - started, 1), round(rss_bytes() / 2**20, 1)])
+            await asyncio.sleep(1.0)
+
+    gc.collect()
+    rss_start = rss_bytes()
+    sampler = asyncio.create_task(sample_memory())
+    try:
+        await test.run_users()
+        await test.drain()
+        elapsed = time.perf_counter() - started
+    finally:
+        sampler.cancel()
+        if options.mode == "webhook":
+            bot_task.cancel()
+        else:
+            await dp.stop_polling()
+        await asyncio.gather(bot_task, sampler, return_exceptions=True)
+        gc.collect()
+        rss_end = rss_bytes()
+        await close_workflow(dp)
+        await send_scheduler.close()
+        await storage.close()
+        await storage_service.close()
+        await bot.session.close()
+        await server.close()
+
+    return {
+        "mode": options.mode,
+        "users": options.users,
+        "elapsed_s": round(elapsed, 2),
+        "updates": test.handled_updates,
+        "updates_per_second": round(test.handled_updates / elapsed, 1) if elapsed else 0.0,
+        "counts": test.counts,
+        "submission_to_report": percentiles(test.report_latency),
+        "approval_to_channel": percentiles(test.publish_latency),
+        "api": {"calls": dict(sorted(server.calls.items())), "flood_waits": server.floods},
+        "memory": {
+            "start_mb": round(rss_start / 2**20, 1),
+            "end_mb": round(rss_end / 2**20, 1),
+            "peak_mb": max([sample[1] for sample in memory] + [round(rss_end / 2**20, 1)]),
+            "growth_mb": round((rss_end - rss_start) / 2**20, 1),
+            "samples": memory,
+        },
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    def latency(name: str, stats: Dict[str, Any]) -> str:
+        if not stats["count"]:
+            return f"{name}: no samples"
+        return (
+            f"{name} ({stats['count']}): p50 {stats['p50_ms']:.0f} ms, p95 {stats['p95_ms']:.0f} ms, "
+            f"p99 {stats['p99_ms']:.0f} ms, max {stats['max_ms']:.0f} ms"
+        )
+
+    counts = report["counts"]
+    memory = report["memory"]
+    return "\n".join([
+        f"Mode: {report['mode']}, {report['users']} users, {report['elapsed_s']} s",
+        f"Updates handled: {report['updates']} ({report['updates_per_second']}/s)",
+        f"Submissions: {counts['submissions_started']} started, {counts['reported']} reported, "
+        f"{counts['timeouts']} timed out",
+        f"Moderation: {counts['approved']} approved, {counts['deleted']} deleted, "
+        f"{counts['double_clicks']} double clicks, {counts['published']} published",
+        latency("Submission -> report group", report["submission_to_report"]),
+        latency("Approval -> channel", report["approval_to_channel"]),
+        f"Bot API: {sum(report['api']['calls'].values())} calls, {report['api']['flood_waits']} answered with 429",
+        f"Memory: {memory['start_mb']} MB -> {memory['end_mb']} MB (peak {memory['peak_mb']} MB, "
+        f"growth {memory['growth_mb']:+} MB)",
+    ])
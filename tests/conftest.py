@@ -0,0 +1,53 @@
+import itertools
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+class FakeBot:
+    """Records Bot API calls instead of making them; every sent message gets a fresh id."""
+
+    def __init__(self):
+        self.calls = []
+        self.fail = set()
+        self._ids = itertools.count(1000)
+
+    @property
+    def counts(self) -> Counter:
+        return Counter(method for method, _ in self.calls)
+
+    def _record(self, method: str, kwargs: dict):
+        self.calls.append((method, kwargs))
+        if method in self.fail:
+            raise RuntimeError(f"{method} failed")
+
+    def _message(self):
+        return SimpleNamespace(message_id=next(self._ids))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self._record("send_message", {"chat_id": chat_id, "text": text, **kwargs})
+        return self._message()
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        self._record("send_media_group", {"chat_id": chat_id, "media": media, **kwargs})
+        return [self._message() for _ in media]
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        self._record("copy_message", {"chat_id": chat_id, "from_chat_id": from_chat_id, "message_id": message_id, **kwargs})
+        return self._message()
+
+    async def edit_message_text(self, **kwargs):
+        self._record("edit_message_text", kwargs)
+        return True
+
+    async def edit_message_caption(self, **kwargs):
+        self._record("edit_message_caption", kwargs)
+        return True
+
+    async def delete_messages(self, chat_id, message_ids):
+        self._record("delete_messages", {"chat_id": chat_id, "message_ids": message_ids})
+        return True
+
+@pytest.fixture
+def fake_bot() -> FakeBot:
+    return FakeBot()
@@ -0,0 +1,24 @@
+import pytest
+from benchmarks.harness import compare, measure
+
+def results(**timings):
+    return {"results": {name: {"ns_per_op": ns, "number": 1} for name, ns in timings.items()}}
+
+def test_compare_flags_only_regressions_above_threshold():
+    baseline = results(fast=100.0, slow=100.0, steady=100.0)
+    current = results(fast=80.0, slow=140.0, steady=120.0, new=5.0)
+    assert compare(current, baseline, threshold=0.25) == [("slow", 100.0, 140.0)]
+
+@pytest.mark.asyncio
+async def test_measure_sync_and_async():
+    calls = []
+
+    async def op():
+        calls.append(1)
+
+    ns_per_op, number = await measure(op, min_time=0.01, rounds=2)
+    assert ns_per_op > 0
+    assert len(calls) >= number * 2
+
+    ns_per_op, _ = await measure(lambda: sum(range(10)), min_time=0.01, rounds=2)
+    assert ns_per_op > 0
@@ -0,0 +1,146 @@
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+from app.middlewares.acl import ACLMiddleware
+from app.middlewares.config import ConfigMiddleware
+from app.middlewares.throttling import ThrottlingMiddleware
+from app.services.config import Config, ConfigError, ConfigManager, load_config, parse_config
+from app.services.rate_limiter import create_rate_limiter
+
+EXAMPLE = Path(__file__).parent.parent / "config.yaml.example"
+
+BASE = {
+    "owner_id": 1,
+    "report_group_id": -100,
+    "output_channel_id": -200,
+    "required_channel_id": -300,
+    "rate_limit": {"limit": 5, "period": 3600, "roles": {"admin": {"limit": 0}}},
+}
+
+
+def write(path: Path, **changes):
+    path.write_text(yaml.safe_dump({**BASE, **changes}))
+
+
+def test_example_config_is_valid():
+    config = load_config(EXAMPLE)
+    assert isinstance(config.owner_id, int)
+
+
+def test_config_is_typed_and_a_read_only_mapping():
+    config = parse_config(dict(BASE))
+    assert config.output_channel_id == -200
+    assert config.rate_limit.limit == 5
+    assert config.rate_limit.roles == {"admin": (0, 3600)}
+    # Existing dict-style access keeps working
+    assert config["report_group_id"] == -100
+    assert config.get("dedup", {}).get("enabled") is None
+    with pytest.raises(TypeError):
+        config["owner_id"] = 2
+
+
+def test_invalid_config_lists_every_problem():
+    with pytest.raises(ConfigError) as error:
+        parse_config({
+            **BASE,
+            "owner_id": "me",
+            "rate_limit": {"limit": -1, "period": 3600, "algorithm": "leaky"},
+            "fsm": {"backend": "redis"},
+            "logging": {"rotation": "sometimes"},
+        })
+    message = str(error.value)
+    for key in ("owner_id", "rate_limit.limit", "rate_limit.algorithm", "fsm.backend", "logging.rotation"):
+        assert key in message
+
+
+def test_reload_swaps_config_and_notifies(tmp_path):
+    path = tmp_path / "config.yaml"
+    write(path)
+    manager = ConfigManager(path)
+    before = manager.current
+    seen = []
+    manager.subscribe(seen.append)
+
+    write(path, output_channel_id=-201, fsm={"backend": "sqlite"})
+    restart_needed = manager.reload()
+
+    assert manager.current.output_channel_id == -201
+    assert seen == [manager.current]
+    assert restart_needed == ["fsm"]
+    # The old snapshot is left untouched for updates still using it
+    assert before.output_channel_id == -200
+
+
+def test_failed_reload_keeps_current_config(tmp_path):
+    path = tmp_path / "config.yaml"
+    write(path)
+    manager = ConfigManager(path)
+    before = manager.current
+
+    path.write_text("owner_id: [unclosed")
+    with pytest.raises(ConfigError):
+        manager.reload()
+    write(path, report_group_id="oops")
+    with pytest.raises(ConfigError):
+        manager.reload()
+    assert manager.current is before
+
+
+@pytest.mark.asyncio
+async def test_update_keeps_its_config_snapshot_across_reload(tmp_path):
+    path = tmp_path / "config.yaml"
+    write(path)
+    manager = ConfigManager(path)
+    storage = SimpleNamespace(get_admin=lambda user_id: None)
+    acl = ACLMiddleware(storage, manager.current, membership=SimpleNamespace(is_member=_is_member))
+    seen = []
+
+    async def handler(event, data):
+        # A reload while the update is in flight doesn't change what it sees
+        write(path, owner_id=2)
+        manager.reload()
+        seen.append((data["config"].owner_id, data["user_role"]))
+
+    async def through_acl(event, data):
+        return await acl(handler, event, data)
+
+    data = {"event_from_user": SimpleNamespace(id=2)}
+    await ConfigMiddleware(manager)(through_acl, object(), data)
+    assert seen == [(1, "user")]
+
+    # The next update gets the new config
+    data = {"event_from_user": SimpleNamespace(id=2)}
+    await ConfigMiddleware(manager)(through_acl, object(), data)
+    assert data["user_role"] == "owner"
+
+
+async def _is_member(bot, chat_id, user_id):
+    return True
+
+
+@pytest.mark.asyncio
+async def test_throttling_picks_up_new_limits():
+    answers = []
+    event = SimpleNamespace(from_user=SimpleNamespace(id=7), answer=lambda text: _answer(answers, text))
+    loc = SimpleNamespace(get=lambda key, default: key)
+    throttling = ThrottlingMiddleware(create_rate_limiter("gcra", clock=lambda: 100.0), limit=1, period=3600, loc=loc)
+    handled = []
+
+    async def handler(event, data):
+        handled.append(event)
+
+    await throttling(handler, event, {"user_role": "user"})
+    await throttling(handler, event, {"user_role": "user"})
+    assert len(handled) == 1 and answers == ["rate_limit_exceeded"]
+
+    config = parse_config({**BASE, "rate_limit": {"limit": 5, "period": 3600, "roles": {"user": {"limit": 0}}}})
+    throttling.update_limits(config.rate_limit.limit, config.rate_limit.period, config.rate_limit.roles)
+    await throttling(handler, event, {"user_role": "user"})
+    assert len(handled) == 2
+
+
+async def _answer(answers, text):
+    answers.append(text)
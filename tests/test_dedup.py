@@ -0,0 +1,80 @@
+import pytest
+from app.services.dedup import MATCH_MEDIA, MATCH_SIMILAR, MATCH_TEXT, DedupIndex, normalize_text
+from app.utils.submission import MediaItem, Submission
+
+LONG_TEXT = (
+    "استاد این ترم کلاس‌ها را دیر شروع می‌کند و امتحان میان‌ترم را بدون هماهنگی جابجا کرد "
+    "و نمره‌ها هم هنوز اعلام نشده است و کسی جواب نمی‌دهد"
+)
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def text(value: str, user_id: int = 1) -> Submission:
+    return Submission(chat_id=user_id, user_id=user_id, message_ids=(1,), message_type="text", text=value)
+
+def photo(file_unique_id: str, caption: str = None) -> Submission:
+    return Submission(
+        chat_id=1, user_id=1, message_ids=(1,), message_type="photo",
+        media=(MediaItem("photo", "file", file_unique_id, 1),), caption=caption,
+    )
+
+def test_normalize_text():
+    assert normalize_text("  Hello,   WORLD!! ") == "hello world"
+    # Arabic yeh/kaf and diacritics are folded into the Persian forms
+    assert normalize_text("كِتابي") == normalize_text("کتابی")
+
+def test_max_distance_beyond_the_bands_is_rejected(tmp_path):
+    # Four differing bits could fall in all four bands and the match would never be a candidate
+    with pytest.raises(ValueError):
+        DedupIndex(tmp_path / "bot.db", max_distance=4)
+
+@pytest.mark.asyncio
+async def test_exact_and_near_duplicates(tmp_path):
+    index = DedupIndex(tmp_path / "bot.db")
+    first = await index.add(text(LONG_TEXT))
+    await index.add(photo("photo-1"))
+
+    match = index.check(text(LONG_TEXT.replace(" و ", " ،و ") + "!!", user_id=2))
+    assert match.reason == MATCH_TEXT and match.entry is first
+
+    edited = LONG_TEXT.replace("دیر", "خیلی دیر")
+    match = index.check(text(edited))
+    assert match.reason == MATCH_SIMILAR and match.distance <= 3
+
+    assert index.check(photo("photo-1", caption="another caption")).reason == MATCH_MEDIA
+    assert index.check(text("یک متن کاملا متفاوت درباره‌ی موضوعی دیگر که ربطی به قبلی ندارد")) is None
+    # Short texts only match exactly
+    await index.add(text("سلام به همه"))
+    assert index.check(text("سلام به همه دوستان")) is None
+    await index.close()
+
+@pytest.mark.asyncio
+async def test_retention_and_restart(tmp_path):
+    clock = Clock()
+    index = DedupIndex(tmp_path / "bot.db", retention=3600, max_entries=2, clock=clock)
+    await index.add(photo("a"))
+    await index.add(photo("b"))
+    await index.add(photo("c"))
+    # Over max_entries: the oldest is forgotten
+    assert index.check(photo("a")) is None
+    assert len(index) == 2
+
+    clock.now += 1800
+    await index.add(text(LONG_TEXT))
+    await index.close()
+
+    index = DedupIndex(tmp_path / "bot.db", retention=3600, max_entries=2, clock=clock)
+    assert index.check(photo("c")).reason == MATCH_MEDIA
+    assert index.check(text(LONG_TEXT)).reason == MATCH_TEXT
+
+    clock.now += 3000
+    # "c" has expired; adding runs the eviction
+    await index.add(photo("d"))
+    assert index.check(photo("c")) is None
+    assert index.check(text(LONG_TEXT)).reason == MATCH_TEXT
+    await index.close()
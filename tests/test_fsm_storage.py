@@ -0,0 +1,77 @@
+import sqlite3
+from pathlib import Path
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from app.services.fsm_storage import SQLiteStorage
+from app.states.user_states import UserSubmission
+
+KEY = StorageKey(bot_id=1, chat_id=100, user_id=100)
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+def stored_rows(db_path: Path) -> int:
+    with sqlite3.connect(db_path) as connection:
+        return connection.execute("SELECT COUNT(*) FROM fsm").fetchone()[0]
+
+@pytest.mark.asyncio
+async def test_state_survives_restart(tmp_path: Path):
+    db_path = tmp_path / "bot.db"
+    storage = SQLiteStorage(db_path)
+    await storage.set_state(KEY, UserSubmission.awaiting_subject_for_direct_message)
+    await storage.update_data(KEY, {"subject": "test"})
+    await storage.close()
+
+    storage = SQLiteStorage(db_path)
+    assert await storage.get_state(KEY) == UserSubmission.awaiting_subject_for_direct_message.state
+    assert await storage.get_data(KEY) == {"subject": "test"}
+    await storage.close()
+
+@pytest.mark.asyncio
+async def test_writes_are_batched(tmp_path: Path):
+    db_path = tmp_path / "bot.db"
+    storage = SQLiteStorage(db_path, flush_interval=60)
+    for user_id in range(10):
+        await storage.set_data(StorageKey(bot_id=1, chat_id=user_id, user_id=user_id), {"n": user_id})
+    # Still buffered, but readable
+    assert stored_rows(db_path) == 0
+    assert await storage.get_data(StorageKey(bot_id=1, chat_id=3, user_id=3)) == {"n": 3}
+
+    await storage.flush()
+    assert stored_rows(db_path) == 10
+
+    # Clearing a conversation deletes its row
+    await storage.set_state(KEY, None)
+    await storage.set_data(StorageKey(bot_id=1, chat_id=3, user_id=3), {})
+    await storage.flush()
+    assert stored_rows(db_path) == 9
+    await storage.close()
+
+@pytest.mark.asyncio
+async def test_idle_conversations_expire(tmp_path: Path):
+    clock = FakeClock()
+    storage = SQLiteStorage(tmp_path / "bot.db", ttl=60, clock=clock)
+    await storage.set_state(KEY, UserSubmission.awaiting_subject)
+    await storage.flush()
+
+    clock.now += 61
+    assert await storage.get_state(KEY) is None
+    await storage.flush()
+    assert stored_rows(tmp_path / "bot.db") == 0
+    await storage.close()
+
+@pytest.mark.asyncio
+async def test_read_cache_is_bounded(tmp_path: Path):
+    storage = SQLiteStorage(tmp_path / "bot.db", cache_size=5)
+    for user_id in range(20):
+        await storage.set_data(StorageKey(bot_id=1, chat_id=user_id, user_id=user_id), {"n": user_id})
+    await storage.flush()
+    assert len(storage._cache) == 5
+    # Evicted keys are read back from disk
+    assert await storage.get_data(StorageKey(bot_id=1, chat_id=0, user_id=0)) == {"n": 0}
+    await storage.close()
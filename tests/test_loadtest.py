@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+import yaml
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramRetryAfter
+
+from loadtest.fake_api import FakeTelegramServer
+from loadtest.scenario import ROOT, LoadTestOptions, percentiles, run_load_test
+
+def test_percentiles_nearest_rank():
+    stats = percentiles([i / 1000 for i in range(1, 101)])
+    assert (stats["p50_ms"], stats["p95_ms"], stats["p99_ms"]) == pytest.approx((50, 95, 99))
+    assert percentiles([]) == {"count": 0}
+
+@pytest.mark.asyncio
+async def test_fake_api_serves_updates_and_floods():
+    server = FakeTelegramServer(flood_rate=1.0, retry_after=3)
+    await server.start()
+    bot = Bot(token="42:TEST", session=AiohttpSession(api=TelegramAPIServer.from_base(server.base_url)))
+    try:
+        server.push_update({"message": {
+            "message_id": 1, "date": 0, "chat": {"id": 5, "type": "private", "first_name": "U"}, "text": "hi",
+        }})
+        updates = await bot.get_updates(offset=0, timeout=1)
+        assert [update.message.text for update in updates] == ["hi"]
+        # Acknowledged by the next offset; nothing new arrives
+        assert await bot.get_updates(offset=updates[-1].update_id + 1, timeout=0) == []
+
+        with pytest.raises(TelegramRetryAfter) as error:
+            await bot.send_message(5, "hello")
+        assert error.value.retry_after == 3
+        assert server.floods == 1
+    finally:
+        await bot.session.close()
+        await server.close()
+
+@pytest.mark.asyncio
+async def test_load_test_runs_both_workflows_end_to_end(tmp_path):
+    # The bot's routers are module-level, so one Dispatcher per process: a single scenario here
+    with open(ROOT / "config.yaml.example") as f:
+        config = yaml.safe_load(f)
+    options = LoadTestOptions(
+        users=8, submissions=2, album_share=0.5, ramp=0.2, think=0.1, moderator_delay=0.1,
+        latency=0.0, jitter=0.0, reply_timeout=10, drain_timeout=10, seed=3,
+    )
+    report = await asyncio.wait_for(run_load_test(config, options, tmp_path), 60)
+
+    counts = report["counts"]
+    assert counts["submissions_started"] == counts["reported"] == 16
+    assert counts["timeouts"] == 0
+    assert counts["approved"] + counts["deleted"] == 16
+    assert counts["published"] == counts["approved"]
+    assert report["submission_to_report"]["count"] == 16
+    assert report["approval_to_channel"]["count"] == counts["approved"]
+    assert report["updates_per_second"] > 0
+    assert report["memory"]["samples"]
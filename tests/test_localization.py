@@ -0,0 +1,57 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+from app.services.localization import REQUIRED_KEYS, Localization
+
+REPO_LOC_FILE = Path(__file__).parent.parent / "fa.json"
+
+@pytest.fixture
+def loc_file(tmp_path: Path) -> Path:
+    path = tmp_path / "fa.json"
+    path.write_text(REPO_LOC_FILE.read_text(encoding="utf-8"), encoding="utf-8")
+    return path
+
+def write_catalog(path: Path, catalog: dict, mtime_offset: int = 0):
+    path.write_text(json.dumps(catalog, ensure_ascii=False), encoding="utf-8")
+    if mtime_offset:
+        stat = path.stat()
+        os.utime(path, (stat.st_atime, stat.st_mtime + mtime_offset))
+
+def test_repo_catalog_is_valid():
+    loc = Localization(REPO_LOC_FILE)
+    for key in REQUIRED_KEYS:
+        assert loc[key]
+
+def test_format(loc_file: Path):
+    loc = Localization(loc_file)
+    text = loc.format("admin_added", alias="ali", user_id=123)
+    assert "ali" in text and "123" in text
+    assert loc.format("welcome") == loc["welcome"]
+
+def test_missing_key_fails(loc_file: Path):
+    catalog = json.loads(loc_file.read_text(encoding="utf-8"))
+    del catalog["welcome"]
+    write_catalog(loc_file, catalog)
+    with pytest.raises(ValueError, match="welcome"):
+        Localization(loc_file)
+
+def test_bad_placeholder_fails(loc_file: Path):
+    catalog = json.loads(loc_file.read_text(encoding="utf-8"))
+    catalog["admin_added"] = "Admin {alais} added"
+    write_catalog(loc_file, catalog)
+    with pytest.raises(ValueError, match="alais"):
+        Localization(loc_file)
+
+def test_reload_on_mtime_change(loc_file: Path):
+    loc = Localization(loc_file, reload_interval=0)
+    catalog = json.loads(loc_file.read_text(encoding="utf-8"))
+    catalog["welcome"] = "hello"
+    write_catalog(loc_file, catalog, mtime_offset=10)
+    assert loc["welcome"] == "hello"
+
+    # A broken edit keeps the previous catalog
+    catalog["welcome"] = "{oops"
+    write_catalog(loc_file, catalog, mtime_offset=20)
+    assert loc["welcome"] == "hello"
@@ -0,0 +1,120 @@
+import json
+import logging
+import queue
+from types import SimpleNamespace
+
+import pytest
+from aiogram.types import Update, User
+
+from app.middlewares.log_context import LogContextMiddleware
+from app.services.log_pipeline import (
+    DroppingQueueHandler, JsonFormatter, bind_log_context, create_file_handler, parse_rotation,
+    reset_log_context, start_queue_logging,
+)
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+def make_record(message: str, level: int = logging.INFO) -> logging.LogRecord:
+    return logging.LogRecord("test", level, __file__, 1, message, None, None)
+
+@pytest.mark.parametrize("rotation, expected", [
+    ("10 MB", ("size", 10 * 1024 ** 2)),
+    ("500kb", ("size", 500 * 1024)),
+    ("1.5 GB", ("size", int(1.5 * 1024 ** 3))),
+    ("daily", ("time", ("MIDNIGHT", 1))),
+    ("hourly", ("time", ("H", 1))),
+    ("12 hours", ("time", ("H", 12))),
+    ("2 weeks", ("time", ("D", 14))),
+])
+def test_parse_rotation(rotation, expected):
+    assert parse_rotation(rotation) == expected
+
+def test_parse_rotation_rejects_unknown_values():
+    with pytest.raises(ValueError):
+        parse_rotation("10 fortnights")
+
+def test_create_file_handler_picks_size_or_time(tmp_path):
+    size_handler = create_file_handler(str(tmp_path / "a.log"), "1 GB")
+    time_handler = create_file_handler(str(tmp_path / "b.log"), "daily", backup_count=7)
+    try:
+        assert isinstance(size_handler, logging.handlers.RotatingFileHandler)
+        assert size_handler.maxBytes == 1024 ** 3
+        assert isinstance(time_handler, logging.handlers.TimedRotatingFileHandler)
+        assert time_handler.backupCount == 7
+    finally:
+        size_handler.close()
+        time_handler.close()
+
+def test_full_queue_drops_instead_of_blocking():
+    log_queue = queue.Queue(maxsize=2)
+    handler = DroppingQueueHandler(log_queue)
+    for i in range(5):
+        handler.handle(make_record(f"burst {i}"))
+    assert handler.dropped == 3
+    assert [log_queue.get_nowait().getMessage() for _ in range(2)] == ["burst 0", "burst 1"]
+
+    # Once there is room, the loss is reported after the next record
+    handler.handle(make_record("after"))
+    messages = [log_queue.get_nowait().getMessage() for _ in range(2)]
+    assert messages == ["after", "Dropped 3 log records: the log queue was full."]
+
+def test_pipeline_writes_on_the_listener_thread_with_context():
+    target = ListHandler()
+    target.setFormatter(JsonFormatter())
+    queue_handler, listener = start_queue_logging([target])
+    logger = logging.getLogger("test.pipeline")
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+    try:
+        token = bind_log_context(update_id=7, user_id=42, role="user", handler="direct_submission")
+        try:
+            try:
+                raise RuntimeError("boom")
+            except RuntimeError:
+                logger.exception("Failed for %s", "someone")
+        finally:
+            reset_log_context(token)
+        logger.warning("outside")
+    finally:
+        listener.stop()
+        listener.stop()
+        logger.removeHandler(queue_handler)
+
+    first, second = (json.loads(target.format(record)) for record in target.records)
+    assert first["message"] == "Failed for someone"
+    assert (first["update_id"], first["user_id"], first["role"], first["handler"]) == (7, 42, "user", "direct_submission")
+    assert "RuntimeError: boom" in first["exception"]
+    assert second["message"] == "outside" and "update_id" not in second
+    assert target.records[1].context == ""
+    assert target.records[0].context == " [update_id=7 user_id=42 role=user handler=direct_submission]"
+
+@pytest.mark.asyncio
+async def test_log_context_middleware_binds_update_and_handler():
+    middleware = LogContextMiddleware()
+    target = ListHandler()
+    queue_handler, listener = start_queue_logging([target])
+
+    async def inner(event, data):
+        queue_handler.handle(make_record("inside"))
+
+    async def outer(event, data):
+        data = {**data, "user_role": "admin", "handler": SimpleNamespace(callback=approve_callback_handler)}
+        return await middleware(inner, event, data)
+
+    async def approve_callback_handler():
+        pass
+
+    update = Update(update_id=99)
+    await middleware(outer, update, {"event_from_user": User(id=5, is_bot=False, first_name="A")})
+    queue_handler.handle(make_record("after"))
+    listener.stop()
+
+    inside, after = target.records
+    assert (inside.update_id, inside.user_id, inside.role, inside.handler) == (99, 5, "admin", "approve_callback_handler")
+    assert after.update_id is None
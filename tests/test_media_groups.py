@@ -0,0 +1,101 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from app.services.media_groups import AddResult, MediaGroupAggregator
+
+def album_item(message_id: int, user_id: int = 1, group: str = "g1"):
+    return SimpleNamespace(
+        message_id=message_id,
+        media_group_id=group,
+        chat=SimpleNamespace(id=user_id),
+        from_user=SimpleNamespace(id=user_id),
+    )
+
+class Collector:
+    def __init__(self):
+        self.albums = []
+
+    async def __call__(self, messages):
+        self.albums.append([msg.message_id for msg in messages])
+
+@pytest.mark.asyncio
+async def test_finishes_after_quiet_gap():
+    aggregator = MediaGroupAggregator(min_gap=0.05, max_gap=0.2)
+    done = Collector()
+    for message_id in (3, 1, 2):
+        aggregator.add(album_item(message_id), done)
+    await asyncio.sleep(0.02)
+    assert done.albums == []
+
+    await asyncio.sleep(0.1)
+    # Fast arrivals shrink the wait to min_gap; items come back in message order
+    assert done.albums == [[1, 2, 3]]
+    assert len(aggregator) == 0
+    assert aggregator.items == 0
+
+@pytest.mark.asyncio
+async def test_finishes_immediately_at_ten_items():
+    aggregator = MediaGroupAggregator(min_gap=5, max_gap=5)
+    done = Collector()
+    for message_id in range(10):
+        aggregator.add(album_item(message_id), done)
+    await asyncio.sleep(0)
+    assert done.albums == [list(range(10))]
+
+@pytest.mark.asyncio
+async def test_albums_are_keyed_per_user():
+    aggregator = MediaGroupAggregator(min_gap=0.01, max_gap=0.05)
+    done = Collector()
+    aggregator.add(album_item(1, user_id=1, group="same"), done)
+    aggregator.add(album_item(2, user_id=2, group="same"), done)
+    await asyncio.sleep(0.1)
+    assert sorted(done.albums) == [[1], [2]]
+
+@pytest.mark.asyncio
+async def test_per_user_cap_does_not_starve_others():
+    aggregator = MediaGroupAggregator(min_gap=0.01, max_gap=0.05, max_albums_per_user=1)
+    done = Collector()
+    assert aggregator.add(album_item(1, group="a"), done) is AddResult.ADDED
+    assert aggregator.add(album_item(2, group="b"), done) is AddResult.REJECTED
+    assert aggregator.add(album_item(3, group="b"), done) is AddResult.REJECTED_AGAIN
+    assert aggregator.add(album_item(4, user_id=2, group="c"), done) is AddResult.ADDED
+    await asyncio.sleep(0.1)
+    assert sorted(done.albums) == [[1], [4]]
+
+@pytest.mark.asyncio
+async def test_global_caps():
+    aggregator = MediaGroupAggregator(min_gap=0.01, max_gap=0.05, max_albums=2)
+    done = Collector()
+    results = [aggregator.add(album_item(i, user_id=i, group=str(i)), done) for i in range(3)]
+    assert results == [AddResult.ADDED, AddResult.ADDED, AddResult.REJECTED]
+
+    aggregator = MediaGroupAggregator(min_gap=5, max_gap=5, max_items=3)
+    for message_id in range(2):
+        aggregator.add(album_item(message_id), done)
+    # Reaching the limit of items held flushes the album right away
+    aggregator.add(album_item(2), done)
+    await asyncio.sleep(0)
+    assert done.albums[-1] == [0, 1, 2]
+    assert aggregator.items == 0
+
+@pytest.mark.asyncio
+async def test_max_age_bounds_slow_albums():
+    aggregator = MediaGroupAggregator(min_gap=0.2, max_gap=0.2, max_age=0.1)
+    done = Collector()
+    aggregator.add(album_item(1), done)
+    await asyncio.sleep(0.15)
+    assert done.albums == [[1]]
+
+@pytest.mark.asyncio
+async def test_late_item_of_a_finished_album_is_dropped():
+    aggregator = MediaGroupAggregator(min_gap=0.01, max_gap=0.02, max_age=1)
+    done = Collector()
+    aggregator.add(album_item(1), done)
+    aggregator.add(album_item(2), done)
+    await asyncio.sleep(0.1)
+    # A straggler must not be posted as an album of its own
+    assert aggregator.add(album_item(3), done) is AddResult.LATE
+    await asyncio.sleep(0.1)
+    assert done.albums == [[1, 2]]
+    assert aggregator.late == 1 and len(aggregator) == 0
@@ -0,0 +1,75 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from app.services.membership import MembershipCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class FakeBot:
+    def __init__(self, status: str = "member", delay: float = 0):
+        self.status = status
+        self.delay = delay
+        self.calls = 0
+
+    async def get_chat_member(self, chat_id: int, user_id: int):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(status=self.status)
+
+@pytest.mark.asyncio
+async def test_ttl_expiry():
+    clock = FakeClock()
+    cache = MembershipCache(ttl=60, clock=clock)
+    bot = FakeBot()
+
+    assert await cache.is_member(bot, -100, 1) is True
+    assert await cache.is_member(bot, -100, 1) is True
+    assert bot.calls == 1
+
+    clock.now = 61
+    bot.status = "left"
+    assert await cache.is_member(bot, -100, 1) is False
+    assert bot.calls == 2
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_share_request():
+    cache = MembershipCache()
+    bot = FakeBot(delay=0.01)
+    results = await asyncio.gather(*(cache.is_member(bot, -100, 1) for _ in range(10)))
+    assert all(result is True for result in results)
+    assert bot.calls == 1
+    # Joining a lookup in flight is not a cache hit
+    assert cache.stats()["hits"] == 0 and cache.stats()["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_of_a_user_who_left_all_fail():
+    cache = MembershipCache()
+    bot = FakeBot(status="left", delay=0.01)
+    results = await asyncio.gather(*(cache.is_member(bot, -100, 1) for _ in range(3)))
+    assert all(result is False for result in results)
+
+@pytest.mark.asyncio
+async def test_invalidate():
+    cache = MembershipCache()
+    bot = FakeBot()
+    await cache.is_member(bot, -100, 1)
+    cache.invalidate(-100, 1)
+    bot.status = "kicked"
+    assert await cache.is_member(bot, -100, 1) is False
+    assert bot.calls == 2
+
+@pytest.mark.asyncio
+async def test_bounded_size():
+    cache = MembershipCache(max_size=2)
+    bot = FakeBot()
+    for user_id in range(5):
+        await cache.is_member(bot, -100, user_id)
+    assert cache.stats()["size"] == 2
@@ -0,0 +1,85 @@
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+from aiogram.types import Message, Update
+from app.middlewares.metrics import HandlerMetricsMiddleware, TimedMiddleware, UpdateMetricsMiddleware
+from app.services.metrics import ApiMetricsMiddleware, Metrics
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 7,
+        "date": 1700000000,
+        "chat": {"id": 42, "type": "private", "first_name": "Test"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+        "text": "hello",
+    },
+}
+
+def test_text_format():
+    metrics = Metrics()
+    counter = metrics.counter("things_total", "Things.", ["kind"])
+    counter.inc("a")
+    counter.inc("a", amount=2)
+    histogram = metrics.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+    metrics.gauge_callback("queue_depth", "Depth.", lambda: 3)
+
+    text = metrics.render()
+    assert "# TYPE things_total counter" in text
+    assert 'things_total{kind="a"} 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_count 3" in text
+    assert "latency_seconds_sum 5.55" in text
+    assert "queue_depth 3" in text
+
+@pytest.mark.asyncio
+async def test_update_handler_and_middleware_metrics():
+    metrics = Metrics()
+    router = Router()
+
+    @router.message()
+    async def on_message(message: Message):
+        return "ok"
+
+    async def passthrough(handler, event, data):
+        return await handler(event, data)
+
+    dp = Dispatcher()
+    dp.update.outer_middleware(UpdateMetricsMiddleware(metrics))
+    dp.update.middleware(TimedMiddleware(passthrough, "acl", metrics))
+    router.message.middleware(HandlerMetricsMiddleware(metrics))
+    dp.include_router(router)
+
+    await dp.feed_update(Bot(token="42:TEST"), Update.model_validate(UPDATE))
+    text = metrics.render()
+    assert 'bot_updates_total{type="message"} 1' in text
+    assert 'bot_update_duration_seconds_count{type="message"} 1' in text
+    assert "bot_updates_in_flight 0" in text
+    assert 'bot_handler_duration_seconds_count{handler="test_metrics.on_message"} 1' in text
+    assert 'bot_middleware_duration_seconds_count{middleware="acl"} 1' in text
+
+@pytest.mark.asyncio
+async def test_api_metrics_count_flood_waits_and_errors():
+    metrics = Metrics()
+    middleware = ApiMetricsMiddleware(metrics)
+    method = SendMessage(chat_id=1, text="hi")
+
+    async def flooded(bot, method):
+        raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+
+    async def broken(bot, method):
+        raise RuntimeError("network down")
+
+    for make_request in (flooded, broken):
+        with pytest.raises(Exception):
+            await middleware(make_request, None, method)
+
+    assert middleware.flood_waits.value("sendMessage") == 1
+    assert middleware.errors.value("sendMessage", "RuntimeError") == 1
+    assert middleware.duration.count("sendMessage") == 2
@@ -0,0 +1,156 @@
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from app.services.broadcaster import Broadcaster
+from app.services.localization import Localization
+from app.services.moderation import ModerationResult, ModerationService
+from app.services.publish_queue import PublishQueue
+from app.services.submission_store import SubmissionStore
+from app.utils.submission import MediaItem, Submission
+
+CONFIG = {"report_group_id": -100, "output_channel_id": -200, "owner_id": 1}
+REPO_LOC_FILE = Path(__file__).parent.parent / "fa.json"
+
+def album(size: int = 3) -> Submission:
+    return Submission(
+        chat_id=42,
+        user_id=42,
+        message_ids=tuple(range(1, size + 1)),
+        message_type="album",
+        media=tuple(MediaItem("photo", f"f{i}", f"u{i}", i) for i in range(1, size + 1)),
+        caption="caption",
+    )
+
+def text_message() -> Submission:
+    return Submission(chat_id=42, user_id=42, message_ids=(7,), message_type="text", text="hello")
+
+async def report(bot, store: SubmissionStore, submission: Submission):
+    """What handle_submission does: store the submission, then send it to the report group."""
+    pending = await store.create(submission, "موضوع", CONFIG["report_group_id"], "header")
+    message_ids = await Broadcaster.forward_to_report_group(bot, submission, "header", None, CONFIG)
+    await store.set_report_messages(pending.id, message_ids)
+    bot.calls.clear()
+    return pending
+
+@pytest_asyncio.fixture
+async def moderation(tmp_path):
+    store = SubmissionStore(tmp_path / "bot.db")
+    yield ModerationService(store, CONFIG, Localization(REPO_LOC_FILE))
+    await store.close()
+
+@pytest.mark.asyncio
+async def test_failed_album_report_removes_everything_it_sent(fake_bot):
+    send_message = fake_bot.send_message
+
+    async def keyboard_fails(chat_id, text, **kwargs):
+        if "reply_markup" in kwargs:
+            raise RuntimeError("keyboard failed")
+        return await send_message(chat_id, text, **kwargs)
+
+    fake_bot.send_message = keyboard_fails
+    assert await Broadcaster.forward_to_report_group(fake_bot, album(3), "header", None, CONFIG) is None
+    assert [method for method, _ in fake_bot.calls] == ["send_message", "send_media_group", "delete_messages"]
+    # The header and the album both go, so the retry doesn't leave a duplicate album
+    assert len(fake_bot.calls[-1][1]["message_ids"]) == 4
+
+@pytest.mark.asyncio
+async def test_album_approval_publishes_whole_album(fake_bot, moderation):
+    pending = await report(fake_bot, moderation.store, album(3))
+    assert len(pending.report_message_ids) == 5  # header, 3 media, keyboard
+
+    result = await moderation.approve(fake_bot, pending.id, "ali", 7)
+    assert result is ModerationResult.DONE
+    # One media group, the log message, and one edit each for the header and the keyboard message
+    assert fake_bot.counts == {"send_media_group": 1, "send_message": 1, "edit_message_text": 2}
+
+    published = next(kwargs for method, kwargs in fake_bot.calls if method == "send_media_group")
+    assert published["chat_id"] == CONFIG["output_channel_id"]
+    assert [item.media for item in published["media"]] == ["f1", "f2", "f3"]
+    assert published["media"][0].caption.startswith("caption")
+    assert "#ارسالی" in published["media"][0].caption
+
+    edited = {kwargs["message_id"] for method, kwargs in fake_bot.calls if method == "edit_message_text"}
+    assert edited == {pending.report_message_ids[0], pending.report_message_ids[-1]}
+
+@pytest.mark.asyncio
+async def test_single_message_approval(fake_bot, moderation):
+    pending = await report(fake_bot, moderation.store, text_message())
+    assert await moderation.approve(fake_bot, pending.id, "ali", 7) is ModerationResult.DONE
+    assert fake_bot.counts == {"send_message": 2, "edit_message_text": 2}
+
+@pytest.mark.asyncio
+async def test_second_click_makes_no_calls(fake_bot, moderation):
+    pending = await report(fake_bot, moderation.store, album())
+    await moderation.approve(fake_bot, pending.id, "ali", 7)
+    fake_bot.calls.clear()
+
+    assert await moderation.approve(fake_bot, pending.id, "reza", 8) is ModerationResult.NOT_FOUND
+    assert await moderation.delete(fake_bot, pending.id, "reza", 8) is ModerationResult.NOT_FOUND
+    assert fake_bot.calls == []
+
+@pytest.mark.asyncio
+async def test_failed_publish_stays_pending(fake_bot, moderation):
+    pending = await report(fake_bot, moderation.store, album())
+    fake_bot.fail.add("send_media_group")
+    assert await moderation.approve(fake_bot, pending.id, "ali", 7) is ModerationResult.FAILED
+    assert moderation.store.get(pending.id) is pending
+
+    fake_bot.fail.clear()
+    assert await moderation.approve(fake_bot, pending.id, "ali", 7) is ModerationResult.DONE
+
+@pytest.mark.asyncio
+async def test_delete_removes_every_report_message(fake_bot, moderation):
+    pending = await report(fake_bot, moderation.store, album(4))
+    assert await moderation.delete(fake_bot, pending.id, "ali", 7) is ModerationResult.DONE
+    assert fake_bot.counts == {"delete_messages": 1, "send_message": 1}
+    deleted = next(kwargs for method, kwargs in fake_bot.calls if method == "delete_messages")
+    assert deleted["message_ids"] == pending.report_message_ids
+
+@pytest.mark.asyncio
+async def test_bulk_approval_keeps_order_and_logs_once(fake_bot, moderation):
+    pendings = [await report(fake_bot, moderation.store, text_message()) for _ in range(5)]
+    fake_bot.fail.add("edit_message_text")  # Failed edits must not stop the batch
+
+    # Ask in reverse; posts still go out oldest first
+    result = await moderation.approve_many(fake_bot, [pending.id for pending in reversed(pendings)], "ali", 7)
+    assert result == {"approved": 5, "failed": 0, "not_found": 0}
+    assert len(moderation.store) == 0
+
+    channel_posts = [
+        kwargs["text"] for method, kwargs in fake_bot.calls
+        if method == "send_message" and kwargs["chat_id"] == CONFIG["output_channel_id"]
+    ]
+    assert len(channel_posts) == 5
+    logs = [
+        kwargs["text"] for method, kwargs in fake_bot.calls
+        if method == "send_message" and kwargs["chat_id"] == CONFIG["report_group_id"]
+    ]
+    assert len(logs) == 1 and "تایید گروهی" in logs[0]
+    assert fake_bot.counts["edit_message_text"] == 10
+
+@pytest.mark.asyncio
+async def test_bulk_delete_batches_message_ids(fake_bot, moderation):
+    pendings = [await report(fake_bot, moderation.store, album(10)) for _ in range(9)]
+    result = await moderation.delete_many(fake_bot, [pending.id for pending in pendings] + ["missing"], "ali", 7)
+    assert result == {"deleted": 9, "not_found": 1}
+    # 9 albums x 12 report messages = 108 ids -> two deleteMessages calls
+    assert fake_bot.counts == {"delete_messages": 2, "send_message": 1}
+    deleted = [id_ for method, kwargs in fake_bot.calls if method == "delete_messages" for id_ in kwargs["message_ids"]]
+    assert sorted(deleted) == sorted(id_ for pending in pendings for id_ in pending.report_message_ids)
+
+@pytest.mark.asyncio
+async def test_approval_goes_through_publish_queue(fake_bot, moderation, tmp_path):
+    published = []
+
+    async def publish(post):
+        published.append(post)
+        return True
+
+    moderation.publish_queue = PublishQueue(tmp_path / "bot.db", publish)
+    pending = await report(fake_bot, moderation.store, album())
+    assert await moderation.approve(fake_bot, pending.id, "ali", 7) is ModerationResult.QUEUED
+    # Nothing is sent to the channel until the queue's slot opens
+    assert "send_media_group" not in fake_bot.counts
+    assert [post.submission for post in moderation.publish_queue.items()] == [pending.submission]
+    await moderation.publish_queue.close()
@@ -0,0 +1,297 @@
+import asyncio
+import sqlite3
+import time
+from pathlib import Path
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendMessage
+
+from app.services.broadcaster import PUBLISH, Broadcaster, publish_payload
+from app.services.localization import Localization
+from app.services.moderation import ModerationResult, ModerationService
+from app.services.outbox import (
+    STATUS_FAILED, STATUS_INTERRUPTED, STATUS_PENDING, STATUS_SENT, CircuitBreaker, Outbox, OwnerAlerts,
+    backoff_delay,
+)
+from app.services.submission_store import SubmissionStore
+from app.utils.submission import Submission
+
+CONFIG = {"report_group_id": -100, "output_channel_id": -200, "owner_id": 1}
+REPO_LOC_FILE = Path(__file__).parent.parent / "fa.json"
+
+
+class FlakySender:
+    """Fails the first `failures` sends to each chat, then records what it sends."""
+
+    def __init__(self, failures: int = 0, error: Exception = None):
+        self.failures = failures
+        self.error = error or ConnectionError("network down")
+        self.attempts = {}
+        self.sent = []
+
+    async def __call__(self, payload):
+        chat_id = payload["chat_id"]
+        self.attempts[chat_id] = self.attempts.get(chat_id, 0) + 1
+        if self.attempts[chat_id] <= self.failures:
+            raise self.error
+        self.sent.append(payload["n"])
+        return [len(self.sent)]
+
+
+async def wait_until(condition, timeout: float = 5.0):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.005)
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_backoff_grows_with_jitter_and_the_breaker_opens_after_repeated_failures():
+    delays = [backoff_delay(attempt, 1.0, 30.0) for attempt in (1, 2, 3, 10)]
+    assert 0.5 <= delays[0] <= 1 and 1 <= delays[1] <= 2 and 2 <= delays[2] <= 4 and 15 <= delays[3] <= 30
+
+    breaker = CircuitBreaker(threshold=3, cooldown=10, max_cooldown=25)
+    assert not breaker.record_failure(0) and not breaker.record_failure(0)
+    assert breaker.record_failure(0) and breaker.is_open(9) and not breaker.is_open(10)
+    # A failed trial pauses it for longer, but never beyond the cap
+    assert not breaker.record_failure(10) and breaker.open_until == 30
+    breaker.record_failure(30)
+    assert breaker.open_until == 55
+
+
+@pytest.mark.asyncio
+async def test_failed_sends_are_retried_in_order_and_never_sent_twice(tmp_path):
+    sender = FlakySender(failures=2)
+    sent = []
+    outbox = Outbox(tmp_path / "bot.db", base_delay=0.01, max_delay=0.02)
+
+    async def on_sent(delivery):
+        sent.append((delivery.key, delivery.result))
+
+    outbox.register("post", sender, on_sent=on_sent)
+    outbox.start()
+    try:
+        first = await outbox.submit("post", "a", -200, {"chat_id": -200, "n": 1})
+        assert first.status == STATUS_PENDING
+        # Queued behind the first, so the channel keeps their order
+        second = await outbox.submit("post", "b", -200, {"chat_id": -200, "n": 2})
+        assert second.attempts == 0
+        await wait_until(lambda: len(sent) == 2)
+        assert sender.sent == [1, 2]
+        assert sent == [("a", [1]), ("b", [2])]
+        assert outbox.retries == 2 and outbox.sent == 2 and len(outbox) == 0
+
+        again = await outbox.submit("post", "a", -200, {"chat_id": -200, "n": 1})
+        assert again.status == STATUS_SENT and again.result == [1]
+        assert sender.sent == [1, 2]
+    finally:
+        await outbox.close()
+
+
+@pytest.mark.asyncio
+async def test_deliveries_submitted_during_a_first_attempt_wait_behind_it(tmp_path):
+    release = asyncio.Event()
+    attempts = []
+
+    async def send(payload):
+        attempts.append(payload["n"])
+        if payload["n"] == 1:
+            await release.wait()
+            if attempts.count(1) == 1:
+                raise ConnectionError("network down")
+        return [payload["n"]]
+
+    outbox = Outbox(tmp_path / "bot.db", base_delay=0.01, max_delay=0.02)
+    outbox.register("post", send)
+    outbox.start()
+    try:
+        first = asyncio.ensure_future(outbox.submit("post", "a", -200, {"chat_id": -200, "n": 1}))
+        await asyncio.sleep(0.01)
+        second = await outbox.submit("post", "b", -200, {"chat_id": -200, "n": 2})
+        # Not sent alongside the first, which is still in flight
+        assert second.status == STATUS_PENDING and attempts == [1]
+        release.set()
+        assert (await first).status == STATUS_PENDING
+        await wait_until(lambda: outbox.sent == 2)
+        # The failed first delivery is retried before the second goes out
+        assert attempts == [1, 1, 2]
+    finally:
+        await outbox.close()
+
+
+@pytest.mark.asyncio
+async def test_a_sent_delivery_is_never_resent_when_recording_it_fails(tmp_path):
+    messages = []
+
+    async def send_alert(text):
+        messages.append(text)
+
+    sender = FlakySender()
+    outbox = Outbox(tmp_path / "bot.db", base_delay=0.01, max_delay=0.02, alerts=OwnerAlerts(send_alert, interval=60))
+    outbox.register("post", sender)
+    run = outbox.db.run
+    writes = []
+
+    async def failing_sent_write(func, *args):
+        if func.__name__ == "_update" and args[1]["status"] == STATUS_SENT:
+            writes.append(args[0])
+            if args[0] == "b" or len(writes) == 1:
+                raise sqlite3.OperationalError("database is locked")
+        return await run(func, *args)
+
+    outbox.db.run = failing_sent_write
+    outbox.start()
+    try:
+        # The write is tried again on its own
+        assert (await outbox.submit("post", "a", -200, {"chat_id": -200, "n": 1})).status == STATUS_SENT
+        assert writes == ["a", "a"]
+        # One that never saves stays sent in memory and the owner hears about it
+        assert (await outbox.submit("post", "b", -200, {"chat_id": -200, "n": 2})).status == STATUS_SENT
+        await wait_until(lambda: messages)
+        await asyncio.sleep(0.05)
+        assert sender.sent == [1, 2] and outbox.sent == 2 and outbox.retries == 0
+    finally:
+        await outbox.close()
+
+
+@pytest.mark.asyncio
+async def test_rejected_requests_fail_right_away_and_alerts_are_coalesced(tmp_path):
+    messages = []
+
+    async def send_alert(text):
+        messages.append(text)
+
+    alerts = OwnerAlerts(send_alert, interval=60)
+    sender = FlakySender(failures=100, error=TelegramBadRequest(SendMessage(chat_id=-200, text="x"), "caption too long"))
+    failed = []
+
+    async def on_failed(delivery):
+        failed.append(delivery.key)
+
+    outbox = Outbox(tmp_path / "bot.db", alerts=alerts)
+    outbox.register("post", sender, on_failed=on_failed)
+    outbox.start()
+    try:
+        for n in range(20):
+            delivery = await outbox.submit("post", f"k{n}", -200, {"chat_id": -200, "n": n})
+            assert delivery.status == STATUS_FAILED
+        assert sender.attempts[-200] == 20 and len(failed) == 20
+        # A rejected request says nothing about the chat, so it isn't paused
+        assert outbox.open_circuits() == 0
+        # The first alert goes out at once; the rest wait for the interval and come as one summary
+        await wait_until(lambda: messages)
+        await asyncio.sleep(0.05)
+        assert len(messages) == 1
+        await alerts.flush()
+        assert len(messages) == 2 and "(×" in messages[1]
+
+        # A failed delivery may be tried again under the same key
+        sender.failures = 0
+        assert (await outbox.submit("post", "k0", -200, {"chat_id": -200, "n": 0})).status == STATUS_SENT
+    finally:
+        await outbox.close()
+
+
+@pytest.mark.asyncio
+async def test_an_unreachable_chat_is_paused_without_holding_up_others(tmp_path):
+    sender = FlakySender(failures=3)
+    outbox = Outbox(tmp_path / "bot.db", base_delay=0.001, max_delay=0.001, breaker_threshold=3, breaker_cooldown=0.2)
+    outbox.register("post", sender)
+    outbox.start()
+    try:
+        await outbox.submit("post", "down", -300, {"chat_id": -300, "n": 1})
+        await wait_until(lambda: sender.attempts[-300] == 3)
+        assert outbox.open_circuits() == 1
+        # Waits behind the paused chat's first delivery
+        assert (await outbox.submit("post", "down-2", -300, {"chat_id": -300, "n": 2})).attempts == 0
+
+        sender.attempts[-200] = sender.failures
+        assert (await outbox.submit("post", "up", -200, {"chat_id": -200, "n": 3})).status == STATUS_SENT
+
+        await wait_until(lambda: len(sender.sent) == 3)
+        assert sender.sent == [3, 1, 2]
+        assert outbox.open_circuits() == 0
+    finally:
+        await outbox.close()
+
+
+@pytest.mark.asyncio
+async def test_restart_resends_waiting_deliveries_but_not_interrupted_posts(tmp_path):
+    path = tmp_path / "bot.db"
+    stuck = asyncio.Event()
+
+    async def post(payload):
+        if payload["n"] == 1:
+            raise ConnectionError("network down")
+        await stuck.wait()
+
+    async def report(payload):
+        await stuck.wait()
+
+    crashed = Outbox(path, base_delay=60)
+    crashed.register("post", post)
+    crashed.register("report", report)
+    crashed.start()
+    assert (await crashed.submit("post", "waiting", -200, {"chat_id": -200, "n": 1})).status == STATUS_PENDING
+    sending = [
+        asyncio.ensure_future(crashed.submit(kind, key, chat_id, {"chat_id": chat_id, "n": 0}))
+        for kind, key, chat_id in (("post", "mid-post", -300), ("report", "mid-report", -100))
+    ]
+    await asyncio.sleep(0.05)
+    # The bot dies while two sends are in flight
+    for task in sending:
+        task.cancel()
+    await asyncio.gather(*sending, return_exceptions=True)
+    await crashed.close()
+
+    sender = FlakySender()
+    # Late enough for the waiting post's retry to be due
+    restarted = Outbox(path, clock=lambda: time.time() + 120)
+    restarted.register("post", sender)
+    restarted.register("report", sender, resend_interrupted=True)
+    restarted.start()
+    try:
+        await wait_until(lambda: len(sender.sent) == 2)
+        assert sorted(sender.sent) == [0, 1] and -300 not in sender.attempts
+        post = await restarted.submit("post", "mid-post", -300, {"chat_id": -300, "n": 0})
+        assert post.status == STATUS_INTERRUPTED
+        assert len(sender.sent) == 2
+    finally:
+        await restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_approval_waits_out_a_channel_outage(fake_bot, tmp_path):
+    store = SubmissionStore(tmp_path / "bot.db")
+    loc = Localization(REPO_LOC_FILE)
+    outbox = Outbox(tmp_path / "bot.db", base_delay=0.01, max_delay=0.01)
+
+    async def publish(payload):
+        return await Broadcaster.send_to_output_channel(
+            fake_bot, Submission.from_dict(payload["submission"]), payload["subject"], CONFIG, loc,
+            payload["is_regular_user_post"],
+        )
+
+    outbox.register(PUBLISH, publish)
+    outbox.start()
+    moderation = ModerationService(store, CONFIG, loc, outbox=outbox)
+    try:
+        submission = Submission(chat_id=42, user_id=42, message_ids=(7,), message_type="text", text="hello")
+        pending = await store.create(submission, "موضوع", CONFIG["report_group_id"], "header")
+        fake_bot.fail.add("send_message")
+        assert await moderation.approve(fake_bot, pending.id, "ali", 7) is ModerationResult.RETRYING
+        assert await moderation.approve(fake_bot, pending.id, "reza", 8) is ModerationResult.NOT_FOUND
+
+        fake_bot.fail.clear()
+        await wait_until(lambda: outbox.sent == 1)
+        posts = [kwargs for method, kwargs in fake_bot.calls if kwargs.get("chat_id") == CONFIG["output_channel_id"]]
+        assert len(posts) > 1 and posts[-1]["text"].startswith("hello")
+        # Submitting the same approval again finds it already published
+        again = await outbox.submit(
+            PUBLISH, f"publish:{pending.id}", CONFIG["output_channel_id"],
+            publish_payload(submission, "موضوع", CONFIG["output_channel_id"], True),
+        )
+        assert again.status == STATUS_SENT and outbox.sent == 1
+    finally:
+        await outbox.close()
+        await store.close()
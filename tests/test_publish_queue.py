@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+from app.services.publish_queue import (
+    HOUR, STATUS_INTERRUPTED, PublishQueue, parse_quiet_hours,
+)
+from app.utils.submission import Submission
+
+class Clock:
+    def __init__(self, now: float = 1_700_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+class Publisher:
+    def __init__(self):
+        self.published = []
+        self.results = []
+
+    async def __call__(self, post) -> bool:
+        self.published.append(post.subject)
+        return self.results.pop(0) if self.results else True
+
+def text(subject: str) -> Submission:
+    return Submission(chat_id=1, user_id=1, message_ids=(1,), message_type="text", text=subject)
+
+async def fill(queue: PublishQueue, *subjects: str):
+    return [await queue.enqueue(text(subject), subject) for subject in subjects]
+
+@pytest.mark.asyncio
+async def test_publishes_in_order_with_spacing(tmp_path):
+    publisher = Publisher()
+    queue = PublishQueue(tmp_path / "bot.db", publisher, slot_spacing=0.05)
+    await fill(queue, "a", "b", "c")
+    queue.start()
+    await asyncio.sleep(0.02)
+    assert publisher.published == ["a"]
+    await asyncio.sleep(0.15)
+    assert publisher.published == ["a", "b", "c"]
+    assert len(queue) == 0
+    await queue.close()
+
+@pytest.mark.asyncio
+async def test_move_and_cancel(tmp_path):
+    queue = PublishQueue(tmp_path / "bot.db", Publisher())
+    a, b, c = await fill(queue, "a", "b", "c")
+    assert await queue.move(c.id, 0)
+    assert await queue.cancel(b.id)
+    assert not await queue.cancel(b.id)
+    assert await queue.move(c.id, 5)  # Past the end = last
+    d, = await fill(queue, "d")
+    assert [post.subject for post in queue.items()] == ["a", "c", "d"]
+    await queue.close()
+
+    # Order, moves and cancels survive a restart
+    queue = PublishQueue(tmp_path / "bot.db", Publisher())
+    assert [post.subject for post in queue.items()] == ["a", "c", "d"]
+    await queue.close()
+
+@pytest.mark.asyncio
+async def test_restart_never_republishes(tmp_path):
+    queue = PublishQueue(tmp_path / "bot.db", Publisher())
+    a, b = await fill(queue, "a", "b")
+    # Simulate a crash while "a" was being sent
+    queue._pop_head()
+    await queue.db.run(lambda connection: connection.execute(
+        "UPDATE publish_queue SET status = 'publishing' WHERE id = ?", (a.id,)
+    ))
+    await queue.db.run(lambda connection: connection.commit())
+    await queue.close()
+
+    queue = PublishQueue(tmp_path / "bot.db", Publisher())
+    assert [post.subject for post in queue.items()] == ["b"]
+    status = queue.db.connection.execute("SELECT status FROM publish_queue WHERE id = ?", (a.id,)).fetchone()[0]
+    assert status == STATUS_INTERRUPTED
+    await queue.close()
+
+@pytest.mark.asyncio
+async def test_failed_publish_is_retried_then_dropped(tmp_path):
+    publisher = Publisher()
+    publisher.results = [False, False, False]
+    queue = PublishQueue(tmp_path / "bot.db", publisher, slot_spacing=0.01, max_attempts=3)
+    await fill(queue, "a", "b")
+    queue.start()
+    await asyncio.sleep(0.15)
+    assert publisher.published == ["a", "a", "a", "b"]
+    await queue.close()
+
+@pytest.mark.asyncio
+async def test_schedule_respects_cap_and_quiet_hours(tmp_path):
+    clock = Clock(1_700_000_000.0 - 1_700_000_000.0 % 86400)  # Midnight UTC
+    queue = PublishQueue(
+        tmp_path / "bot.db", Publisher(), slot_spacing=600, per_hour=2,
+        quiet_hours=parse_quiet_hours("00:00-01:00"), clock=clock,
+    )
+    await fill(queue, "a", "b", "c", "d")
+    times = [at - clock.now for _, at in queue.schedule()]
+    # Nothing before 01:00, then 10 minutes apart, but no more than two in any hour
+    assert times == [HOUR, HOUR + 600, 2 * HOUR, 2 * HOUR + 600]
+    await queue.close()
+
+def test_quiet_hours_wrapping_midnight():
+    assert parse_quiet_hours("23:30-06:00") == (23 * HOUR + 1800, 6 * HOUR)
+    assert parse_quiet_hours("") is None
@@ -0,0 +1,75 @@
+import pytest
+from app.services.rate_limiter import GCRALimiter, SlidingWindowLimiter, create_rate_limiter
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.mark.parametrize("limiter_cls", [GCRALimiter, SlidingWindowLimiter])
+def test_limit_within_period(limiter_cls):
+    clock = FakeClock()
+    limiter = limiter_cls(clock=clock)
+    assert all(limiter.hit(1, 5, 60) for _ in range(5))
+    assert limiter.hit(1, 5, 60) is False
+    # Other users are unaffected
+    assert limiter.hit(2, 5, 60) is True
+
+@pytest.mark.parametrize("limiter_cls", [GCRALimiter, SlidingWindowLimiter])
+def test_recovers_after_period(limiter_cls):
+    clock = FakeClock()
+    limiter = limiter_cls(clock=clock)
+    for _ in range(5):
+        limiter.hit(1, 5, 60)
+    clock.now += 120
+    assert limiter.hit(1, 5, 60) is True
+
+def test_gcra_refills_gradually():
+    clock = FakeClock()
+    limiter = GCRALimiter(clock=clock)
+    for _ in range(5):
+        limiter.hit(1, 5, 60)
+    clock.now += 11
+    assert limiter.hit(1, 5, 60) is False
+    clock.now += 1
+    assert limiter.hit(1, 5, 60) is True
+    assert limiter.hit(1, 5, 60) is False
+
+def test_sliding_window_weights_previous_window():
+    clock = FakeClock(now=600.0)  # Start of a 60s window
+    limiter = SlidingWindowLimiter(clock=clock)
+    for _ in range(4):
+        assert limiter.hit(1, 4, 60)
+    # Halfway through the next window, half of the previous count still applies
+    clock.now = 690.0
+    assert limiter.hit(1, 4, 60) is True
+    assert limiter.hit(1, 4, 60) is True
+    assert limiter.hit(1, 4, 60) is False
+
+@pytest.mark.parametrize("limiter_cls", [GCRALimiter, SlidingWindowLimiter])
+def test_idle_keys_are_evicted(limiter_cls):
+    clock = FakeClock()
+    limiter = limiter_cls(clock=clock)
+    for user_id in range(100):
+        limiter.hit(user_id, 5, 60)
+    assert len(limiter) == 100
+
+    clock.now += 1000
+    # Lazy eviction trims a few idle keys per hit
+    limiter.hit("active", 5, 60)
+    assert len(limiter) < 100
+    assert limiter.sweep() > 0
+    assert len(limiter) == 1
+
+@pytest.mark.parametrize("limiter_cls", [GCRALimiter, SlidingWindowLimiter])
+def test_hard_cap_on_tracked_keys(limiter_cls):
+    limiter = limiter_cls(max_keys=10, clock=FakeClock())
+    for user_id in range(1000):
+        limiter.hit(user_id, 5, 60)
+    assert len(limiter) == 10
+
+def test_unknown_algorithm():
+    with pytest.raises(ValueError):
+        create_rate_limiter("leaky")
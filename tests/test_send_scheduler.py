@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetChatMember, SendMessage
+from app.services.send_scheduler import SendScheduler, low_priority
+
+CHANNEL_ID = -1001
+
+class FakeApi:
+    def __init__(self, flood_first: int = 0, retry_after: float = 0.1):
+        self.sent = []
+        self.flood_first = flood_first
+        self.retry_after = retry_after
+
+    async def __call__(self, bot, method):
+        if self.flood_first:
+            self.flood_first -= 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=self.retry_after)
+        self.sent.append((method.chat_id, getattr(method, "text", None), time.monotonic()))
+        return True
+
+def send(scheduler: SendScheduler, api: FakeApi, chat_id: int, text: str = "hi"):
+    return scheduler(api, None, SendMessage(chat_id=chat_id, text=text))
+
+@pytest.mark.asyncio
+async def test_channel_posts_before_logs():
+    scheduler = SendScheduler(global_rate=50, global_burst=1, high_priority_chats=(CHANNEL_ID,))
+    api = FakeApi()
+    await send(scheduler, api, 1, "warmup")  # Drains the global burst
+
+    async def log():
+        with low_priority():
+            await send(scheduler, api, -2, "log")
+
+    await asyncio.gather(log(), send(scheduler, api, 3, "reply"), send(scheduler, api, CHANNEL_ID, "post"))
+    assert [text for _, text, _ in api.sent] == ["warmup", "post", "reply", "log"]
+    await scheduler.close()
+
+@pytest.mark.asyncio
+async def test_per_chat_pacing():
+    scheduler = SendScheduler(private_rate=20, chat_burst=1)
+    api = FakeApi()
+    await asyncio.gather(*(send(scheduler, api, 1) for _ in range(3)), send(scheduler, api, 2))
+
+    times = [sent_at for chat_id, _, sent_at in api.sent if chat_id == 1]
+    assert times[-1] - times[0] >= 0.09
+    # Another chat is not held back by chat 1
+    assert api.sent[1][0] == 2
+    assert scheduler.stats()["sent"] == 4
+    assert scheduler.stats()["queue_depth"] == 0
+    await scheduler.close()
+
+@pytest.mark.asyncio
+async def test_retry_after_delays_instead_of_failing():
+    scheduler = SendScheduler()
+    api = FakeApi(flood_first=1, retry_after=0.1)
+    started = time.monotonic()
+    assert await send(scheduler, api, 1) is True
+    assert time.monotonic() - started >= 0.09
+    assert len(api.sent) == 1
+    assert scheduler.stats()["retries"] == 1
+    await scheduler.close()
+
+@pytest.mark.asyncio
+async def test_retry_keeps_its_place_in_the_chat():
+    scheduler = SendScheduler(private_rate=20, chat_burst=1)
+    api = FakeApi(flood_first=1, retry_after=0.01)
+    await asyncio.gather(*(send(scheduler, api, 1, text) for text in ("first", "second", "third")))
+    assert [text for _, text, _ in api.sent] == ["first", "second", "third"]
+    await scheduler.close()
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries():
+    scheduler = SendScheduler(max_retries=1)
+    api = FakeApi(flood_first=5, retry_after=0.01)
+    with pytest.raises(TelegramRetryAfter):
+        await send(scheduler, api, 1)
+    await scheduler.close()
+
+@pytest.mark.asyncio
+async def test_other_methods_are_not_queued():
+    scheduler = SendScheduler()
+
+    async def make_request(bot, method):
+        return "member"
+
+    assert await scheduler(make_request, None, GetChatMember(chat_id=CHANNEL_ID, user_id=1)) == "member"
+    assert scheduler.stats()["sent"] == 0
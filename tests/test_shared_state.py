@@ -0,0 +1,224 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.types import Message
+
+from app.services.fsm_storage import SharedStateStorage
+from app.services.media_groups import MediaGroupAggregator, SharedMediaGroups
+from app.services.rate_limiter import SharedRateLimiter
+from app.services.shared_state import MemoryState, RedisError, RedisState, SharedState
+from app.services.storage import StorageService
+from app.services.submission_store import STATUS_APPROVED, SharedSubmissionStore
+from app.utils.submission import Submission
+from loadtest.fake_redis import FakeRedisServer
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest_asyncio.fixture
+async def server():
+    server = FakeRedisServer(clock=Clock())
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def replicas(server):
+    """Two RedisState clients, as two replicas of the bot would have."""
+    clients = [RedisState(server.url, prefix="test:"), RedisState(server.url, prefix="test:")]
+    yield clients
+    for client in clients:
+        await client.close()
+
+
+@pytest_asyncio.fixture(params=["memory", "redis"])
+async def state(request, server):
+    if request.param == "memory":
+        yield MemoryState(clock=server.clock)
+        return
+    client = RedisState(server.url)
+    yield client
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_values_expire_and_only_if_absent(state, server):
+    assert await state.set("k", "v", ttl=10)
+    assert not await state.set("k", "w", ttl=10, only_if_absent=True)
+    assert await state.get("k") == "v"
+    server.clock.now += 11
+    assert await state.get("k") is None
+    assert await state.set("k", "w", only_if_absent=True)
+    assert await state.delete("k", "missing") == 1
+
+
+@pytest.mark.asyncio
+async def test_compare_and_set_only_replaces_the_value_that_was_read(state):
+    assert await state.compare_and_set("k", None, "1")
+    assert not await state.compare_and_set("k", None, "2")
+    assert not await state.compare_and_set("k", "0", "2")
+    assert await state.compare_and_set("k", "1", "2")
+    assert await state.get("k") == "2"
+
+
+@pytest.mark.asyncio
+async def test_push_and_take_all(state, server):
+    await state.set("lock", "me")
+    assert await state.push("list", ["a", "b"], ttl=10) == 2
+    assert await state.push("list", ["c"], ttl=10) == 3
+    assert await state.take_all("list", "lock") == ["a", "b", "c"]
+    assert await state.take_all("list") == []
+    assert await state.get("lock") is None
+
+    # Once taken with a mark, pushes that check for it are refused until it expires
+    assert await state.push("album", ["a"], ttl=10, unless="album:done") == 1
+    assert await state.take_all("album", mark="album:done", ttl=10) == ["a"]
+    assert await state.push("album", ["b"], ttl=10, unless="album:done") == 0
+    assert await state.take_all("album") == []
+    server.clock.now += 11
+    assert await state.push("album", ["c"], ttl=10, unless="album:done") == 1
+
+
+@pytest.mark.asyncio
+async def test_set_members(state):
+    assert await state.add_members("ids", "a", "b") == 2
+    assert await state.add_members("ids", "b", "c") == 1
+    assert await state.remove_members("ids", "a", "missing") == 1
+    assert await state.members("ids") == {"b", "c"}
+    assert await state.remove_members("ids", "b", "c") == 2
+    assert await state.members("ids") == set() and await state.members("missing") == set()
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_is_shared_between_replicas(replicas, server):
+    first, second = replicas
+    # Five per hour in total, whichever replica the requests reach
+    results = [await (first if i % 2 else second).hit("user:1", 5, 3600) for i in range(6)]
+    assert results == [True] * 5 + [False]
+    server.clock.now += 720
+    assert await first.hit("user:1", 5, 3600)
+    # The script is sent once; after that only its hash
+    assert server.commands["EVAL"] == 1
+
+
+@pytest.mark.asyncio
+async def test_unreachable_server_fails_open(server):
+    client = RedisState(server.url, timeout=0.5)
+    await server.close()
+    with pytest.raises(RedisError):
+        await client.get("k")
+    assert await SharedRateLimiter(client).hit(1, 1, 3600)
+
+
+@pytest.mark.asyncio
+async def test_fsm_conversation_continues_on_another_replica(replicas):
+    key = StorageKey(bot_id=1, chat_id=42, user_id=42)
+    first, second = SharedStateStorage(replicas[0]), SharedStateStorage(replicas[1])
+    await first.set_state(key, "UserSubmission:awaiting_content")
+    await first.update_data(key, {"subject": "موضوع"})
+    assert await second.get_state(key) == "UserSubmission:awaiting_content"
+    assert await second.get_data(key) == {"subject": "موضوع"}
+    await second.set_state(key, None)
+    await second.set_data(key, {})
+    assert await first.get_state(key) is None and await first.get_data(key) == {}
+
+
+def album_item(message_id: int) -> Message:
+    return Message.model_validate({
+        "message_id": message_id, "date": 0, "media_group_id": "g1",
+        "chat": {"id": 42, "type": "private"},
+        "from": {"id": 42, "is_bot": False, "first_name": "User"},
+        "photo": [{"file_id": f"f{message_id}", "file_unique_id": f"u{message_id}", "width": 1, "height": 1}],
+    })
+
+
+@pytest.mark.asyncio
+async def test_album_split_across_replicas_is_processed_once(replicas):
+    albums = []
+
+    async def on_complete(messages):
+        albums.append([message.message_id for message in messages])
+
+    first, second = (
+        SharedMediaGroups(MediaGroupAggregator(min_gap=0.01, max_gap=0.05), state, settle=0.2) for state in replicas
+    )
+    for message_id in (1, 3):
+        first.add(album_item(message_id), on_complete)
+    for message_id in (2, 4):
+        second.add(album_item(message_id), on_complete)
+    await asyncio.sleep(0.4)
+    assert albums == [[1, 2, 3, 4]]
+
+    # A straggler reaching a replica that never saw the album doesn't start a new one
+    third = SharedMediaGroups(MediaGroupAggregator(min_gap=0.01, max_gap=0.05), replicas[1], settle=0.2)
+    third.add(album_item(5), on_complete)
+    await asyncio.sleep(0.4)
+    assert albums == [[1, 2, 3, 4]] and third.late == 1
+
+
+@pytest.mark.asyncio
+async def test_admin_list_syncs_between_replicas(tmp_path, replicas):
+    first = StorageService(tmp_path / "a.json", shared=replicas[0])
+    second = StorageService(tmp_path / "b.json", shared=replicas[1])
+    await first.add_admin(7, "sara")
+    await second.sync_shared()
+    assert second.get_admin(7) == {"id": 7, "alias": "sara"}
+    # The local file follows, for restarts
+    assert json.loads((tmp_path / "b.json").read_text())["admins"] == [{"id": 7, "alias": "sara"}]
+
+    await second.remove_admin(7)
+    await first.sync_shared()
+    assert first.get_admin(7) is None
+
+    # Added on both replicas before either synced: neither change overwrites the other
+    await first.add_admin(8, "reza")
+    await second.add_admin(9, "mina")
+    await first.sync_shared()
+    await second.sync_shared()
+    assert sorted(admin["id"] for admin in await first.get_admins()) == [8, 9]
+    assert sorted(admin["id"] for admin in await second.get_admins()) == [8, 9]
+    await first.close()
+    await second.close()
+
+
+@pytest.mark.asyncio
+async def test_submission_reported_on_one_replica_is_moderated_on_another(replicas):
+    reporter, moderator = (SharedSubmissionStore(client) for client in replicas)
+    submission = Submission(chat_id=5, user_id=5, message_ids=(1,), message_type="text", text="hello")
+    first = await reporter.create(submission, "s", -100)
+    second = await reporter.create(submission, "s", -100)
+    await reporter.set_report_messages(first.id, [10, 11])
+
+    claimed = await moderator.acquire(first.id)
+    assert claimed.report_message_ids == [10, 11]
+    # The claim holds on every replica
+    assert await reporter.acquire(first.id) is None
+    await moderator.release(claimed)
+    claimed = await reporter.acquire(first.id)
+    await reporter.resolve(claimed, STATUS_APPROVED)
+
+    # Indexed before it was resolved elsewhere, and still not handled twice
+    assert await moderator.acquire(first.id) is None
+    await reporter.set_report_messages(first.id, [12])
+    assert await moderator.fetch(first.id) is None
+    await moderator.refresh()
+    assert [pending.id for pending in moderator.pending()] == [second.id]
+
+
+def test_shared_state_backends_must_implement_every_operation():
+    class Partial(SharedState):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
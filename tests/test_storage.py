@@ -1,14 +1,20 @@
-import pytest
+import asyncio
 import json
+import os
+import time
+
+import pytest
 from pathlib import Path
 from app.services.storage import StorageService
 
+
 @pytest.fixture
 def temp_storage_file(tmp_path: Path) -> Path:
     d = tmp_path / "data"
     d.mkdir()
     return d / "test_admins.json"
 
+
 @pytest.mark.asyncio
 async def test_add_admin(temp_storage_file: Path):
     storage = StorageService(temp_storage_file)
@@ -18,6 +24,7 @@ async def test_add_admin(temp_storage_file: Path):
     assert admins[0]["id"] == 123
     assert admins[0]["alias"] == "test_user"
 
+
 @pytest.mark.asyncio
 async def test_remove_admin(temp_storage_file: Path):
     storage = StorageService(temp_storage_file)
@@ -34,6 +41,7 @@ async def test_remove_admin(temp_storage_file: Path):
     not_removed = await storage.remove_admin(999)
     assert not_removed is False
 
+
 @pytest.mark.asyncio
 async def test_backup_rotation(temp_storage_file: Path):
     storage = StorageService(temp_storage_file, backup_count=2)
@@ -57,4 +65,125 @@ async def test_backup_rotation(temp_storage_file: Path):
     # check content of backup 2
     with open(temp_storage_file.with_suffix(".bak2"), 'r') as f:
         data = json.load(f)
-        assert len(data['admins']) == 1
\ No newline at end of file
+        assert len(data['admins']) == 1
+
+
+@pytest.mark.asyncio
+async def test_get_admin_uses_memory(temp_storage_file: Path):
+    storage = StorageService(temp_storage_file)
+    await storage.add_admin(123, "test_user")
+
+    # Lookups are answered from memory, even if the file disappears
+    temp_storage_file.unlink()
+    assert storage.get_admin(123) == {"id": 123, "alias": "test_user"}
+    assert storage.get_admin(456) is None
+
+
+@pytest.mark.asyncio
+async def test_reload_external_edit(temp_storage_file: Path):
+    storage = StorageService(temp_storage_file)
+    await storage.add_admin(123, "test_user")
+    assert storage.reload_if_changed() is False
+
+    with open(temp_storage_file, 'w') as f:
+        json.dump({"admins": [{"id": 456, "alias": "edited"}]}, f)
+    stat = temp_storage_file.stat()
+    os.utime(temp_storage_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert storage.reload_if_changed() is True
+    assert storage.get_admin(123) is None
+    assert storage.get_admin(456)["alias"] == "edited"
+
+    # A malformed edit keeps the current registry
+    temp_storage_file.write_text("{not json")
+    os.utime(temp_storage_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000))
+    assert storage.reload_if_changed() is False
+    assert storage.get_admin(456)["alias"] == "edited"
+
+
+def slow_writes(storage: StorageService, delay: float) -> list:
+    """Makes every file write take `delay` seconds on the writer thread; returns the list of written snapshots."""
+    writes = []
+    write_file = storage._write_file
+
+    def slow_write_file(admins):
+        time.sleep(delay)
+        writes.append(admins)
+        return write_file(admins)
+
+    storage._write_file = slow_write_file
+    return writes
+
+
+async def max_loop_lag(coro, tick: float = 0.005) -> float:
+    """Runs coro while measuring the longest the event loop went without running a 5 ms timer."""
+    lag = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(tick)
+            lag = max(lag, time.perf_counter() - start - tick)
+
+    task = asyncio.create_task(ticker())
+    try:
+        await coro
+    finally:
+        done = True
+        await task
+    return lag
+
+
+@pytest.mark.asyncio
+async def test_slow_disk_does_not_block_event_loop(temp_storage_file: Path, monkeypatch):
+    storage = StorageService(temp_storage_file)
+    real_fsync = os.fsync
+
+    def slow_fsync(fd):
+        # A congested volume: every fsync takes 100 ms
+        time.sleep(0.1)
+        real_fsync(fd)
+
+    monkeypatch.setattr("app.services.storage.os.fsync", slow_fsync)
+    start = time.perf_counter()
+    lag = await max_loop_lag(storage.add_admin(123, "test_user"))
+    assert time.perf_counter() - start >= 0.2
+    assert lag < 0.05
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_changes_are_group_committed(temp_storage_file: Path):
+    storage = StorageService(temp_storage_file)
+    writes = slow_writes(storage, 0.05)
+
+    await asyncio.gather(*(storage.add_admin(i, f"user{i}") for i in range(1, 21)), storage.remove_admin(1))
+    # The first change is written alone; everything made meanwhile shares the second write
+    assert len(writes) == 2
+    with open(temp_storage_file, "r") as f:
+        assert {admin["id"] for admin in json.load(f)["admins"]} == set(range(2, 21))
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_write_rolls_back_and_keeps_the_file(temp_storage_file: Path, monkeypatch):
+    storage = StorageService(temp_storage_file)
+    await storage.add_admin(1, "kept")
+
+    def failing_fsync(fd):
+        raise OSError("disk full")
+
+    monkeypatch.setattr("app.services.storage.os.fsync", failing_fsync)
+    with pytest.raises(OSError):
+        await storage.add_admin(2, "lost")
+    assert storage.get_admin(2) is None
+    # The rename never happened, so the file still holds the last good registry
+    with open(temp_storage_file, "r") as f:
+        assert json.load(f)["admins"] == [{"id": 1, "alias": "kept"}]
+
+    monkeypatch.undo()
+    await storage.add_admin(3, "next")
+    assert storage.get_admin(1) and storage.get_admin(3) and storage.get_admin(2) is None
+    await storage.close()
@@ -0,0 +1,59 @@
+import json
+
+from aiogram.types import InputMediaPhoto, Message
+from app.utils.message_helpers import convert_messages_to_input_media
+from app.utils.submission import Submission
+
+def photo_message(message_id: int, caption: str = None) -> Message:
+    return Message.model_validate({
+        "message_id": message_id,
+        "date": 1700000000,
+        "chat": {"id": 42, "type": "private"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+        "media_group_id": "album",
+        "photo": [
+            {"file_id": f"small-{message_id}", "file_unique_id": f"s{message_id}", "width": 90, "height": 90},
+            {"file_id": f"large-{message_id}", "file_unique_id": f"l{message_id}", "width": 900, "height": 900},
+        ],
+        "caption": caption,
+        "caption_entities": [{"type": "bold", "offset": 0, "length": 4}] if caption else None,
+    })
+
+def test_album_round_trip():
+    submission = Submission.from_messages([photo_message(1, "bold caption"), photo_message(2)])
+    assert submission.is_album
+    assert submission.message_type == "album"
+    assert [item.file_id for item in submission.media] == ["large-1", "large-2"]
+
+    restored = Submission.from_dict(json.loads(json.dumps(submission.to_dict())))
+    assert restored == submission
+    assert restored.entity_objects()[0].type == "bold"
+
+def test_text_submission():
+    message = Message.model_validate({
+        "message_id": 5,
+        "date": 1700000000,
+        "chat": {"id": 42, "type": "private"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+        "text": "hello",
+    })
+    submission = Submission.from_messages([message])
+    assert not submission.is_album
+    assert submission.message_type == "text"
+    assert submission.to_dict() == {
+        "chat_id": 42, "user_id": 42, "message_ids": [5], "message_type": "text", "text": "hello"
+    }
+
+def test_convert_to_input_media():
+    submission = Submission.from_messages([photo_message(1, "bold caption"), photo_message(2)])
+    media = convert_messages_to_input_media(submission, "final", submission.entity_objects())
+    assert [type(item) for item in media] == [InputMediaPhoto, InputMediaPhoto]
+    assert media[0].caption == "final"
+    assert media[0].caption_entities[0].type == "bold"
+    assert media[1].caption is None
+
+def test_plain_album_caption_is_not_parsed_as_html():
+    submission = Submission.from_messages([photo_message(1), photo_message(2)])
+    media = convert_messages_to_input_media(submission, "a < b & c")
+    assert media[0].caption == "a < b & c"
+    assert media[0].parse_mode is None
@@ -0,0 +1,93 @@
+import pytest
+from app.keyboards.inline import get_approval_keyboard
+from app.services.submission_store import STATUS_APPROVED, SubmissionStore
+from app.utils.submission import MediaItem, Submission
+
+def make_submission(user_id: int = 42) -> Submission:
+    return Submission(
+        chat_id=user_id,
+        user_id=user_id,
+        message_ids=(1, 2),
+        message_type="album",
+        media=(MediaItem("photo", "f1", "u1", 1), MediaItem("photo", "f2", "u2", 2)),
+        caption="hello",
+    )
+
+@pytest.mark.asyncio
+async def test_create_claim_and_resolve(tmp_path):
+    store = SubmissionStore(tmp_path / "bot.db")
+    pending = await store.create(make_submission(), "موضوع", -100)
+    await store.set_report_messages(pending.id, [10, 11, 12])
+    assert store.get(pending.id).report_message_ids == [10, 11, 12]
+
+    claimed = store.claim(pending.id)
+    assert claimed is pending
+    # A second click on the same button finds nothing
+    assert store.claim(pending.id) is None
+
+    await store.release(claimed)
+    assert store.claim(pending.id) is pending
+    await store.resolve(pending, STATUS_APPROVED)
+    assert len(store) == 0
+    await store.close()
+
+@pytest.mark.asyncio
+async def test_pending_survives_restart(tmp_path):
+    store = SubmissionStore(tmp_path / "bot.db")
+    kept = await store.create(make_submission(1), "a", -100)
+    await store.set_report_messages(kept.id, [5, 6])
+    done = await store.create(make_submission(2), "b", -100)
+    await store.resolve(store.claim(done.id), STATUS_APPROVED)
+    await store.close()
+
+    store = SubmissionStore(tmp_path / "bot.db")
+    assert [pending.id for pending in store.pending()] == [kept.id]
+    restored = store.get(kept.id)
+    assert restored.submission == make_submission(1)
+    assert restored.report_message_ids == [5, 6]
+    assert restored.subject == "a"
+    await store.close()
+
+@pytest.mark.asyncio
+async def test_callback_data_fits_with_long_subject(tmp_path):
+    store = SubmissionStore(tmp_path / "bot.db")
+    pending = await store.create(make_submission(), "موضوع " * 100, -100)
+    keyboard = get_approval_keyboard(pending.id)
+    for row in keyboard.inline_keyboard:
+        for button in row:
+            assert len(button.callback_data.encode()) <= 64
+    await store.close()
+
+@pytest.mark.asyncio
+async def test_select_by_submitter_and_age(tmp_path):
+    store = SubmissionStore(tmp_path / "bot.db")
+    first = await store.create(make_submission(1), "a", -100)
+    second = await store.create(make_submission(2), "b", -100)
+    first.created_at -= 3600
+
+    assert store.select(submitter_id=2) == [second]
+    assert store.select(created_before=second.created_at - 60) == [first]
+    assert store.select() == [first, second]
+
+    await store.resolve_many([first, second], STATUS_APPROVED)
+    await store.close()
+    store = SubmissionStore(tmp_path / "bot.db")
+    assert len(store) == 0
+    await store.close()
+
+@pytest.mark.asyncio
+async def test_resolved_submissions_are_pruned_after_the_retention_period(tmp_path):
+    now = [1000.0]
+    store = SubmissionStore(tmp_path / "bot.db", retention=100, clock=lambda: now[0])
+    kept = await store.create(make_submission(1), "a", -100)
+    old = await store.create(make_submission(2), "b", -100)
+    await store.resolve(store.claim(old.id), STATUS_APPROVED)
+    assert await store.prune() == 0
+
+    # Still pending, however old: only resolved rows are swept
+    now[0] += 101
+    await store.close()
+    store = SubmissionStore(tmp_path / "bot.db", retention=100, clock=lambda: now[0])
+    rows = store.db.connection.execute("SELECT id FROM submissions").fetchall()
+    assert rows == [(kept.id,)] and store.get(kept.id) is not None
+    await store.close()
@@ -0,0 +1,189 @@
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.types import Update
+
+from app.middlewares.tenant import TenantMiddleware
+from app.middlewares.throttling import ThrottlingMiddleware
+from app.services.config import ConfigError, parse_config
+from app.services.localization import Localization
+from app.services.moderation import ModerationService
+from app.services.rate_limiter import create_rate_limiter
+from app.services.storage import StorageService
+from app.services.submission_store import SubmissionStore
+from app.services.tenants import TenantRegistry
+from app.utils.submission import Submission
+
+REPO_LOC_FILE = Path(__file__).parent.parent / "fa.json"
+
+DATA = {
+    "owner_id": 1,
+    "report_group_id": -100,
+    "output_channel_id": -200,
+    "required_channel_id": -200,
+    "rate_limit": {"limit": 5, "period": 3600},
+    "tenants": [
+        {
+            "name": "news",
+            "report_group_id": -101,
+            "output_channel_id": -201,
+            "required_channel_id": -201,
+            "footer": "\n{subject} @news",
+            "rate_limit": {"limit": 1},
+        },
+    ],
+}
+
+
+BOT_ID = 99
+
+
+class RecordingBot:
+    """Collects the requests the middleware makes through a bot-bound update."""
+
+    id = BOT_ID
+
+    def __init__(self):
+        self.requests = []
+
+    async def __call__(self, method, request_timeout=None):
+        self.requests.append(method)
+
+
+def update(text: str = "hello", user_id: int = 42, bot: RecordingBot = None) -> Update:
+    return Update.model_validate({
+        "update_id": 1,
+        "message": {
+            "message_id": 1, "date": 0, "text": text,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+        },
+    }, context={"bot": bot})
+
+
+@pytest_asyncio.fixture
+async def registry(tmp_path):
+    (tmp_path / "admins-news.json").write_text(json.dumps({"admins": [{"id": 7, "alias": "sara"}]}))
+    default_storage = StorageService(tmp_path / "admins.json")
+    registry = TenantRegistry(tmp_path, default_storage)
+    registry.open(parse_config(DATA))
+    yield registry
+    await registry.close()
+    await default_storage.close()
+
+
+def test_tenants_are_indexed_by_name_and_chat():
+    config = parse_config(DATA)
+    news = config.tenant("news")
+    assert news.report_group_id == -101 and news.owner_id == 1
+    assert news["footer"] == "\n{subject} @news"
+    assert news.rate_limit.limit == 1 and news.rate_limit.period == 3600
+    assert config.tenant_for_chat(-101) is news
+    assert config.tenant_for_chat(-200) is config
+    assert config.tenant_for_chat(42) is None
+
+
+def test_tenants_cannot_share_a_report_group():
+    data = {**DATA, "tenants": [*DATA["tenants"], {**DATA["tenants"][0], "name": "sport"}]}
+    with pytest.raises(ConfigError, match="already belongs to tenant 'news'"):
+        parse_config(data)
+
+
+@pytest.mark.asyncio
+async def test_registry_resolves_chat_deep_link_and_default(registry):
+    config = parse_config(DATA)
+    assert (await registry.resolve(config, BOT_ID, -101, 42)).name == "news"
+    assert (await registry.resolve(config, BOT_ID, -300, 42)).name == "default"
+    # A private chat has no tenant until the user chooses one
+    assert await registry.resolve(config, BOT_ID, 42, 42) is None
+    await registry.select(BOT_ID, 42, "news")
+    assert (await registry.resolve(config, BOT_ID, 42, 42)).name == "news"
+    # Kept apart from the conversation state, which handlers clear after every submission
+    assert await registry.selections.get_data(StorageKey(BOT_ID, 42, 42)) == {}
+    # A choice naming a tenant that a reload removed counts as no choice
+    assert await registry.resolve(parse_config({**DATA, "tenants": []}), BOT_ID, 42, 42) is None
+    # Each tenant has its own admins
+    assert registry.storage(config.tenant("news")).get_admin(7) is not None
+    assert registry.storage(config).get_admin(7) is None
+
+
+@pytest.mark.asyncio
+async def test_middleware_scopes_update_to_tenant(registry):
+    config = parse_config(DATA)
+    middleware = TenantMiddleware(registry)
+    bot = RecordingBot()
+    loc = Localization(REPO_LOC_FILE)
+    seen = {}
+
+    def data(user_id: int = 42):
+        user = SimpleNamespace(id=user_id)
+        return {"config": config, "event_from_user": user, "event_chat": user, "bot": bot, "loc": loc}
+
+    async def handler(event, data):
+        seen.update(data)
+
+    # The deep link selects the tenant for this update and the ones after it
+    await middleware(handler, update("/start news", bot=bot), data())
+    assert seen["tenant"] == "news" and seen["config"].output_channel_id == -201
+    assert seen["storage_service"].get_admin(7) is not None
+
+    seen.clear()
+    await middleware(handler, update(bot=bot), data())
+    assert seen["tenant"] == "news"
+
+    # Unknown deep-link payloads are ignored; /start still gets its menu
+    seen.clear()
+    await middleware(handler, update("/start nope", 5, bot), data(5))
+    assert seen["tenant"] == "default"
+
+    # Without a choice, a submission is not silently given to the default tenant
+    seen.clear()
+    await middleware(handler, update("my post", 5, bot), data(5))
+    assert seen == {}
+    [request] = bot.requests
+    assert request.text == loc["choose_tenant"]
+    assert [row[0].callback_data for row in request.reply_markup.inline_keyboard] == ["tenant:default", "tenant:news"]
+
+
+@pytest.mark.asyncio
+async def test_throttling_counts_per_tenant():
+    config = parse_config(DATA)
+    answers = []
+
+    async def answer(text):
+        answers.append(text)
+
+    event = SimpleNamespace(from_user=SimpleNamespace(id=42), answer=answer)
+    loc = SimpleNamespace(get=lambda key, default: key)
+    throttling = ThrottlingMiddleware(create_rate_limiter("gcra", clock=lambda: 100.0), limit=5, period=3600, loc=loc)
+    handled = []
+
+    async def handler(event, data):
+        handled.append(data["tenant"])
+
+    news = {"tenant": "news", "config": config.tenant("news"), "user_role": "user"}
+    await throttling(handler, event, dict(news))
+    await throttling(handler, event, dict(news))
+    # The news tenant allows one submission; the default tenant's budget is untouched
+    await throttling(handler, event, {"tenant": "default", "config": config, "user_role": "user"})
+    assert handled == ["news", "default"] and answers == ["rate_limit_exceeded"]
+
+
+@pytest.mark.asyncio
+async def test_moderation_publishes_to_tenant_channel(tmp_path, fake_bot):
+    config = parse_config(DATA)
+    store = SubmissionStore(tmp_path / "bot.db")
+    moderation = ModerationService(store, config, Localization(REPO_LOC_FILE))
+    submission = Submission(chat_id=42, user_id=42, message_ids=(7,), message_type="text", text="hello")
+    pending = await store.create(submission, "موضوع", -101, "header")
+
+    await moderation.approve(fake_bot, pending.id, "sara", 7)
+    sent = [kwargs for method, kwargs in fake_bot.calls if method == "send_message"]
+    assert sent[0]["chat_id"] == -201 and sent[0]["text"] == "hello\nموضوع @news\n#ارسالی"
+    # The log goes to the tenant's report group
+    assert sent[1]["chat_id"] == -101
+    await store.close()
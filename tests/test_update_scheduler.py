@@ -0,0 +1,164 @@
+import asyncio
+import random
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message, Update
+
+from app.middlewares.scheduler import SchedulerMiddleware
+from app.services.metrics import Metrics
+from app.services.update_scheduler import UpdateScheduler
+
+
+@pytest.mark.asyncio
+async def test_runs_each_key_in_order_within_the_concurrency_limit():
+    scheduler = UpdateScheduler(max_concurrent=4)
+    handled = {}
+    running = 0
+    peak = 0
+
+    def job(key, number):
+        async def run():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(random.random() / 200)
+            handled.setdefault(key, []).append(number)
+            running -= 1
+        return run
+
+    for number in range(100):
+        assert await scheduler.submit(job(number % 7, number), number % 7)
+    await scheduler.close()
+
+    assert sum(len(numbers) for numbers in handled.values()) == 100
+    assert all(numbers == sorted(numbers) for numbers in handled.values())
+    assert 1 < peak <= 4
+    assert scheduler.stats()["started"] == 100 and scheduler.pending == 0
+
+
+def gated(gate: asyncio.Event, order: list, name: str):
+    async def run():
+        await gate.wait()
+        order.append(name)
+    return run
+
+
+@pytest.mark.asyncio
+async def test_sheds_regular_users_but_makes_staff_wait():
+    scheduler = UpdateScheduler(max_concurrent=1, max_pending=2, max_pending_per_key=2)
+    gate = asyncio.Event()
+    order = []
+
+    assert await scheduler.submit(gated(gate, order, "running"), "user")
+    assert await scheduler.submit(gated(gate, order, "user-1"), "user")
+    assert await scheduler.submit(gated(gate, order, "other-1"), "other")
+    # Full: a regular user's update is dropped right away, an admin's waits for room
+    assert not await scheduler.submit(gated(gate, order, "user-2"), "user")
+    assert scheduler.shed == 1
+    staff = asyncio.ensure_future(scheduler.submit(gated(gate, order, "admin"), "admin", priority=True))
+    await asyncio.sleep(0.01)
+    assert not staff.done()
+
+    gate.set()
+    assert await staff
+    await scheduler.close()
+    assert sorted(order) == ["admin", "other-1", "running", "user-1"]
+    assert not await scheduler.submit(gated(gate, order, "late"), "user")
+
+
+@pytest.mark.asyncio
+async def test_staff_updates_go_first():
+    scheduler = UpdateScheduler(max_concurrent=1)
+    gate = asyncio.Event()
+    order = []
+    for name, key, priority in (
+        ("running", "user", False), ("user-1", "user", False), ("other-1", "other", False), ("admin", "admin", True),
+    ):
+        await scheduler.submit(gated(gate, order, name), key, priority)
+    gate.set()
+    await scheduler.close()
+    assert order[:2] == ["running", "admin"]
+
+
+@pytest.mark.asyncio
+async def test_a_user_promoted_to_staff_leaves_the_regular_turn_order():
+    scheduler = UpdateScheduler(max_concurrent=1)
+    gate = asyncio.Event()
+    order = []
+    for name, key, priority in (
+        ("running", "busy", False), ("user-1", "user", False), ("other-1", "other", False), ("admin", "user", True),
+    ):
+        await scheduler.submit(gated(gate, order, name), key, priority)
+    assert list(scheduler._ready) == ["other"] and list(scheduler._ready_priority) == ["user"]
+    gate.set()
+    await scheduler.close()
+    assert order == ["running", "user-1", "admin", "other-1"]
+
+
+@pytest.mark.asyncio
+async def test_run_waits_for_the_job_and_passes_on_its_outcome():
+    scheduler = UpdateScheduler(max_concurrent=1, max_pending=1)
+    gate = asyncio.Event()
+
+    async def fail():
+        raise ValueError("handler failed")
+
+    async def answer():
+        return 42
+
+    blocked = asyncio.ensure_future(scheduler.run(gated(gate, [], "running"), "a"))
+    waiting = asyncio.ensure_future(scheduler.run(answer, "b"))
+    await asyncio.sleep(0.01)
+    assert not waiting.done()
+    # Full: shed
+    assert await scheduler.run(answer, "c") is None
+    gate.set()
+    assert await waiting == 42
+    await blocked
+    with pytest.raises(ValueError):
+        await scheduler.run(fail, "a")
+    await scheduler.close()
+
+
+def private_update(update_id: int, user_id: int, text: str) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": text,
+            "chat": {"id": user_id, "type": "private"}, "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+        },
+    })
+
+
+@pytest.mark.asyncio
+async def test_middleware_orders_a_users_updates_and_records_queue_wait():
+    metrics = Metrics()
+    scheduler = UpdateScheduler(max_concurrent=10, metrics=metrics)
+    router = Router()
+    seen = []
+
+    @router.message()
+    async def on_message(message: Message):
+        # The first step is slow; the second must still come after it
+        await asyncio.sleep(0.05 if message.text == "subject" else 0)
+        seen.append((message.from_user.id, message.text))
+
+    dp = Dispatcher()
+    dp.update.outer_middleware(SchedulerMiddleware(scheduler, is_priority=lambda user_id: user_id == 1))
+    dp.include_router(router)
+    bot = Bot(token="42:TEST")
+
+    await asyncio.gather(*(
+        dp.feed_update(bot, private_update(update_id, user_id, text))
+        for update_id, user_id, text in ((1, 5, "subject"), (2, 5, "content"), (3, 1, "admin"))
+    ))
+    # feed_update returned only once its update was handled
+    assert len(seen) == 3 and scheduler.running == 0
+
+    assert [text for user_id, text in seen if user_id == 5] == ["subject", "content"]
+    assert seen[0] == (1, "admin")
+    text = metrics.render()
+    assert 'bot_update_queue_wait_seconds_count{priority="normal"} 2' in text
+    assert 'bot_update_queue_wait_seconds_count{priority="high"} 1' in text
+    await bot.session.close()
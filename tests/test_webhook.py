@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from app.services.webhook import create_webhook_app
+
+# A recorded private-chat text update, as Telegram would POST it
+RECORDED_UPDATE = {
+    "update_id": 1001,
+    "message": {
+        "message_id": 7,
+        "date": 1700000000,
+        "chat": {"id": 42, "type": "private", "first_name": "Test"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+        "text": "hello",
+    },
+}
+
+WEBHOOK_CONFIG = {"path": "/webhook", "secret_token": "s3cret", "max_concurrent_updates": 2}
+
+def make_dispatcher(received: list, release: asyncio.Event) -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def on_message(message: Message):
+        received.append(message.text)
+        await release.wait()
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+@pytest.mark.asyncio
+async def test_webhook_acknowledges_and_handles_in_background():
+    received, release = [], asyncio.Event()
+    bot = Bot(token="42:TEST")
+    app = create_webhook_app(make_dispatcher(received, release), bot, WEBHOOK_CONFIG)
+
+    async with TestClient(TestServer(app)) as client:
+        headers = {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+        response = await client.post("/webhook", json=RECORDED_UPDATE, headers=headers)
+        # Answered while the handler is still running
+        assert response.status == 200
+        await asyncio.sleep(0.05)
+        assert received == ["hello"]
+
+        health = await (await client.get("/healthz")).json()
+        assert health["status"] == "ok"
+        assert health["in_flight"] == 1
+
+        release.set()
+        await asyncio.sleep(0.05)
+        health = await (await client.get("/healthz")).json()
+        assert health["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_webhook_rejects_wrong_secret():
+    bot = Bot(token="42:TEST")
+    app = create_webhook_app(make_dispatcher([], asyncio.Event()), bot, WEBHOOK_CONFIG)
+
+    async with TestClient(TestServer(app)) as client:
+        response = await client.post("/webhook", json=RECORDED_UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": "nope"})
+        assert response.status == 401
+
+@pytest.mark.asyncio
+async def test_webhook_bounds_concurrent_updates():
+    received, release = [], asyncio.Event()
+    bot = Bot(token="42:TEST")
+    app = create_webhook_app(make_dispatcher(received, release), bot, WEBHOOK_CONFIG)
+
+    async with TestClient(TestServer(app)) as client:
+        headers = {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+        requests = [
+            asyncio.create_task(client.post("/webhook", json={**RECORDED_UPDATE, "update_id": 1001 + i}, headers=headers))
+            for i in range(3)
+        ]
+        await asyncio.sleep(0.1)
+        # Two slots are taken; the third request waits for one to free up
+        assert len(received) == 2
+        assert sum(task.done() for task in requests) == 2
+
+        release.set()
+        await asyncio.gather(*requests)
+        await asyncio.sleep(0.05)
+        assert len(received) == 3
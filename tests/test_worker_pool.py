@@ -0,0 +1,147 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.metrics import Metrics
+from app.services.submission_store import SubmissionStore
+from app.services.worker_pool import HashRing, UpdateRouter, WorkerPool, consume_updates, shard_key
+from app.utils.submission import Submission
+
+
+def private_message(update_id: int, user_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": "hi",
+            "chat": {"id": user_id, "type": "private"}, "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+        },
+    }
+
+
+def text_submission(user_id: int, text: str) -> Submission:
+    return Submission(chat_id=user_id, user_id=user_id, message_ids=(1,), message_type="text", text=text)
+
+
+def test_hash_ring_moves_only_the_keys_of_an_added_node():
+    before = HashRing(range(1, 4))
+    after = HashRing(range(1, 5))
+    keys = range(10_000)
+    moved = [key for key in keys if before.node_for(key) != after.node_for(key)]
+    # Roughly a quarter of the keys go to the new node, and only there
+    assert all(after.node_for(key) == 4 for key in moved)
+    assert 1500 < len(moved) < 3500
+    counts = [sum(after.node_for(key) == node for key in keys) for node in range(1, 5)]
+    assert min(counts) > 1500
+
+
+def test_router_keeps_groups_and_staff_on_worker_zero():
+    router = UpdateRouter(4, is_staff=lambda user_id: user_id == 42)
+    group_update = {"update_id": 1, "callback_query": {
+        "id": "1", "data": "approve:x", "from": {"id": 7, "is_bot": False, "first_name": "m"},
+        "message": {"message_id": 5, "date": 0, "chat": {"id": -100123, "type": "supergroup"}},
+    }}
+    assert router.route(group_update) == 0
+    assert router.route(private_message(2, 42)) == 0
+
+    workers = {router.route(private_message(i, 1000 + i % 50)) for i in range(500)}
+    assert workers <= {1, 2, 3} and len(workers) == 3
+    # Every update of a user reaches the same worker
+    assert {router.route(private_message(i, 555)) for i in range(20)} == {router.route(private_message(0, 555))}
+    assert shard_key(private_message(3, 555)) == 555
+
+
+@pytest.mark.asyncio
+async def test_consume_updates_keeps_per_user_order():
+    updates = queue.Queue()
+    taken, done = SimpleNamespace(value=0), SimpleNamespace(value=0)
+    handled = {}
+    running = 0
+    peak = 0
+
+    async def handle(update):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(random.random() / 200)
+        user_id = update["message"]["from"]["id"]
+        handled.setdefault(user_id, []).append(update["update_id"])
+        running -= 1
+
+    for update_id in range(200):
+        updates.put(private_message(update_id, update_id % 10))
+    updates.put(None)
+    await asyncio.wait_for(consume_updates(handle, updates, taken, done, max_concurrent=8), 10)
+
+    assert taken.value == done.value == 200
+    for user_id, update_ids in handled.items():
+        assert update_ids == sorted(update_ids)
+    assert 1 < peak <= 8
+
+
+def _echo_worker(index, updates, taken, done, results):
+    while True:
+        update = updates.get()
+        if update is None:
+            return
+        taken.value += 1
+        if update.get("crash"):
+            os._exit(3)
+        results.put((index, update["update_id"]))
+        done.value += 1
+
+
+@pytest.mark.asyncio
+async def test_pool_restarts_a_crashed_worker_and_keeps_its_queue():
+    results = multiprocessing.get_context("spawn").Queue()
+    pool = WorkerPool(2, _echo_worker, args=(results,), restart_delay=0.1, check_interval=0.05)
+    pool.start()
+    try:
+        await pool.submit(1, {"update_id": 1, "crash": True})
+        await pool.submit(1, {"update_id": 2})
+        await pool.submit(0, {"update_id": 3})
+        loop = asyncio.get_running_loop()
+        received = {await loop.run_in_executor(None, results.get, True, 30) for _ in range(2)}
+        assert received == {(1, 2), (0, 3)}
+        stats = pool.stats()
+        assert stats[1]["restarts"] == 1 and stats[1]["alive"]
+        assert stats[0]["restarts"] == 0
+        assert pool.depth(1) == 0 and pool.in_flight(1) == 0
+
+        metrics = Metrics()
+        metrics.gauge_callback(
+            "worker_restarts_total", "Restarts.", lambda: {(str(s["worker"]),): s["restarts"] for s in pool.stats()},
+            kind="counter", labelnames=["worker"],
+        )
+        assert 'worker_restarts_total{worker="1"} 1' in metrics.render()
+    finally:
+        await pool.close()
+    assert not any(stats["alive"] for stats in pool.stats())
+
+
+@pytest.mark.asyncio
+async def test_shared_submission_store_sees_other_processes(tmp_path):
+    path = tmp_path / "bot.db"
+    moderator = SubmissionStore(path, shared=True)
+    recorder = SubmissionStore(path, shared=True, index=False)
+    try:
+        first = await recorder.create(text_submission(5, "one"), "s", -100)
+        second = await recorder.create(text_submission(5, "two"), "s", -100)
+        assert len(recorder) == 0
+
+        assert (await moderator.fetch(first.id)).submission.text == "one"
+        assert moderator.claim(first.id) is not None
+        # A second click while the first is handled finds nothing
+        assert await moderator.fetch(first.id) is None
+        await moderator.resolve(first, "approved")
+        assert await moderator.fetch(first.id) is None
+
+        await moderator.refresh()
+        assert [pending.id for pending in moderator.select(submitter_id=5)] == [second.id]
+    finally:
+        await moderator.close()
+        await recorder.close()